@@ -5,6 +5,7 @@ from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 
 from core.dependency import AsyncSessionDependency
+from crud.loaders import profile_options
 from models import TypeModel
 
 
@@ -77,7 +78,13 @@ async def get_item_id(
     return response
 
 
-def sync_get_item_id(session, model: TypeModel, item_id: int):
-    stmt = sa.select(model).where(model.id == item_id)
+def sync_get_item_id(
+    session, model: TypeModel, item_id: int, profile: str | None = None
+):
+    stmt = (
+        sa.select(model)
+        .options(*profile_options(profile))
+        .where(model.id == item_id)
+    )
     response = session.scalar(stmt)
     return response
@@ -3,23 +3,67 @@ from fastapi.routing import APIRouter
 
 import models
 from core import dependency
+from core.blob_store import blob_store
 from core.celery_app import products_import
+from crud.imports import ImportJobCrud
+from schemas import schemas
 
 
 import_routers = APIRouter(prefix="/import_product", tags=["ImportProduct"])
 
 
-@import_routers.post("/")
+@import_routers.post("/", response_model=schemas.ImportJobResponse)
 async def import_product(
+    session: dependency.AsyncSessionDependency,
     file: UploadFile,
     user: dependency.GetCurrentUserDependency,
+    deactivate_missing: bool = False,
 ):
-    """Import products from file"""
+    """
+    Import products from file. Products are matched by id from file
+    within shop, deactivate_missing turns off products absent in file.
+    Returns import job, its progress is available by job id
+    """
     if user.status != models.UserStatus.SHOP:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only for shop",
         )
-    contents = await file.read()
-    products_import.delay(contents, user.id)
-    return {"status": "file upload"}
+    user_id = user.id
+    blob = await blob_store.save(file)
+    job = await ImportJobCrud(session).create_item(
+        {
+            "user_id": user_id,
+            "status": models.ImportStatus.PENDING,
+            "file_size": blob.size,
+        }
+    )
+    await session.commit()
+    await session.refresh(job)
+    products_import.delay(job.id, blob.to_dict(), user_id, deactivate_missing)
+    return job
+
+
+@import_routers.get("/{job_id}", response_model=schemas.ImportJobResponse)
+async def get_import_job(
+    session: dependency.AsyncSessionDependency,
+    job_id: int,
+    user: dependency.GetCurrentUserDependency,
+):
+    """Import status, progress counters and row errors"""
+    return await ImportJobCrud(session).check_owner(job_id, user.id)
+
+
+@import_routers.post(
+    "/{job_id}/cancel", response_model=schemas.ImportJobResponse
+)
+async def cancel_import_job(
+    session: dependency.AsyncSessionDependency,
+    job_id: int,
+    user: dependency.GetCurrentUserDependency,
+):
+    """Cancel import, products from loaded chunks stay in catalog"""
+    job = await ImportJobCrud(session).cancel(job_id, user.id)
+    await session.commit()
+    await session.refresh(job)
+    return job
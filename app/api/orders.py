@@ -1,21 +1,26 @@
-import json
+import logging
+from collections import Counter
 
-import sqlalchemy as sa
 from fastapi import Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.routing import APIRouter
+from redis.exceptions import RedisError
 
 import crud.orders as crud
 import models
 from api import utils
 from core import dependency
 from core.celery_app import send_email
-from core.redis_cli import redis_client
+from core.redis_cli import async_redis_client
+from core.suggest import SuggestIndex
+from crud.cart import CartCrud
 from crud.products import ProductCrud
 from crud.users import UserAddressCrud, UserCrud
 from schemas import schemas
 
 
+logger = logging.getLogger(__name__)
+
 order_routers = APIRouter(
     prefix="/order",
     tags=["Order"],
@@ -32,52 +37,84 @@ async def create_orderlist(
 ):
     """Создание корзины"""
     order_product = data.model_dump()
+    user_id = user.id
     product = await ProductCrud(session).get_item_id(
-        order_product["product_id"]
+        order_product["product_id"], "product_shop"
     )
     utils.check_shop_status(product.shop.active)
-    if product.remainder < order_product["quantity"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Product quantity exceeded",
+    utils.check_product_active(product)
+    reservation_crud = crud.ReservationCrud(session)
+    if order_product["quantity"] != 0:
+        await reservation_crud.hold(
+            user_id, product.id, order_product["quantity"]
         )
-    if redis_client.get(user.id):
-        order_list = json.loads(redis_client.get(user.id))
-        prod_ind = None
-        for ind, order in enumerate(order_list):
-            if order["product_id"] == order_product["product_id"]:
-                prod_ind = ind
-                break
-        if prod_ind is not None:
-            if order_product["quantity"] != 0:
-                order_list[prod_ind]["quantity"] += order_product["quantity"]
-            else:
-                order_list.pop(prod_ind)
-        else:
-            order_list.append(order_product)
-
-        if len(order_list) == 0:
-            redis_client.delete(user.id)
-        else:
-            redis_client.set(user.id, json.dumps(order_list))
-        return order_list
-    order_list = [order_product]
-    redis_client.set(user.id, json.dumps(order_list))
-    return order_list
+    else:
+        await reservation_crud.release(user_id, [product.id])
+    await session.commit()
+    return await CartCrud(async_redis_client).add_item(user_id, order_product)
+
+
+@orderlist_routers.put("/", response_model=list[schemas.OrderProductResponse])
+async def update_orderlist(
+    session: dependency.AsyncSessionDependency,
+    data: list[schemas.OrderProduct],
+    user: dependency.GetCurrentUserDependency,
+):
+    """Замена корзины целиком одним запросом"""
+    orderlist = list(
+        {
+            order_product.product_id: order_product.model_dump()
+            for order_product in data
+        }.values()
+    )
+    user_id = user.id
+    products = {
+        product.id: product
+        for product in await ProductCrud(session).get_products_id(
+            [order_product["product_id"] for order_product in orderlist],
+            "product_shop",
+        )
+    }
+    for order_product in orderlist:
+        product = products.get(order_product["product_id"])
+        if product is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found",
+            )
+        utils.check_shop_status(product.shop.active)
+        utils.check_product_active(product)
+    reservation_crud = crud.ReservationCrud(session)
+    await reservation_crud.release(user_id)
+    for order_product in sorted(orderlist, key=lambda x: x["product_id"]):
+        if order_product["quantity"] != 0:
+            await reservation_crud.hold(
+                user_id,
+                order_product["product_id"],
+                order_product["quantity"],
+            )
+    await session.commit()
+    return await CartCrud(async_redis_client).set_items(user_id, orderlist)
 
 
 @orderlist_routers.get("/", response_model=list[schemas.OrderProductResponse])
 async def get_orderlist(user: dependency.GetCurrentUserDependency):
     """Просмотр корзины"""
-    utils.check_orderlist(user.id)
-    orderlist = json.loads(redis_client.get(user.id))
+    orderlist = await CartCrud(async_redis_client).get_items(user.id)
+    utils.check_orderlist(orderlist)
     return orderlist
 
 
 @orderlist_routers.delete("/")
-async def clear_orderlist(user: dependency.GetCurrentUserDependency):
+async def clear_orderlist(
+    session: dependency.AsyncSessionDependency,
+    user: dependency.GetCurrentUserDependency,
+):
     """Очистка корзины"""
-    redis_client.delete(user.id)
+    user_id = user.id
+    await crud.ReservationCrud(session).release(user_id)
+    await session.commit()
+    await CartCrud(async_redis_client).clear(user_id)
     return JSONResponse(
         content="Successfully deleted", status_code=status.HTTP_204_NO_CONTENT
     )
@@ -90,7 +127,10 @@ async def create_order(  # pylint: disable=R0914
     data: schemas.OrderCreate,
 ):
     """Создание заказа"""
-    utils.check_orderlist(user.id)
+    user_id = user.id
+    cart = CartCrud(async_redis_client)
+    products = await cart.get_items(user_id)
+    utils.check_orderlist(products)
     email = await UserCrud(session).get_manager_emails()
     if len(email) == 0:
         raise HTTPException(
@@ -98,22 +138,20 @@ async def create_order(  # pylint: disable=R0914
             detail="Error. Shop do not have a manager",
         )
     address = await UserAddressCrud(session).check_owner(
-        data.address_id, user.id
+        data.address_id, user_id
     )
-    products = json.loads(redis_client.get(user.id))
-    order = await crud.OrderCrud(session).create_item(
+    order_id = await crud.OrderCrud(session).create_order(
         {
-            "user_id": user.id,
+            "user_id": user_id,
             "status": models.OrderStatus.INPROGRES,
             "address_id": address.id,
-        }
+        },
+        products,
     )
-    await session.flush()
-    for product in products:
-        product["order_id"] = order.id
-    await crud.OrderlistCrud(session).create_orderlist(products)
-    await session.commit()
-    await session.refresh(order)
+    order = await crud.OrderCrud(session).get_item_id(
+        order_id, "order_summary"
+    )
+    address = order.address
     order_list = [str(orderlist.product) for orderlist in order.orderlist]
     msg = (
         f"Создан новый заказ номер {order.id}\n"
@@ -128,61 +166,70 @@ async def create_order(  # pylint: disable=R0914
         "subject": "Новый заказ",
     }
     send_email.delay(celery_data)
-    redis_client.delete(user.id)
-    order_dict = {
-        orderlist.product_id: orderlist.quantity
-        for orderlist in order.orderlist
-    }
-    stmt = sa.select(models.Product).where(
-        models.Product.id.in_(set(product_id for product_id in order_dict))
-    )
-    products = await session.scalars(stmt)
-    for product in products.unique().all():
-        quantity = order_dict[product.id]
-        product.remainder -= quantity
-        if product.remainder < 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Product quantity exceeded",
-            )
-    await session.commit()
-    await session.refresh(order)
+    await cart.clear(user_id)
+    popular_products: Counter[str] = Counter()
+    popular_categories: Counter[str] = Counter()
+    for orderlist in order.orderlist:
+        popular_products[orderlist.product.name] += orderlist.quantity
+        for category in orderlist.product.categories:
+            popular_categories[category.title] += orderlist.quantity
+    try:
+        await SuggestIndex(async_redis_client).incr(
+            popular_products, popular_categories
+        )
+    except RedisError:
+        # заказ уже оформлен, популярность пересчитает rebuild индекса
+        logger.exception("Suggest popularity update failed")
     return order
 
 
 @order_routers.get("/", response_model=list[schemas.OrderResponse])
 async def get_orders(
     session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
     user: dependency.GetCurrentUserDependency,
     order_status: models.OrderStatus | None = None,
 ):
     """Просмотр всех заказов для менеджеров"""
     utils.check_user_status(user.status, models.UserStatus.MANAGER)
     if order_status is not None:
-        return crud.OrderCrud(session).get_order_status(order_status)
-    orders = await crud.OrderCrud(session).get_items()
+        orders = await crud.OrderCrud(session).get_order_status(
+            order_status, "order_summary"
+        )
+    else:
+        orders = await crud.OrderCrud(session).get_items("order_summary")
+    cache_tags.update(utils.order_tags(orders))
     return orders
 
 
 @order_routers.get("/{order_id}", response_model=schemas.OrderResponse)
 async def get_orders_by_id(
     session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
     order_id: int,
     user: dependency.GetCurrentUserDependency,
 ):
     """Просмотр определенного заказа"""
     utils.check_user_status(user.status, models.UserStatus.MANAGER)
-    order = await crud.OrderCrud(session).get_item_id(order_id)
+    order = await crud.OrderCrud(session).get_item_id(
+        order_id, "order_summary"
+    )
+    cache_tags.update(utils.order_tags([order]))
     return order
 
 
 @order_routers.get("/me/", response_model=list[schemas.OrderResponse])
 async def get_orders_youself(
     session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
     user: dependency.GetCurrentUserDependency,
 ):
     """Просмотр своих заказов"""
-    return await crud.OrderCrud(session).get_user_items(user.id)
+    orders = await crud.OrderCrud(session).get_user_items(
+        user.id, "order_summary"
+    )
+    cache_tags.update(utils.order_tags(orders))
+    return orders
 
 
 @order_routers.delete("/me/{order_id}")
@@ -229,7 +276,8 @@ async def update_orders_status(
 ):
     """Обновление статуса заказа для менеджеров"""
     utils.check_user_status(user.status, models.UserStatus.MANAGER)
-    order = await crud.OrderCrud(session).get_item_id(order_id)
+    order_crud = crud.OrderCrud(session)
+    order = await order_crud.get_item_id(order_id, "order_summary")
     if order.status == models.OrderStatus.CANCELED:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -237,7 +285,7 @@ async def update_orders_status(
         )
     data = update_data.model_dump()
     data["id"] = order_id
-    order = await crud.OrderCrud(session).create_item(data)
+    order = await order_crud.update_item(data)
     msg = f"Заказ номер {order.id}\n" f"Статус заказа: {order.status.value}\n"
     celery_data = {
         "emails": order.user.email,
@@ -246,5 +294,4 @@ async def update_orders_status(
     }
     send_email.delay(celery_data)
     await session.commit()
-    await session.refresh(order)
-    return order
+    return await order_crud.get_item_id(order_id, "order_summary")
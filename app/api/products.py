@@ -1,4 +1,7 @@
-from fastapi import Depends, status
+from decimal import Decimal
+from typing import Annotated, Literal
+
+from fastapi import Depends, Query, status
 from fastapi.responses import JSONResponse
 from fastapi.routing import APIRouter
 
@@ -6,9 +9,13 @@ import crud.products as crud
 import models
 from api import utils
 from core import dependency
+from core.redis_cli import async_redis_client
+from core.suggest import SuggestIndex
 from schemas import schemas
 
 
+ProductSort = Literal["id", "-id", "price", "-price", "name", "-name"]
+
 product_routers = APIRouter(prefix="/product", tags=["Product"])
 category_routers = APIRouter(prefix="/category", tags=["Category"])
 parametr_routers = APIRouter(
@@ -18,18 +25,146 @@ parametr_routers = APIRouter(
 )
 
 
-@product_routers.get("/", response_model=list[schemas.ProductsResponse])
-async def get_products(session: dependency.AsyncSessionDependency):
-    """Просмотр списка всех товаров"""
-    return await crud.ProductCrud(session).get_items()
+@product_routers.get("/", response_model=schemas.ProductPage)
+async def get_products(  # pylint: disable=R0913,R0917
+    session: dependency.AsyncReadSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    sort: ProductSort = "id",
+    shop_id: int | None = None,
+    category_id: int | None = None,
+    price_min: Annotated[Decimal | None, Query(ge=0)] = None,
+    price_max: Annotated[Decimal | None, Query(ge=0)] = None,
+    in_stock: bool = False,
+):
+    """
+    Просмотр списка товаров постранично. Следующая страница
+    запрашивается с cursor из ответа, при тех же фильтрах и сортировке
+    """
+    products, next_key = await crud.ProductCrud(session).get_page(
+        limit,
+        sort,
+        utils.decode_cursor(cursor, sort) if cursor else None,
+        shop_id=shop_id,
+        category_id=category_id,
+        price_min=price_min,
+        price_max=price_max,
+        in_stock=in_stock,
+    )
+    cache_tags.update(utils.product_tags(products))
+    return {
+        "items": products,
+        "next_cursor": (
+            utils.encode_cursor(sort, next_key) if next_key else None
+        ),
+    }
+
+
+@product_routers.get("/filter", response_model=schemas.FacetedProductPage)
+async def filter_products(  # pylint: disable=R0913,R0914,R0917
+    session: dependency.AsyncReadSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+    param: Annotated[list[str] | None, Query()] = None,
+    ranges: Annotated[list[str] | None, Query(alias="range")] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    sort: ProductSort = "id",
+    shop_id: int | None = None,
+    category_id: int | None = None,
+    price_min: Annotated[Decimal | None, Query(ge=0)] = None,
+    price_max: Annotated[Decimal | None, Query(ge=0)] = None,
+    in_stock: bool = False,
+    facet_limit: Annotated[int, Query(ge=1, le=100)] = 10,
+):
+    """
+    Фильтрация товаров по параметрам: param=<id параметра>:<значение>,
+    range=<id параметра>:<от>:<до> для числовых значений. Первая
+    страница возвращает фасеты - значения параметров с числом товаров
+    """
+    filters = {
+        "shop_id": shop_id,
+        "category_id": category_id,
+        "price_min": price_min,
+        "price_max": price_max,
+        "in_stock": in_stock,
+        "parametrs": utils.parse_parametr_filters(param or []),
+        "ranges": utils.parse_range_filters(ranges or []),
+    }
+    product_crud = crud.ProductCrud(session)
+    products, next_key = await product_crud.get_page(
+        limit,
+        sort,
+        utils.decode_cursor(cursor, sort) if cursor else None,
+        **filters,
+    )
+    cache_tags.update(utils.product_tags(products) | {"parametr"})
+    return {
+        "items": products,
+        "next_cursor": (
+            utils.encode_cursor(sort, next_key) if next_key else None
+        ),
+        "facets": (
+            None
+            if cursor
+            else await product_crud.get_facets(facet_limit, **filters)
+        ),
+    }
+
+
+@product_routers.get("/suggest", response_model=list[schemas.Suggestion])
+async def suggest_products(
+    prefix: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=20)] = 10,
+):
+    """
+    Подсказки при вводе: самые заказываемые товары и категории, в
+    названии которых есть слово, начинающееся с prefix
+    """
+    return [
+        {"kind": kind, "text": text, "popularity": popularity}
+        for kind, text, popularity in await SuggestIndex(
+            async_redis_client
+        ).suggest(prefix, limit)
+    ]
+
+
+@product_routers.get("/search", response_model=schemas.ProductPage)
+async def search_products(
+    session: dependency.AsyncReadSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+    q: Annotated[str, Query(min_length=2, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+):
+    """
+    Поиск товаров по названию, категориям и значениям параметров,
+    с учетом опечаток в названии. Результаты по убыванию релевантности
+    """
+    products, next_key = await crud.ProductCrud(session).search(
+        q, limit, utils.decode_cursor(cursor, "search") if cursor else None
+    )
+    cache_tags.update(utils.product_tags(products))
+    return {
+        "items": products,
+        "next_cursor": (
+            utils.encode_cursor("search", next_key) if next_key else None
+        ),
+    }
 
 
 @product_routers.get("/{product_id}", response_model=schemas.ProductsResponse)
 async def get_products_by_id(
-    session: dependency.AsyncSessionDependency, product_id: int
+    session: dependency.AsyncReadSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+    product_id: int,
 ):
     """Просмотр определенного продукта"""
-    return await crud.ProductCrud(session).get_item_id(product_id)
+    product = await crud.ProductCrud(session).get_item_id(
+        product_id, "product_card"
+    )
+    cache_tags.update(utils.product_tags([product]))
+    return product
 
 
 @product_routers.post("/", response_model=schemas.ProductsResponse)
@@ -46,9 +181,11 @@ async def create_products(
     utils.check_shop_status(user.shop.active)  # type: ignore[union-attr]
     categories = product_data.pop("categories")
     parametrs = product_data.pop("parametrs")
-    product = await crud.ProductCrud(session).create_item(product_data)
-    await session.flush()
+    product_crud = crud.ProductCrud(session)
+    product = await product_crud.create_item(product_data)
+    product_id = product.id
     if len(categories) >= 1:
+        await session.refresh(product, ["categories"])
         product.categories = await crud.CategoryCrud(session).get_category(
             categories
         )
@@ -60,8 +197,7 @@ async def create_products(
             parametrs
         )
     await session.commit()
-    await session.refresh(product)
-    return product
+    return await product_crud.get_item_id(product_id, "product_card")
 
 
 @product_routers.delete("/{product_id}")
@@ -72,9 +208,10 @@ async def delete_products(
 ):
     """Удаление товара"""
     product_crud = crud.ProductCrud(session)
-    product = await product_crud.get_item_id(product_id)
+    product = await product_crud.get_item_id(product_id, "product_shop")
     utils.check_owner_product(user.id, product)
     await product_crud.delete_item(product_id)
+    await session.commit()
     return JSONResponse(
         content="Successfully deleted", status_code=status.HTTP_204_NO_CONTENT
     )
@@ -97,7 +234,7 @@ async def update_product(
     """
     update_data = data.model_dump(exclude_unset=True)
     product_crud = crud.ProductCrud(session)
-    product = await product_crud.get_item_id(product_id)
+    product = await product_crud.get_item_id(product_id, "product_card")
     utils.check_owner_product(user.id, product)
     if update_data.get("categories") is not None:
         categories = update_data.pop("categories")
@@ -108,8 +245,7 @@ async def update_product(
         update_data["id"] = product_id
         await product_crud.update_item(update_data)
     await session.commit()
-    await session.refresh(product)
-    return product
+    return await product_crud.get_item_id(product_id, "product_card")
 
 
 @product_routers.patch(
@@ -125,7 +261,8 @@ async def update_or_create_product_parametrs(
     Обновление параметров для продуктов и/или добавление новых параметров
     """
     parametrs = data.model_dump()["parametrs"]
-    product = await crud.ProductCrud(session).get_item_id(product_id)
+    product_crud = crud.ProductCrud(session)
+    product = await product_crud.get_item_id(product_id, "product_card")
     utils.check_owner_product(user.id, product)
     parametrs_id_request = set(
         parametr["parametr_id"] for parametr in parametrs
@@ -158,8 +295,7 @@ async def update_or_create_product_parametrs(
                 parametr, product.id
             )
     await session.commit()
-    await session.refresh(product)
-    return product
+    return await product_crud.get_item_id(product_id, "product_card")
 
 
 @product_routers.delete(
@@ -173,13 +309,13 @@ async def delete_parametrs_product(
 ):
     """Удаление параметров у товара"""
     parametrs = data.parametrs
-    product = await crud.ProductCrud(session).get_item_id(product_id)
+    product_crud = crud.ProductCrud(session)
+    product = await product_crud.get_item_id(product_id, "product_shop")
     utils.check_owner_product(user.id, product)
     for parametr in parametrs:
         await crud.ParametrProductCrud(session).delete_item(parametr)
     await session.commit()
-    await session.refresh(product)
-    return product
+    return await product_crud.get_item_id(product_id, "product_card")
 
 
 @category_routers.post("/", response_model=schemas.CategoryCreateResponse)
@@ -199,8 +335,12 @@ async def create_category(
 
 
 @category_routers.get("/", response_model=list[schemas.CategoryCreateResponse])
-async def get_categories(session: dependency.AsyncSessionDependency):
+async def get_categories(
+    session: dependency.AsyncReadSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+):
     """Просмотр всех категорий"""
+    cache_tags.add("category")
     return await crud.CategoryCrud(session).get_items()
 
 
@@ -225,6 +365,10 @@ async def create_parametr(
     response_model=list[schemas.ParametrResponse],
     dependencies=[Depends(dependency.get_current_user)],
 )
-async def get_parametrs(session: dependency.AsyncSessionDependency):
+async def get_parametrs(
+    session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+):
     """Просмотр всех параметров"""
+    cache_tags.add("parametr")
     return await crud.ParametrCrud(session).get_items()
@@ -5,7 +5,14 @@ from fastapi.routing import APIRouter
 import crud.shops as crud
 import models
 from api import utils
-from core.dependency import AsyncSessionDependency, GetCurrentUserDependency
+from core.dependency import (
+    AsyncReadSessionDependency,
+    AsyncSessionDependency,
+    CacheTagsDependency,
+    GetCurrentUserDependency,
+)
+from core.principals import principal_cache
+from core.redis_cache import entity_tags
 from schemas import schemas
 
 
@@ -24,29 +31,48 @@ async def create_shop(
     shop_data["user_id"] = user.id
     shop = await crud.ShopCrud(session).create_or_update(shop_data, "create")
     await session.commit()
+    await principal_cache.invalidate(user.email)
     await session.refresh(shop)
     return shop
 
 
 @shop_routers.get("/", response_model=list[schemas.ShopsResponse])
-async def get_shops(session: AsyncSessionDependency):
+async def get_shops(
+    session: AsyncReadSessionDependency, cache_tags: CacheTagsDependency
+):
     """Просмотр списка активных магазинов"""
-    return await crud.ShopCrud(session).get_shop_active(True)
+    shops = await crud.ShopCrud(session).get_shop_active(True, "shop_card")
+    cache_tags.update(
+        {"shop"} | entity_tags("shop", (shop.id for shop in shops))
+    )
+    return shops
 
 
 @shop_routers.get("/{shop_id}", response_model=schemas.ShopResponse)
-async def get_shop_by_id(session: AsyncSessionDependency, shop_id: int):
+async def get_shop_by_id(
+    session: AsyncReadSessionDependency,
+    cache_tags: CacheTagsDependency,
+    shop_id: int,
+):
     """Просмотр определенного магазина по id со списком продуктов"""
-    return await crud.ShopCrud(session).get_item_id(shop_id)
+    shop = await crud.ShopCrud(session).get_item_id(shop_id, "shop_detail")
+    cache_tags.update({f"shop:{shop.id}"} | utils.product_tags(shop.products))
+    return shop
 
 
 @shop_routers.get("/me/", response_model=schemas.ShopResponse)
 async def get_shop_my(
+    session: AsyncSessionDependency,
+    cache_tags: CacheTagsDependency,
     user: GetCurrentUserDependency,
 ):
     """Просмотр своего магазина"""
     utils.check_shop_exists(user)
-    return user.shop
+    shop = await crud.ShopCrud(session).get_item_id(
+        user.shop.id, "shop_detail"  # type: ignore[union-attr]
+    )
+    cache_tags.update({f"shop:{shop.id}"} | utils.product_tags(shop.products))
+    return shop
 
 
 @shop_routers.patch("/me/", response_model=schemas.ShopsResponse)
@@ -58,11 +84,13 @@ async def update_shop(
     """Обновление информации о своем магазине"""
     update_data = data.model_dump(exclude_unset=True)
     utils.check_shop_exists(user)
-    update_data["id"] = user.shop.id  # type: ignore[union-attr]
-    shop = await crud.ShopCrud(session).create_or_update(update_data, "update")
+    shop_id = user.shop.id  # type: ignore[union-attr]
+    update_data["id"] = shop_id
+    shop_crud = crud.ShopCrud(session)
+    await shop_crud.create_or_update(update_data, "update")
     await session.commit()
-    await session.refresh(shop)
-    return shop
+    await principal_cache.invalidate(user.email)
+    return await shop_crud.get_item_id(shop_id, "shop_card")
 
 
 @shop_routers.delete("/me/")
@@ -75,6 +103,8 @@ async def delete_shop(
     await crud.ShopCrud(session).delete_item(
         user.shop.id  # type: ignore[union-attr]
     )
+    await session.commit()
+    await principal_cache.invalidate(user.email)
     return JSONResponse(
         content="Successfully deleted", status_code=status.HTTP_204_NO_CONTENT
     )
@@ -0,0 +1,16 @@
+from fastapi.routing import APIRouter
+
+import models
+from api import utils
+from core.dependency import GetCurrentUserDependency
+from core.redis_cache import cache_backend
+
+
+stats_routers = APIRouter(prefix="/stats", tags=["Stats"])
+
+
+@stats_routers.get("/cache/")
+async def get_cache_stats(user: GetCurrentUserDependency):
+    """Попадания, промахи и вытеснения локального кэша и Redis воркера"""
+    utils.check_user_status(user.status, models.UserStatus.MANAGER)
+    return await cache_backend.cache_stats()
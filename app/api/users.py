@@ -1,4 +1,3 @@
-from datetime import timedelta
 from uuid import uuid4
 
 from fastapi import Depends, HTTPException, status
@@ -7,10 +6,14 @@ from fastapi.routing import APIRouter
 
 import crud.users as crud
 import models
+from api import utils
 from core import dependency, security
 from core.celery_app import send_email
+from core.principals import principal_cache
 from core.redis_cli import redis_client
+from core.redis_keys import VERIFY
 from core.settings import config
+from core.tokens import refresh_tokens, token_verifier
 from schemas import schemas
 from tests.factory import faker
 
@@ -26,9 +29,11 @@ async def create_user(
     session: dependency.AsyncSessionDependency, user_data: schemas.UserCreate
 ):
     """Регистрация пользователей"""
-    verify_path = str(uuid4())
-    redis_client.set(verify_path, user_data.email)
-    user_data.password = security.hash_password(user_data.password)
+    verify_path = uuid4().hex
+    redis_client.set(VERIFY.key(verify_path), user_data.email, ex=VERIFY.ttl)
+    user_data.password = await security.password_hasher.hash(
+        user_data.password
+    )
     user = await crud.UserCrud(session).create_or_update(
         user_data.model_dump(), "create"
     )
@@ -53,13 +58,31 @@ async def login(
 ):
     """Вход пользователя в личный кабинет"""
     user = await security.auth(session, data.email, data.password)
-    access_token_expires = timedelta(
-        minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES
+    return utils.issue_tokens(
+        user.email, await refresh_tokens.create(user.email)
     )
-    access_token = security.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+
+
+@user_routers.post("/refresh/", response_model=schemas.Token)
+async def refresh(data: schemas.RefreshToken):
+    """Новая пара токенов по refresh токену, без пароля"""
+    refresh_token, email = await refresh_tokens.rotate(data.refresh_token)
+    return utils.issue_tokens(email, refresh_token)
+
+
+@user_routers.post("/logout/")
+async def logout(
+    token: dependency.BearerTokenDependency,
+    _: dependency.GetCurrentUserDependency,
+    data: schemas.RefreshToken | None = None,
+):
+    """Выход: токены перестают действовать сразу"""
+    await token_verifier.revoke(token.credentials)
+    if data is not None:
+        await refresh_tokens.revoke(data.refresh_token)
+    return JSONResponse(
+        content="Successfully logout", status_code=status.HTTP_200_OK
     )
-    return schemas.Token(access_token=access_token)
 
 
 @user_routers.get(
@@ -68,18 +91,26 @@ async def login(
     dependencies=[Depends(dependency.get_current_user)],
 )
 async def get_user_by_id(
-    session: dependency.AsyncSessionDependency, user_id: int
+    session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+    user_id: int,
 ):
     """Запрос информации о пользователе через id"""
-    return await crud.UserCrud(session).get_item_id(user_id)
+    user = await crud.UserCrud(session).get_item_id(user_id)
+    cache_tags.add(f"users:{user.id}")
+    return user
 
 
 @user_routers.get("/me/", response_model=schemas.UserResponse)
 async def get_users_me(
+    session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
     current_user: dependency.GetCurrentUserDependency,
 ):
     """Вывод информации о самом себе"""
-    return current_user
+    user_id = current_user.id
+    cache_tags.update({f"users:{user_id}", "shop", "useraddress"})
+    return await crud.UserCrud(session).get_item_id(user_id, "user_detail")
 
 
 @user_routers.get(
@@ -87,9 +118,15 @@ async def get_users_me(
     response_model=list[schemas.UserResponse],
     dependencies=[Depends(dependency.get_current_user)],
 )
-async def get_buyers(session: dependency.AsyncSessionDependency):
+async def get_buyers(
+    session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
+):
     """Запрос всех зарегестрированных пользователей-покупателей"""
-    return await crud.UserCrud(session).get_user_buyer(models.UserStatus.BUYER)
+    cache_tags.update({"users", "shop", "useraddress"})
+    return await crud.UserCrud(session).get_user_buyer(
+        models.UserStatus.BUYER, "user_detail"
+    )
 
 
 @user_routers.patch("/me/", response_model=schemas.UserResponse)
@@ -108,10 +145,12 @@ async def update_user(
                 detail="You have a shop",
             )
     update_data["id"] = current_user.id
-    user = await crud.UserCrud(session).create_or_update(update_data, "update")
+    user_crud = crud.UserCrud(session)
+    user = await user_crud.create_or_update(update_data, "update")
+    user_id = user.id
     await session.commit()
-    await session.refresh(user)
-    return user
+    await principal_cache.invalidate(current_user.email)
+    return await user_crud.get_item_id(user_id, "user_detail")
 
 
 @user_routers.delete("/me/")
@@ -121,6 +160,9 @@ async def delete_user(
 ):
     """Удаление пользовательского аккаунта"""
     await crud.UserCrud(session).delete_item(current_user.id)
+    await session.commit()
+    await principal_cache.invalidate(current_user.email)
+    await token_verifier.revoke_subject(current_user.email)
     return JSONResponse(
         content="Successfully deleted", status_code=status.HTTP_204_NO_CONTENT
     )
@@ -146,9 +188,11 @@ async def create_user_address(
 )
 async def get_user_address(
     session: dependency.AsyncSessionDependency,
+    cache_tags: dependency.CacheTagsDependency,
     current_user: dependency.GetCurrentUserDependency,
 ):
     """Просмотр всех своих адресов доставки"""
+    cache_tags.add("useraddress")
     return await crud.UserAddressCrud(session).get_user_items(current_user.id)
 
 
@@ -194,16 +238,19 @@ async def update_user_password(
 ):
     """Обновление пароля"""
     update_data = data.model_dump()
-    if not security.check_password(
-        update_data["old_password"],
-        current_user.password,  # type: ignore[attr-defined]
+    user = await crud.UserCrud(session).get_item_id(current_user.id)
+    if not await security.password_hasher.verify(
+        update_data["old_password"], user.password
     ):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Incorrect password")
     update_data.pop("old_password")
     update_data["id"] = current_user.id
-    update_data["password"] = security.hash_password(update_data["password"])
+    update_data["password"] = await security.password_hasher.hash(
+        update_data["password"]
+    )
     await crud.UserCrud(session).update_item(update_data)
     await session.commit()
+    await token_verifier.revoke_subject(current_user.email)
     return JSONResponse(
         content="Password successfully update", status_code=status.HTTP_200_OK
     )
@@ -219,7 +266,7 @@ async def reser_password(
     user = await crud.UserCrud(session).get_user(update_data["email"])
     update_data["id"] = user.id
     new_password = faker.password()
-    update_data["password"] = security.hash_password(new_password)
+    update_data["password"] = await security.password_hasher.hash(new_password)
     user = await crud.UserCrud(session).update_item(update_data)
     msg = (
         f"Новый пароль для пользователя {user.email}: "
@@ -231,6 +278,7 @@ async def reser_password(
         "subject": "Новый пароль",
     }
     await session.commit()
+    await token_verifier.revoke_subject(celery_data["emails"])
     send_email.delay(celery_data)
     return JSONResponse(content="Send email", status_code=status.HTTP_200_OK)
 
@@ -241,16 +289,19 @@ async def verify_email(
     session: dependency.AsyncSessionDependency,
 ):
     """Подтверждение почты"""
-    if not redis_client.get(verify_path):
+    # в старых письмах uuid с дефисами
+    key = VERIFY.key(verify_path.replace("-", ""))
+    email = redis_client.get(key)
+    if not email:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="URL not found",
         )
-    email = redis_client.get(verify_path)
     user = await crud.UserCrud(session).get_user(email.decode())
     user.active = True
     await session.commit()
-    redis_client.delete(verify_path)
+    await principal_cache.invalidate(email.decode())
+    redis_client.delete(key)
     return JSONResponse(
         content="Successfully verify", status_code=status.HTTP_200_OK
     )
@@ -1,7 +1,16 @@
+import base64
+import binascii
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Iterable
+
 from fastapi import HTTPException, status
 
 import models
-from core.redis_cli import redis_client
+from core.redis_cache import entity_tags
+from core.security import create_access_token
+from core.settings import config
 from schemas import schemas
 
 
@@ -13,6 +22,15 @@ def check_owner_product(user_id: int, product: models.Product) -> None:
         )
 
 
+def check_product_active(product: models.Product) -> None:
+    """To check product is still in shop price list"""
+    if not product.active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Product is not available",
+        )
+
+
 def check_shop_status(shop_status: bool) -> None:
     """To check status of shop"""
     if shop_status is False:
@@ -33,16 +51,106 @@ def check_user_status(
         )
 
 
-def check_shop_exists(user: schemas.UserResponse) -> None:
+def check_shop_exists(user: schemas.Principal) -> None:
     if user.shop is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Shop is not exists"
         )
 
 
-def check_orderlist(user_id: int) -> None:
-    if not redis_client.get(user_id):
+def check_orderlist(orderlist: list) -> None:
+    if not orderlist:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Shopping cart is empty",
         )
+
+
+def encode_cursor(sort: str, values: list[Any]) -> str:
+    """Opaque cursor for keyset pagination"""
+    data = json.dumps([sort, values], default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> list[Any]:
+    """Cursor values, cursor must be made for the same sort"""
+    try:
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError, binascii.Error) as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        ) from error
+    if cursor_sort != sort or not isinstance(values, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return values
+
+
+def parse_parametr_filters(filters: list[str]) -> dict[int, list[str]]:
+    """Filters "parametr_id:value", values of one parametr are joined by OR"""
+    parametrs: dict[int, list[str]] = {}
+    for item in filters:
+        parametr_id, _, value = item.partition(":")
+        if not parametr_id.isdigit() or not value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid parametr filter {item}",
+            )
+        parametrs.setdefault(int(parametr_id), []).append(value)
+    return parametrs
+
+
+def parse_range_filters(
+    filters: list[str],
+) -> dict[int, tuple[Decimal | None, Decimal | None]]:
+    """Filters "parametr_id:min:max", one of the bounds may be empty"""
+    ranges = {}
+    for item in filters:
+        try:
+            parametr_id, low, high = item.split(":")
+            ranges[int(parametr_id)] = (
+                Decimal(low) if low else None,
+                Decimal(high) if high else None,
+            )
+        except (ValueError, InvalidOperation) as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid range filter {item}",
+            ) from error
+    return ranges
+
+
+def product_tags(products: Iterable[models.Product]) -> set[str]:
+    """Cache tags of product cards: the products, shops and categories"""
+    tags = {"product"}
+    for product in products:
+        tags |= {f"product:{product.id}", f"shop:{product.shop_id}"}
+        tags |= entity_tags(
+            "category", (category.id for category in product.categories)
+        )
+    return tags
+
+
+def order_tags(orders: Iterable[models.Order]) -> set[str]:
+    """Cache tags of orders with their product cards"""
+    tags = {"orders"}
+    for order in orders:
+        tags.add(f"orders:{order.id}")
+        tags |= product_tags(
+            orderlist.product for orderlist in order.orderlist
+        )
+    return tags
+
+
+def issue_tokens(email: str, refresh_token: str) -> schemas.Token:
+    """Новый access токен вместе с refresh токеном"""
+    access_token = create_access_token(
+        data={"sub": email},
+        expires_delta=timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    return schemas.Token(
+        access_token=access_token, refresh_token=refresh_token
+    )
@@ -1,21 +1,21 @@
+from typing import Any
+
 from fastapi import HTTPException, status
 from sqladmin import ModelView
 from sqladmin.authentication import AuthenticationBackend
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from starlette.requests import Request
 
 import models
 from core import security
-from core.settings import config
+from core.database import database
+from core.redis_cache import cache_backend, entity_tags
 
 
 class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         form = await request.form()
         email, password = form["username"], form["password"]
-        async with AsyncSession(
-            create_async_engine(config.async_dsn)  # type: ignore[arg-type]
-        ) as session:
+        async with database.session_maker() as session:
             user = await security.auth(
                 session, email, password  # type: ignore[arg-type]
             )
@@ -88,3 +88,12 @@ class OrderAdmin(ModelView, model=models.Order):
     column_list = "__all__"
     can_create = False
     can_delete = False
+
+    async def after_model_change(
+        self, data: dict, model: Any, is_created: bool, request: Request
+    ) -> None:
+        """Смена статуса заказа сбрасывает закэшированные ответы с ним"""
+        table = model.__tablename__
+        await cache_backend.invalidate(
+            {table} | entity_tags(table, [model.id])
+        )
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import IO, Iterator
+
+import anyio
+from fastapi import HTTPException, UploadFile, status
+
+from core.settings import config
+
+
+@dataclass
+class StoredBlob:
+    key: str
+    size: int
+    sha256: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class BlobStore(ABC):
+    """
+    Хранилище загруженных файлов. В очередь передается только ссылка
+    на файл, воркер читает его отсюда потоком
+    """
+
+    @abstractmethod
+    async def save(self, upload: UploadFile) -> StoredBlob:
+        """Сохранение загрузки потоком"""
+
+    @abstractmethod
+    def open(self, blob: StoredBlob) -> AbstractContextManager[IO[bytes]]:
+        """Файл для чтения, проверенный по sha256"""
+
+    @abstractmethod
+    def delete(self, blob: StoredBlob) -> None:
+        """Удаление файла после импорта"""
+
+
+class FileBlobStore(BlobStore):
+    """
+    Файлы в локальном каталоге, общем для API и воркера. Загрузка
+    пишется частями по IMPORT_UPLOAD_CHUNK_SIZE, размер ограничен
+    IMPORT_MAX_UPLOAD_SIZE, по ходу записи считается sha256
+    """
+
+    def __init__(self, root: str, chunk_size: int, max_size: int):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+
+    def path(self, key: str) -> Path:
+        path = self.root / key
+        if path.parent != self.root:
+            raise ValueError(f"Invalid blob key {key}")
+        return path
+
+    async def save(self, upload: UploadFile) -> StoredBlob:
+        self.root.mkdir(parents=True, exist_ok=True)
+        key = f"{uuid.uuid4().hex}.yaml"
+        path = self.path(key)
+        partial = path.with_suffix(".part")
+        checksum = hashlib.sha256()
+        size = 0
+        try:
+            async with await anyio.open_file(partial, "wb") as file:
+                while chunk := await upload.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise HTTPException(
+                            status_code=(
+                                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                            ),
+                            detail="File is too large",
+                        )
+                    checksum.update(chunk)
+                    await file.write(chunk)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, path)
+        return StoredBlob(key=key, size=size, sha256=checksum.hexdigest())
+
+    @contextmanager
+    def open(self, blob: StoredBlob) -> Iterator[IO[bytes]]:
+        path = self.path(blob.key)
+        checksum = hashlib.sha256()
+        with path.open("rb") as file:
+            while chunk := file.read(self.chunk_size):
+                checksum.update(chunk)
+            if checksum.hexdigest() != blob.sha256:
+                raise ValueError(f"Checksum mismatch for blob {blob.key}")
+            file.seek(0)
+            yield file
+
+    def delete(self, blob: StoredBlob) -> None:
+        self.path(blob.key).unlink(missing_ok=True)
+
+
+blob_store = FileBlobStore(
+    config.IMPORT_SPOOL_DIR,
+    config.IMPORT_UPLOAD_CHUNK_SIZE,
+    config.IMPORT_MAX_UPLOAD_SIZE,
+)
@@ -0,0 +1,94 @@
+import zlib
+
+from core.settings import config
+
+
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость
+    zstandard = None
+
+
+class Codec:
+    """Кодирование тела ответа в кэше, name хранится рядом с телом"""
+
+    name = "identity"
+
+    def encode(self, data: bytes) -> bytes:
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+    """Поток zlib - это и HTTP Content-Encoding: deflate"""
+
+    name = "zlib"
+
+    def __init__(self, level: int = config.CACHE_COMPRESS_LEVEL):
+        self.level = level
+
+    def encode(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decode(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+
+    def __init__(self, level: int = config.CACHE_COMPRESS_LEVEL):
+        if zstandard is None:
+            raise RuntimeError("zstd codec requires the zstandard package")
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def decode(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data)
+
+
+CODECS: dict[str, type[Codec]] = {
+    Codec.name: Codec,
+    ZlibCodec.name: ZlibCodec,
+    ZstdCodec.name: ZstdCodec,
+}
+
+
+class CacheEncoder:
+    """
+    Сжатие тел ответов не меньше min_size байт выбранным кодеком,
+    мелкие тела хранятся как есть: сжатие почти не уменьшает их.
+    Декодирует любой известный кодек, поэтому кодек можно сменить без
+    сброса кэша
+    """
+
+    def __init__(
+        self,
+        codec: Codec | None = None,
+        min_size: int = config.CACHE_COMPRESS_MIN_SIZE,
+    ):
+        self.codec = codec or CODECS[config.CACHE_CODEC]()
+        self.min_size = min_size
+        self.decoders: dict[str, Codec] = {
+            Codec.name: Codec(),
+            self.codec.name: self.codec,
+        }
+
+    def encode(self, data: bytes) -> tuple[str, bytes]:
+        if len(data) < self.min_size:
+            return Codec.name, data
+        encoded = self.codec.encode(data)
+        if len(encoded) >= len(data):
+            return Codec.name, data
+        return self.codec.name, encoded
+
+    def decode(self, encoding: str, data: bytes) -> bytes:
+        decoder = self.decoders.get(encoding)
+        if decoder is None:
+            decoder = self.decoders[encoding] = CODECS[encoding]()
+        return decoder.decode(data)
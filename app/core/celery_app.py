@@ -3,23 +3,44 @@ import ssl
 from email.message import EmailMessage
 
 import sqlalchemy as sa
-import yaml
 from celery import Celery
-from fastapi import HTTPException, status
+from celery.utils.log import get_task_logger
 from sqlalchemy.orm import Session
 
 import models
 from api import crud
+from core.blob_store import StoredBlob, blob_store
+from core.principals import PrincipalCache
+from core.product_import import (
+    ImportCanceled,
+    ImportTracker,
+    PriceListReader,
+    ProductImporter,
+)
+from core.redis_cache import RedisBackend, entity_tags
+from core.redis_cli import redis_cache_client, redis_client
 from core.settings import config
+from core.suggest import SuggestIndex, suggest_entries
 
 
 engine = sa.create_engine(config.dsn)  # type: ignore[call-overload]
+logger = get_task_logger(__name__)
 
 celery_app = Celery(
     broker_url=config.celery_url,
     broker_connection_retry_on_startup=True,
     include=["core.celery_app"],
 )
+celery_app.conf.beat_schedule = {
+    "release-expired-reservations": {
+        "task": "core.celery_app.release_expired_reservations",
+        "schedule": config.RESERVATION_SWEEP_INTERVAL,
+    },
+    "rebuild-suggest-index": {
+        "task": "core.celery_app.rebuild_suggest_index",
+        "schedule": config.SUGGEST_REBUILD_INTERVAL,
+    },
+}
 
 
 @celery_app.task
@@ -37,67 +58,174 @@ def send_email(data: dict):
 
 
 @celery_app.task
-def products_import(contents: bytes, user_id: int):  # pylint: disable=R0914
-    with Session(bind=engine) as session:
-        try:
-            data = yaml.safe_load(contents)
-            user = crud.sync_get_item_id(session, models.User, user_id)
-            if not user.shop:
+def products_import(  # pylint: disable=R0914
+    job_id: int,
+    blob_data: dict,
+    user_id: int,
+    deactivate_missing: bool = False,
+):
+    """
+    Загрузка прайса из файла, сохраненного в blob_store. Результат и
+    прогресс пишутся в ImportJob, отмена проверяется между пачками
+    """
+    blob = StoredBlob(**blob_data)
+    tracker = ImportTracker(engine, job_id, config.IMPORT_PROGRESS_INTERVAL)
+    if tracker.flush(
+        status=models.ImportStatus.RUNNING, started_at=sa.func.now()
+    ):
+        blob_store.delete(blob)
+        tracker.flush(
+            status=models.ImportStatus.CANCELED, finished_at=sa.func.now()
+        )
+        return
+    importer = None
+    try:
+        with Session(bind=engine) as session, blob_store.open(blob) as file:
+            reader = PriceListReader(file)
+            user = crud.sync_get_item_id(
+                session, models.User, user_id, "auth_principal"
+            )
+            email, created = user.email, not user.shop
+            if created:
                 shop = crud.sync_create_item(
                     session,
-                    {"title": data["shop"], "user_id": user.id},
+                    {"title": reader.header["shop"], "user_id": user.id},
                     models.Shop,
                 )
                 shop.active = True
                 session.flush()
                 user.shop = shop
             shop_id = user.shop.id  # type: ignore[union-attr]
-            for product in data["goods"]:
-                parameters = product.pop("parameters")
-                categories = product.pop("category")
-                product["shop_id"] = shop_id
-                product_db = crud.sync_create_item(
-                    session, product, models.Product
-                )
-                session.flush()
-                for parametr, value in parameters.items():
-                    parametr_db = session.scalar(
-                        sa.select(models.Parametr).where(
-                            models.Parametr.name == parametr
-                        )
-                    )
-                    if not parametr_db:
-                        parametr_db = crud.sync_create_item(
-                            session, {"name": parametr}, models.Parametr
-                        )
-                        session.flush()
-                    crud.sync_create_item(
-                        session,
-                        {
-                            "product_id": product_db.id,
-                            # pylint: disable=C0301
-                            "parametr_id": parametr_db.id,  # type: ignore[union-attr]
-                            "value": value,
-                        },
-                        models.ParametrProduct,
-                    )
-                session.commit()
-                session.refresh(product_db)
+            session.commit()
+            if created:
+                PrincipalCache(redis_client).invalidate(email)
+            importer = ProductImporter(
+                session,
+                shop_id,
+                config.IMPORT_CHUNK_SIZE,
+                deactivate_missing,
+                config.IMPORT_MAX_ERRORS,
+                tracker,
+                SuggestIndex(redis_client),
+                RedisBackend(redis_cache_client),
+            )
+            stats = importer.run(reader.goods())
+    except ImportCanceled:
+        logger.info("Import job %s canceled", job_id)
+        tracker.flush(
+            importer.stats if importer else None,
+            status=models.ImportStatus.CANCELED,
+            finished_at=sa.func.now(),
+        )
+        return
+    except Exception as exc:  # pylint: disable=W0718
+        logger.exception("Import job %s failed", job_id)
+        tracker.flush(
+            importer.stats if importer else None,
+            status=models.ImportStatus.FAILED,
+            error=f"{type(exc).__name__}: {exc}"[:1000],
+            finished_at=sa.func.now(),
+        )
+        return
+    finally:
+        blob_store.delete(blob)
+    tracker.flush(
+        stats, status=models.ImportStatus.DONE, finished_at=sa.func.now()
+    )
+    logger.info(
+        "Import job %s: %s products in %.2f s (%.0f rows/s), inserted %s, "
+        "updated %s, unchanged %s, deactivated %s, failed %s",
+        job_id,
+        stats.rows,
+        stats.elapsed,
+        stats.rows_per_second,
+        stats.inserted,
+        stats.updated,
+        stats.unchanged,
+        stats.deactivated,
+        stats.failed,
+    )
 
-                category_db = session.scalar(
-                    sa.select(models.Category).where(
-                        models.Category.title == categories
+
+@celery_app.task
+def release_expired_reservations() -> int:
+    """
+    Снятие просроченных резервов пачками по RESERVATION_SWEEP_BATCH.
+    Каждая пачка - одна транзакция: сначала в порядке id блокируются
+    строки товаров, как при оформлении заказа и снятии резервов из
+    корзины, потом резервы удаляются и количество возвращается в
+    Product.reserved одним запросом. Возвращает число снятых резервов
+    """
+    reservation = models.Reservation
+    product = models.Product
+    stmt_expired = (
+        sa.select(reservation.id, reservation.product_id)
+        .where(reservation.expires_at < sa.func.now())
+        .order_by(reservation.id)
+        .limit(config.RESERVATION_SWEEP_BATCH)
+    )
+    expired_ids = sa.bindparam("expired_ids", expanding=True)
+    stmt_lock = (
+        sa.select(product.id)
+        .where(product.id.in_(sa.bindparam("products_id", expanding=True)))
+        .order_by(product.id)
+        .with_for_update()
+    )
+    # резерв могли продлить или выкупить, пока товар не был заблокирован
+    deleted = (
+        sa.delete(reservation)
+        .where(
+            reservation.id.in_(expired_ids),
+            reservation.expires_at < sa.func.now(),
+        )
+        .returning(reservation.product_id, reservation.quantity)
+        .cte("deleted")
+    )
+    released = (
+        sa.select(
+            deleted.c.product_id,
+            sa.func.sum(deleted.c.quantity).label("quantity"),
+            sa.func.count().label("holds"),
+        )
+        .group_by(deleted.c.product_id)
+        .cte("released")
+    )
+    stmt = (
+        sa.update(product)
+        .where(product.id == released.c.product_id)
+        .values(reserved=product.reserved - released.c.quantity)
+        .returning(product.id, released.c.holds)
+    )
+    cache = RedisBackend(redis_cache_client)
+    total = 0
+    with Session(bind=engine) as session:
+        while True:
+            expired = session.execute(stmt_expired).all()
+            if not expired:
+                session.commit()
+                return total
+            session.execute(
+                stmt_lock,
+                {"products_id": sorted({row.product_id for row in expired})},
+            )
+            rows = session.execute(
+                stmt, {"expired_ids": [row.id for row in expired]}
+            ).all()
+            session.commit()
+            if rows:
+                cache.invalidate(
+                    entity_tags(
+                        "product", [product_id for product_id, _ in rows]
                     )
                 )
-                if not category_db:
-                    category_db = crud.sync_create_item(
-                        session, {"title": categories}, models.Category
-                    )
-                    session.flush()
-                product_db.categories = [category_db]
-            session.commit()
-        except Exception as exc:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Error. Try again or check your yaml file",
-            ) from exc
+            total += sum(holds for _, holds in rows)
+
+
+@celery_app.task
+def rebuild_suggest_index() -> int:
+    """
+    Пересборка индекса подсказок из БД: убирает названия удаленных и
+    отключенных товаров и пересчитывает популярность по заказам
+    """
+    with Session(bind=engine) as session:
+        return SuggestIndex(redis_client).rebuild(suggest_entries(session))
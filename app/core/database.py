@@ -0,0 +1,215 @@
+import itertools
+import time
+from dataclasses import asdict, dataclass
+
+import jwt
+import sqlalchemy as sa
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.redis_cli import async_redis_client
+from core.redis_keys import DB_PIN
+from core.settings import config
+from core.tokens import token_verifier
+
+
+REPLICA_LAG_QUERY = sa.text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - "
+    "pg_last_xact_replay_timestamp()) END"
+)
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    def record(self, wait: float) -> None:
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который считает выдачи и время ожидания соединения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats  # type: ignore[attr-defined]
+        return pool
+
+
+class Database:
+    """
+    Один движок и фабрика сессий на процесс. Создается в lifespan
+    приложения и закрывается при остановке
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._engine: AsyncEngine | None = None
+        self._session_maker: async_sessionmaker[AsyncSession] | None = None
+
+    def connect(self) -> None:
+        if self._engine is not None:
+            return
+        self._engine = create_async_engine(
+            self.dsn,
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            connect_args={
+                "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE
+            },
+        )
+        self._session_maker = async_sessionmaker(self._engine)
+
+    async def disconnect(self) -> None:
+        if self._engine is None:
+            return
+        await self._engine.dispose()
+        self._engine = None
+        self._session_maker = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            raise RuntimeError("Database is not connected")
+        return self._engine
+
+    @property
+    def session_maker(self) -> async_sessionmaker[AsyncSession]:
+        if self._session_maker is None:
+            raise RuntimeError("Database is not connected")
+        return self._session_maker
+
+    def pool_stats(self) -> dict:
+        """Текущее состояние пула и статистика выдачи соединений"""
+        pool = self.engine.pool
+        stats: dict = {
+            "size": pool.size(),  # type: ignore[attr-defined]
+            "checked_in": pool.checkedin(),  # type: ignore[attr-defined]
+            "checked_out": pool.checkedout(),  # type: ignore[attr-defined]
+            "overflow": pool.overflow(),  # type: ignore[attr-defined]
+        }
+        stats.update(asdict(pool.stats))  # type: ignore[attr-defined]
+        if stats["checkouts"]:
+            stats["wait_avg"] = stats["wait_total"] / stats["checkouts"]
+        return stats
+
+
+class Replica(Database):
+    """Реплика только для чтения с кэшированным значением отставания"""
+
+    def __init__(self, dsn: str):
+        super().__init__(dsn)
+        self.lag: float | None = None
+        self.checked_at = 0.0
+
+    async def replication_lag(self) -> float | None:
+        """
+        Отставание реплики в секундах, None если реплика недоступна.
+        Проверяется не чаще DB_REPLICA_LAG_CHECK_INTERVAL
+        """
+        now = time.monotonic()
+        if now - self.checked_at < config.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return self.lag
+        self.checked_at = now
+        try:
+            async with self.engine.connect() as connection:
+                lag = await connection.scalar(REPLICA_LAG_QUERY)
+            self.lag = float(lag or 0)
+        except (OSError, exc.SQLAlchemyError):
+            self.lag = None
+        return self.lag
+
+
+class ReplicaRouter:
+    """
+    Распределение читающих запросов по репликам по кругу.
+    Если все реплики отстают или недоступны, чтение идет в основную БД.
+    После записи пользователь на DB_READ_YOUR_WRITES_WINDOW секунд
+    закрепляется за основной БД, чтобы видеть свои изменения
+    """
+
+    def __init__(self, primary: Database, dsns: list[str]):
+        self.primary = primary
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self._counter = itertools.count()
+
+    def connect(self) -> None:
+        for replica in self.replicas:
+            replica.connect()
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas:
+            await replica.disconnect()
+
+    async def choose(self, authorization: str | None = None) -> Database:
+        if not self.replicas or await self.is_pinned(authorization):
+            return self.primary
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._counter) % len(self.replicas)]
+            lag = await replica.replication_lag()
+            if lag is not None and lag <= config.DB_REPLICA_MAX_LAG:
+                return replica
+        return self.primary
+
+    async def pin_primary(self, authorization: str | None) -> None:
+        if not self.replicas:
+            return
+        subject = _token_subject(authorization)
+        if subject is None:
+            return
+        await async_redis_client.set(DB_PIN.key(subject), 1, ex=DB_PIN.ttl)
+
+    async def is_pinned(self, authorization: str | None) -> bool:
+        subject = _token_subject(authorization)
+        if subject is None:
+            return False
+        return bool(await async_redis_client.exists(DB_PIN.key(subject)))
+
+
+def _token_subject(authorization: str | None) -> str | None:
+    """
+    Subject из bearer-токена с проверкой подписи, иначе поддельный
+    токен закрепит за основной БД чужого пользователя. Claims берутся
+    из кэша проверенных токенов
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    try:
+        payload = token_verifier.decode(authorization.removeprefix("Bearer "))
+    except jwt.InvalidTokenError:
+        return None
+    return payload.get("sub")
+
+
+database = Database(config.async_dsn)  # type: ignore[arg-type]
+replicas = ReplicaRouter(database, config.DB_REPLICA_DSNS)
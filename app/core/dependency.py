@@ -1,20 +1,36 @@
+import logging
 from typing import Annotated
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jwt.exceptions import InvalidTokenError
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-import models
-from core.settings import config
+from core.database import database, replicas
+from core.principals import principal_cache
+from core.redis_cache import cache_backend
+from core.redis_cli import async_redis_client
+from core.suggest import SuggestIndex
+from core.tokens import token_verifier
 from crud.users import UserCrud
-from schemas.schemas import UserResponse
+from schemas.schemas import Principal
+
+
+logger = logging.getLogger(__name__)
 
 
 async def get_session():
-    async with AsyncSession(create_async_engine(config.async_dsn)) as session:
-        yield session
+    async with database.session_maker() as session:
+        try:
+            yield session
+        finally:
+            await cache_backend.publish(session)
+            try:
+                await SuggestIndex(async_redis_client).publish(session)
+            except RedisError:
+                # подсказки поправит ближайшая пересборка индекса
+                logger.exception("Suggest index update failed")
 
 
 AsyncSessionDependency = Annotated[
@@ -22,28 +38,65 @@ AsyncSessionDependency = Annotated[
 ]
 
 
+async def get_read_session(request: Request):
+    source = await replicas.choose(request.headers.get("Authorization"))
+    async with source.session_maker() as session:
+        yield session
+
+
+AsyncReadSessionDependency = Annotated[
+    AsyncSession, Depends(get_read_session, use_cache=True)
+]
+
+
+BearerTokenDependency = Annotated[
+    HTTPAuthorizationCredentials, Depends(HTTPBearer())
+]
+
+
 async def get_current_user(
-    token: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    token: BearerTokenDependency,
     session: AsyncSessionDependency,
-) -> models.User:
+) -> Principal:
+    """
+    Принципал из токена. Берется из кэша (core.principals), в БД - только
+    при промахе, обработчики, которым нужен весь пользователь,
+    загружают его сами
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token.credentials, config.SECRET_KEY, algorithms=[config.ALGORITHM]
-        )
+        payload = await token_verifier.verify(token.credentials)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except InvalidTokenError as err:
         raise credentials_exception from err
-    user = await UserCrud(session).get_user(email)
+    principal = await principal_cache.get(email)
+    if principal is not None:
+        return principal
+    user = await UserCrud(session).get_user(email, "auth_principal")
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.model_validate(user)
+    await principal_cache.set(principal)
+    return principal
+
+
+def get_cache_tags(request: Request) -> set[str]:
+    """
+    Теги ответа для кэша (core.redis_cache.CacheMiddleware), ответ
+    кэшируется, только если обработчик их указал
+    """
+    tags: set[str] = set()
+    request.state.cache_tags = tags
+    return tags
+
+
+CacheTagsDependency = Annotated[set[str], Depends(get_cache_tags)]
 
 
-GetCurrentUserDependency = Annotated[UserResponse, Depends(get_current_user)]
+GetCurrentUserDependency = Annotated[Principal, Depends(get_current_user)]
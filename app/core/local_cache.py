@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class LocalItem:
+    value: Any
+    size: int
+    expires_at: float
+    tags: frozenset[str]
+
+
+class LocalCache:
+    """
+    LRU в памяти процесса, ограниченный суммарным размером значений в
+    байтах. Значения больше max_item не сохраняются, чтобы один большой
+    ответ не вытеснял много мелких. Записи помечаются тегами для сброса
+    """
+
+    def __init__(self, max_bytes: int, max_item: int):
+        self.max_bytes = max_bytes
+        self.max_item = max_item
+        self.size = 0
+        self.items: OrderedDict[str, LocalItem] = OrderedDict()
+        self.tags: dict[str, set[str]] = {}
+        self.stats = CacheStats()
+        # растет при каждом сбросе: значение, прочитанное до сброса, по
+        # нему можно не сохранять
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get(self, key: str) -> Any:
+        item = self.items.get(key)
+        if item is None or item.expires_at <= time.monotonic():
+            if item is not None:
+                self.pop(key)
+            self.stats.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.stats.hits += 1
+        return item.value
+
+    def set(  # pylint: disable=R0913,R0917
+        self,
+        key: str,
+        value: Any,
+        size: int,
+        ttl: float,
+        tags: Iterable[str] = (),
+    ) -> None:
+        self.pop(key)
+        if size > self.max_item or ttl <= 0:
+            return
+        item = LocalItem(value, size, time.monotonic() + ttl, frozenset(tags))
+        self.items[key] = item
+        self.size += size
+        for tag in item.tags:
+            self.tags.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes:
+            self.pop(next(iter(self.items)))
+            self.stats.evictions += 1
+
+    def pop(self, key: str) -> None:
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        self.size -= item.size
+        for tag in item.tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self.pop(key)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.items.clear()
+        self.tags.clear()
+        self.size = 0
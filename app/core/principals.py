@@ -0,0 +1,58 @@
+from typing import Any
+
+import redis
+from redis import asyncio as aioredis
+
+from core.local_cache import LocalCache
+from core.redis_cli import async_redis_client
+from core.redis_keys import PRINCIPAL
+from core.settings import config
+from schemas.schemas import Principal
+
+
+KEY_PREFIX = PRINCIPAL.prefix
+
+
+class PrincipalCache:
+    """
+    Кэш принципалов по email из токена: в Redis на AUTH_PRINCIPAL_TTL
+    секунд и в памяти воркера на AUTH_PRINCIPAL_LOCAL_TTL. Изменения
+    пользователя и магазина сбрасывают запись через invalidate, другие
+    воркеры видят изменение не позже чем через AUTH_PRINCIPAL_LOCAL_TTL.
+    invalidate работает и с синхронным клиентом (воркер Celery), для
+    асинхронного результат нужно await
+    """
+
+    def __init__(self, client: redis.Redis | aioredis.Redis):
+        self.redis = client
+        # размер записи - 1, max_bytes ограничивает число принципалов
+        self.local = LocalCache(config.AUTH_PRINCIPAL_LOCAL_SIZE, 1)
+
+    async def get(self, email: str) -> Principal | None:
+        principal = self.local.get(email)
+        if principal is not None:
+            return principal
+        data = await self.redis.get(KEY_PREFIX + email)  # type: ignore[misc]
+        if data is None:
+            return None
+        principal = Principal.model_validate_json(data)
+        self.local.set(email, principal, 1, config.AUTH_PRINCIPAL_LOCAL_TTL)
+        return principal
+
+    async def set(self, principal: Principal) -> None:
+        await self.redis.set(  # type: ignore[misc]
+            KEY_PREFIX + principal.email,
+            principal.model_dump_json(),
+            ex=PRINCIPAL.ttl,
+        )
+        self.local.set(
+            principal.email, principal, 1, config.AUTH_PRINCIPAL_LOCAL_TTL
+        )
+
+    def invalidate(self, *emails: str) -> Any:
+        for email in emails:
+            self.local.pop(email)
+        return self.redis.delete(*(KEY_PREFIX + email for email in emails))
+
+
+principal_cache = PrincipalCache(async_redis_client)
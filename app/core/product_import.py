@@ -0,0 +1,502 @@
+import hashlib
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any, Callable, Iterable, Iterator
+
+import sqlalchemy as sa
+import yaml
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import Session
+
+import models
+from core.redis_cache import RedisBackend, entity_tags, session_tags
+from core.suggest import SuggestIndex
+from models.products import category_product
+from models.search import SEARCH_DEFERRED
+
+
+class PriceListReader:
+    """
+    Потоковое чтение yaml-прайса: поля верхнего уровня до goods
+    читаются сразу, товары отдаются по одному без загрузки всего файла
+    """
+
+    def __init__(self, stream: IO):
+        loader_class = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        self.loader = loader_class(stream)
+        self.header: dict[str, Any] = {}
+        self.loader.get_event()  # StreamStart
+        self.loader.get_event()  # DocumentStart
+        self.loader.get_event()  # MappingStart
+        while not self.loader.check_event(yaml.MappingEndEvent):
+            key = self._construct_next()
+            if key == "goods":
+                return
+            self.header[key] = self._construct_next()
+        raise ValueError("Price list has no goods")
+
+    def _resolve_tag(self, node_class: type, event: Any) -> str:
+        if event.tag not in (None, "!"):
+            return event.tag
+        value = event.value if node_class is yaml.ScalarNode else None
+        return self.loader.resolve(node_class, value, event.implicit)
+
+    def _compose_next(self) -> yaml.Node:
+        """Сборка узла из событий парсера, работает и с CSafeLoader"""
+        event = self.loader.get_event()
+        if isinstance(event, yaml.ScalarEvent):
+            return yaml.ScalarNode(
+                self._resolve_tag(yaml.ScalarNode, event),
+                event.value,
+                event.start_mark,
+                event.end_mark,
+                style=event.style,
+            )
+        if isinstance(event, yaml.SequenceStartEvent):
+            items = []
+            while not self.loader.check_event(yaml.SequenceEndEvent):
+                items.append(self._compose_next())
+            end_event = self.loader.get_event()
+            return yaml.SequenceNode(
+                self._resolve_tag(yaml.SequenceNode, event),
+                items,
+                event.start_mark,
+                end_event.end_mark,
+                flow_style=event.flow_style,
+            )
+        if isinstance(event, yaml.MappingStartEvent):
+            pairs = []
+            while not self.loader.check_event(yaml.MappingEndEvent):
+                pairs.append((self._compose_next(), self._compose_next()))
+            end_event = self.loader.get_event()
+            return yaml.MappingNode(
+                self._resolve_tag(yaml.MappingNode, event),
+                pairs,
+                event.start_mark,
+                end_event.end_mark,
+                flow_style=event.flow_style,
+            )
+        raise ValueError(f"Unsupported yaml event {event}")
+
+    def _construct_next(self) -> Any:
+        value = self.loader.construct_object(self._compose_next(), deep=True)
+        self.loader.constructed_objects = {}
+        return value
+
+    def goods(self) -> Iterator[dict[str, Any]]:
+        self.loader.get_event()  # SequenceStart
+        while not self.loader.check_event(yaml.SequenceEndEvent):
+            yield self._construct_next()
+        self.loader.dispose()
+
+
+@dataclass
+class ImportStats:  # pylint: disable=R0902
+    rows: int = 0
+    chunks: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deactivated: int = 0
+    failed: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, row: int, error: str, max_errors: int) -> None:
+        """Ошибки строк хранятся до max_errors штук, дальше только счетчик"""
+        self.failed += 1
+        if len(self.errors) < max_errors:
+            self.errors.append({"row": row, "error": error})
+
+
+class ImportCanceled(Exception):
+    pass
+
+
+class RowError(ValueError):
+    pass
+
+
+def content_hash(*values: Any) -> str:
+    """Хэш значений для сравнения с загруженными ранее"""
+    content = json.dumps(values, ensure_ascii=False)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def normalize_product(product: dict[str, Any]) -> dict[str, Any]:
+    """
+    Приведение товара из прайса к одному виду: внешний ключ - id из
+    прайса или название, категории - список, хэши полей товара и
+    отдельно его параметров и категорий
+    """
+    if not isinstance(product, dict):
+        raise RowError("Product must be a mapping")
+    for key in ("name", "price", "remainder"):
+        if key not in product:
+            raise RowError(f"Field {key} is required")
+    if (
+        not isinstance(product["name"], str)
+        or not 0 < len(product["name"]) <= 100
+    ):
+        raise RowError("Name must be a string up to 100 characters")
+    try:
+        price = Decimal(str(product["price"]))
+    except InvalidOperation as exc:
+        raise RowError("Price must be a number") from exc
+    if not price.is_finite() or price < 0:
+        raise RowError("Price must be a positive number")
+    if not isinstance(product["remainder"], int) or product["remainder"] <= 0:
+        raise RowError("Remainder must be a positive integer")
+    categories = product.get("category") or []
+    if isinstance(categories, str):
+        categories = [categories]
+    if not isinstance(categories, list) or not all(
+        isinstance(title, str) and 0 < len(title) <= 100
+        for title in categories
+    ):
+        raise RowError("Category must be a string or a list of strings")
+    if not isinstance(product.get("parameters") or {}, dict):
+        raise RowError("Parameters must be a mapping")
+    parameters = {
+        str(name): str(value)
+        for name, value in (product.get("parameters") or {}).items()
+    }
+    if not all(0 < len(name) <= 100 for name in parameters):
+        raise RowError("Parameter name must be up to 100 characters")
+    external_id = str(product.get("id", product["name"]))
+    return {
+        "external_id": external_id,
+        "name": product["name"],
+        "price": product["price"],
+        "remainder": product["remainder"],
+        "parameters": parameters,
+        "category": categories,
+        "content_hash": content_hash(
+            product["name"], str(product["price"]), product["remainder"]
+        ),
+        "relations_hash": content_hash(
+            sorted(parameters.items()), sorted(categories)
+        ),
+    }
+
+
+class ProductImporter:  # pylint: disable=R0902
+    """
+    Загрузка товаров пачками с сопоставлением по внешнему ключу внутри
+    магазина. Для пачки одним запросом читаются уже загруженные товары,
+    строки с теми же хэшами пропускаются, измененные обновляются, новые
+    вставляются многострочными insert. Параметры и категории товара
+    перезаписываются, только если изменились они сами. Имена параметров
+    и категорий создаются и читаются одним запросом на пачку, коммит на
+    каждую пачку. Триггеры поискового вектора в транзакции пачки
+    отключены, вектор пересчитывается одним запросом после записи.
+    Названия записанных товаров и категорий добавляются в подсказки
+    """
+
+    def __init__(  # pylint: disable=R0913,R0917
+        self,
+        session: Session,
+        shop_id: int,
+        chunk_size: int,
+        deactivate_missing: bool = False,
+        max_errors: int = 100,
+        progress: Callable[[ImportStats], None] | None = None,
+        suggest: SuggestIndex | None = None,
+        cache: RedisBackend | None = None,
+    ):
+        self.session = session
+        self.shop_id = shop_id
+        self.chunk_size = chunk_size
+        self.deactivate_missing = deactivate_missing
+        self.max_errors = max_errors
+        self.progress = progress
+        self.suggest = suggest
+        self.cache = cache
+        self.seen: set[str] = set()
+        self.stats = ImportStats()
+
+    def run(self, goods: Iterable[dict[str, Any]]) -> ImportStats:
+        goods_iter = iter(goods)
+        while chunk := list(itertools.islice(goods_iter, self.chunk_size)):
+            written = self.import_chunk(chunk)
+            self.session.commit()
+            self.publish()
+            if self.suggest is not None and written:
+                self.suggest.add(
+                    products={row["name"] for row in written},
+                    categories={
+                        title for row in written for title in row["category"]
+                    },
+                )
+            self.stats.rows += len(chunk)
+            self.stats.chunks += 1
+            if self.progress is not None:
+                self.progress(self.stats)
+        if self.deactivate_missing:
+            self.stats.deactivated = self.deactivate()
+            self.session.commit()
+            self.publish()
+        self.stats.finished_at = time.perf_counter()
+        return self.stats
+
+    def publish(self) -> None:
+        """Сброс кэша ответов с товарами, записанными в пачке"""
+        tags = self.session.info.pop("cache_tags", None)
+        if self.cache is not None and tags:
+            self.cache.invalidate(tags)
+
+    def resolve_names(
+        self, model: models.TypeModel, column: str, names: set[str]
+    ) -> dict[str, int]:
+        """id для имен: новые добавляются, существующие не трогаются"""
+        if not names:
+            return {}
+        self.session.execute(
+            insert(model.__table__).on_conflict_do_nothing(
+                index_elements=[column]
+            ),
+            [{column: name} for name in names],
+        )
+        session_tags(self.session).add(model.__tablename__)
+        stmt = sa.select(getattr(model, column), model.id).where(
+            getattr(model, column).in_(names)
+        )
+        return dict(self.session.execute(stmt).all())  # type: ignore
+
+    def get_existing(self, external_ids: list[str]) -> dict[str, sa.Row]:
+        product = models.Product
+        stmt = sa.select(
+            product.external_id,
+            product.id,
+            product.name,
+            product.content_hash,
+            product.relations_hash,
+            product.active,
+        ).where(
+            (product.shop_id == self.shop_id)
+            & product.external_id.in_(external_ids)
+        )
+        return {row.external_id: row for row in self.session.execute(stmt)}
+
+    def import_chunk(  # pylint: disable=R0914
+        self, chunk: list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """Загрузка пачки, возвращает новые и измененные строки"""
+        # при повторе ключа в прайсе берется последняя строка
+        rows = {}
+        for number, product in enumerate(chunk, self.stats.rows + 1):
+            try:
+                row = normalize_product(product)
+            except RowError as error:
+                self.stats.add_error(number, str(error), self.max_errors)
+                continue
+            rows[row["external_id"]] = row
+        if not rows:
+            return []
+        self.seen.update(rows)
+        existing = self.get_existing(list(rows))
+        new_rows, changed_rows, relations_rows, renamed_rows = [], [], [], []
+        for external_id, row in rows.items():
+            if external_id not in existing:
+                new_rows.append(row)
+                continue
+            current = existing[external_id]
+            relations_changed = current.relations_hash != row["relations_hash"]
+            if (
+                current.content_hash == row["content_hash"]
+                and not relations_changed
+                and current.active
+            ):
+                self.stats.unchanged += 1
+                continue
+            row["id"] = current.id
+            changed_rows.append(row)
+            if relations_changed:
+                relations_rows.append(row)
+            elif current.name != row["name"]:
+                renamed_rows.append(row)
+        if not new_rows and not changed_rows:
+            return []
+
+        self.session.execute(sa.text(f"SET LOCAL {SEARCH_DEFERRED} = on"))
+        product_columns = (
+            "name",
+            "price",
+            "remainder",
+            "content_hash",
+            "relations_hash",
+        )
+        if changed_rows:
+            self.session.execute(
+                sa.update(models.Product),
+                [
+                    {"id": row["id"], "active": True}
+                    | {column: row[column] for column in product_columns}
+                    for row in changed_rows
+                ],
+            )
+        self.delete_relations(relations_rows)
+        if new_rows:
+            products_id = self.session.scalars(
+                sa.insert(models.Product).returning(
+                    models.Product.id, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "shop_id": self.shop_id,
+                        "external_id": row["external_id"],
+                    }
+                    | {column: row[column] for column in product_columns}
+                    for row in new_rows
+                ],
+            ).all()
+            for row, product_id in zip(new_rows, products_id):
+                row["id"] = product_id
+        self.stats.inserted += len(new_rows)
+        self.stats.updated += len(changed_rows)
+        self.insert_relations(new_rows + relations_rows)
+        self.update_search(new_rows + relations_rows + renamed_rows)
+        session_tags(self.session).update(
+            {"product", f"shop:{self.shop_id}"}
+            | entity_tags("product", (row["id"] for row in changed_rows))
+        )
+        return new_rows + changed_rows
+
+    def delete_relations(self, rows: list[dict[str, Any]]) -> None:
+        """Удаление параметров и категорий товаров перед перезаписью"""
+        if not rows:
+            return
+        changed_id = [row["id"] for row in rows]
+        self.session.execute(
+            sa.delete(models.ParametrProduct).where(
+                models.ParametrProduct.product_id.in_(changed_id)
+            )
+        )
+        self.session.execute(
+            sa.delete(category_product).where(
+                category_product.c.product_id.in_(changed_id)
+            )
+        )
+
+    def insert_relations(self, rows: list[dict[str, Any]]) -> None:
+        """Параметры и категории для новых и измененных товаров"""
+        parametrs_id = self.resolve_names(
+            models.Parametr,
+            "name",
+            {name for row in rows for name in row["parameters"]},
+        )
+        categories_id = self.resolve_names(
+            models.Category,
+            "title",
+            {title for row in rows for title in row["category"]},
+        )
+        parametrs = [
+            {
+                "product_id": row["id"],
+                "parametr_id": parametrs_id[name],
+                "value": value,
+            }
+            for row in rows
+            for name, value in row["parameters"].items()
+        ]
+        if parametrs:
+            self.session.execute(
+                sa.insert(models.ParametrProduct.__table__), parametrs
+            )
+        categories = [
+            {"product_id": row["id"], "category_id": categories_id[title]}
+            for row in rows
+            for title in row["category"]
+        ]
+        if categories:
+            self.session.execute(sa.insert(category_product), categories)
+
+    def update_search(self, rows: list[dict[str, Any]]) -> None:
+        """Поисковый вектор новых, переименованных и измененных товаров"""
+        if not rows:
+            return
+        products_id = sa.bindparam(
+            "products_id", [row["id"] for row in rows], type_=ARRAY(sa.Integer)
+        )
+        self.session.execute(
+            sa.select(sa.func.product_search_update(products_id))
+        )
+
+    def deactivate(self) -> int:
+        """Отключение загруженных ранее товаров, которых нет в прайсе"""
+        product = models.Product
+        seen = sa.bindparam("seen", list(self.seen), type_=ARRAY(sa.String))
+        stmt = (
+            sa.update(product)
+            .where(
+                (product.shop_id == self.shop_id)
+                & product.active
+                & product.external_id.is_not(None)
+                & sa.not_(product.external_id == sa.any_(seen))
+            )
+            .values(active=False)
+            .returning(product.id)
+        )
+        products_id = self.session.scalars(stmt).all()
+        session_tags(self.session).update(
+            {"product", f"shop:{self.shop_id}"}
+            | entity_tags("product", products_id)
+        )
+        return len(products_id)
+
+
+class ImportTracker:
+    """
+    Прогресс загрузки в ImportJob. Запись идет отдельной короткой
+    транзакцией не чаще interval секунд, тем же запросом читается флаг
+    отмены, поэтому отслеживание не тормозит загрузку пачек
+    """
+
+    def __init__(self, engine: sa.Engine, job_id: int, interval: float):
+        self.engine = engine
+        self.job_id = job_id
+        self.interval = interval
+        self.flushed_at = time.monotonic()
+
+    def __call__(self, stats: ImportStats) -> None:
+        if time.monotonic() - self.flushed_at < self.interval:
+            return
+        if self.flush(stats):
+            raise ImportCanceled
+
+    def flush(self, stats: ImportStats | None = None, **values: Any) -> bool:
+        """Запись счетчиков и полей values, возвращает флаг отмены"""
+        job = models.ImportJob
+        if stats is not None:
+            values |= {
+                "rows": stats.rows,
+                "inserted": stats.inserted,
+                "updated": stats.updated,
+                "unchanged": stats.unchanged,
+                "deactivated": stats.deactivated,
+                "failed": stats.failed,
+                "errors": stats.errors,
+            }
+        stmt = (
+            sa.update(job)
+            .where(job.id == self.job_id)
+            .values(**values)
+            .returning(job.cancel_requested)
+        )
+        with Session(self.engine) as session:
+            cancel_requested = session.scalar(stmt)
+            session.commit()
+        self.flushed_at = time.monotonic()
+        return bool(cancel_requested)
@@ -1,28 +1,553 @@
-from cache_fastapi.Backends import base_backend  # type: ignore[import-untyped]
+import asyncio
+import hashlib
+import math
+import random
+import secrets
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Iterable
+
+import redis
+from fastapi import Request
+from jwt.exceptions import InvalidTokenError
 from redis import asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
 
+from core.cache_codecs import CacheEncoder, Codec, ZlibCodec
+from core.local_cache import CacheStats, LocalCache
 from core.settings import config
+from core.tokens import token_verifier
 
 
-class RedisBackend(base_backend.BaseBackend):
-    def __init__(self):
-        super().__init__()
-        self.cache = aioredis.from_url(config.redis_cache_url)
+RESPONSE_PREFIX = "cache:response:"
+LOCK_PREFIX = "cache:lock:"
+INVALIDATE_CHANNEL = "cache:invalidate"
 
-    async def create(  # pylint: disable=W0236
-        self, resp, key: str, ex: int = 60
-    ):
-        await self.cache.set(key, resp, ex=ex)
+# Сохранение ответа с тегами. Ответ не сохраняется, если один из его
+# тегов сбросили за время запроса (ARGV[1] секунд): такой ответ мог
+# быть собран из данных до записи. Ключ живет ARGV[2] секунд (жесткий
+# срок), свежим считается ARGV[5] секунд (мягкий срок). ARGV[8] -
+# кодек тела (core.cache_codecs). Теги передаются с ARGV[10], в ARGV[7]
+# - они же через пробел.
+#
+# ETag ответа - хэш ключа и версий его тегов. Версия - время последнего
+# сброса тега, отсутствующая версия создается текущим временем на
+# ARGV[9] секунд. Версии не повторяются, поэтому ETag, выданный до
+# записи, после нее уже не совпадет. Возвращает ETag или 0
+STORE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local version = time[1] .. string.format('%06d', tonumber(time[2]))
+for i = 10, #ARGV do
+    local invalidated = redis.call('GET', 'cache:invalidated:' .. ARGV[i])
+    if invalidated and now - tonumber(invalidated) < tonumber(ARGV[1]) then
+        return 0
+    end
+end
+local versions = {KEYS[1]}
+for i = 10, #ARGV do
+    local key = 'cache:version:' .. ARGV[i]
+    local current = redis.call('GET', key)
+    if current then
+        redis.call('EXPIRE', key, ARGV[9])
+    else
+        current = version
+        redis.call('SET', key, current, 'EX', ARGV[9])
+    end
+    table.insert(versions, ARGV[i] .. '=' .. current)
+end
+local etag = redis.sha1hex(table.concat(versions, '|'))
+redis.call(
+    'HSET', KEYS[1], 'body', ARGV[3], 'media_type', ARGV[4],
+    'fresh_until', tostring(now + tonumber(ARGV[5])), 'delta', ARGV[6],
+    'tags', ARGV[7], 'encoding', ARGV[8], 'etag', etag
+)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+for i = 10, #ARGV do
+    local tag = 'cache:tag:' .. ARGV[i]
+    redis.call('SADD', tag, KEYS[1])
+    redis.call('EXPIRE', tag, ARGV[2])
+end
+return etag
+"""
+
+# Ответ и сколько секунд он еще свежий - по часам Redis, чтобы
+# расхождение часов воркеров не влияло на срок
+RETRIEVE_SCRIPT = """
+local data = redis.call(
+    'HMGET', KEYS[1], 'body', 'media_type', 'fresh_until', 'delta', 'tags',
+    'encoding', 'etag'
+)
+if not data[1] then
+    return nil
+end
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+return {
+    data[1], data[2], tostring(tonumber(data[3]) - now), data[4], data[5],
+    data[6], data[7]
+}
+"""
+
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Сброс тегов: удаляются все ответы с тегом, время сброса запоминается
+# на ARGV[1] секунд для проверки в STORE_SCRIPT и как новая версия
+# тега на ARGV[2] секунд. Теги публикуются в INVALIDATE_CHANNEL для
+# локального кэша воркеров
+INVALIDATE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local version = time[1] .. string.format('%06d', tonumber(time[2]))
+for i = 3, #ARGV do
+    local tag = 'cache:tag:' .. ARGV[i]
+    local keys = redis.call('SMEMBERS', tag)
+    for first = 1, #keys, 500 do
+        local last = math.min(first + 499, #keys)
+        redis.call('UNLINK', unpack(keys, first, last))
+    end
+    redis.call('DEL', tag)
+    redis.call(
+        'SET', 'cache:invalidated:' .. ARGV[i], tostring(now), 'EX', ARGV[1]
+    )
+    redis.call('SET', 'cache:version:' .. ARGV[i], version, 'EX', ARGV[2])
+end
+redis.call('PUBLISH', 'cache:invalidate', table.concat(ARGV, ' ', 3))
+return #ARGV - 2
+"""
+
+
+def entity_tags(table: str, ids: Iterable[Any]) -> set[str]:
+    return {f"{table}:{item_id}" for item_id in ids}
+
+
+def session_tags(session: Session | Any) -> set[str]:
+    """Теги, которые нужно сбросить после коммита сессии"""
+    return session.info.setdefault("cache_tags", set())
+
+
+@event.listens_for(Session, "after_flush")
+def tag_flushed(session: Session, _) -> None:
+    """Изменения через ORM (в том числе связи) сбрасывают теги объектов"""
+    for item in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(item, "__tablename__", None)
+        item_id = getattr(item, "id", None)
+        if table is not None and item_id is not None:
+            session_tags(session).update({table, f"{table}:{item_id}"})
 
-    async def retrieve(self, key: str):  # pylint: disable=W0236
-        data = await self.cache.get(key)
-        if not data:
+
+@dataclass
+class CacheEntry:  # pylint: disable=R0902
+    body: bytes
+    media_type: str
+    fresh_for: float
+    delta: float
+    tags: frozenset[str] = frozenset()
+    encoding: str = Codec.name
+    etag: str = ""
+
+    @property
+    def fresh(self) -> bool:
+        return self.fresh_for > 0
+
+    def expiring(self, beta: float = config.CACHE_EARLY_EXPIRY_BETA) -> bool:
+        """
+        Вероятностное досрочное устаревание (XFetch): чем ближе конец
+        мягкого срока и чем дольше ответ собирался, тем вероятнее, что
+        запрос обновит его заранее, а не все запросы сразу по истечении
+        """
+        jitter = -self.delta * beta * math.log(1 - random.random())
+        return jitter >= self.fresh_for
+
+
+class RedisBackend:  # pylint: disable=R0902
+    """
+    Кэш ответов в Redis с тегами: ответ помечается сущностями, из
+    которых собран (product:1, shop:2, category), запись в БД сбрасывает
+    теги и все ответы с ними. Поэтому жесткий срок жизни кэша долгий,
+    а после мягкого срока ответ отдается устаревшим, пока один запрос
+    его обновляет. Сброс тегов работает и с синхронным клиентом
+    (воркер), для асинхронного результат invalidate нужно await.
+
+    Перед Redis - локальный LRU воркера со свежими ответами. Он включен,
+    только пока listen подписан на сброс тегов: без подписки воркер не
+    узнает о записях в других процессах
+    """
+
+    def __init__(self, client: redis.Redis | aioredis.Redis | None = None):
+        self.cache = client or aioredis.from_url(config.redis_cache_url)
+        self.local = LocalCache(
+            config.CACHE_LOCAL_MAX_BYTES, config.CACHE_LOCAL_MAX_ITEM
+        )
+        self.listening = False
+        self.stats = CacheStats()
+        self.encoder = CacheEncoder()
+        self.store_script = self.cache.register_script(STORE_SCRIPT)
+        self.retrieve_script = self.cache.register_script(RETRIEVE_SCRIPT)
+        self.invalidate_script = self.cache.register_script(INVALIDATE_SCRIPT)
+        self.unlock_script = self.cache.register_script(UNLOCK_SCRIPT)
+
+    async def create(  # pylint: disable=R0913,R0917
+        self,
+        key: str,
+        body: bytes,
+        media_type: str,
+        tags: Iterable[str],
+        elapsed: float,
+        ex: int = config.CACHE_TTL,
+        fresh: int = config.CACHE_SOFT_TTL,
+    ) -> str | None:
+        """
+        Сохранение ответа. elapsed - время обработки запроса: теги,
+        сброшенные за это время и задержку реплик, не дают сохранить
+        ответ. Возвращает ETag сохраненного ответа
+        """
+        tags = sorted(set(tags))
+        encoding, body = self.encoder.encode(body)
+        generation = self.local.generation
+        stored = await self.store_script(
+            keys=[RESPONSE_PREFIX + key],
+            args=[
+                elapsed + config.DB_REPLICA_MAX_LAG,
+                ex,
+                body,
+                media_type,
+                fresh,
+                elapsed,
+                " ".join(tags),
+                encoding,
+                config.CACHE_VERSION_TTL,
+                *tags,
+            ],
+        )
+        if not stored:
             return None
-        expire = await self.cache.ttl(key)
-        return data, expire
+        etag = stored.decode()
+        self.remember(
+            key,
+            CacheEntry(
+                body,
+                media_type,
+                fresh,
+                elapsed,
+                frozenset(tags),
+                encoding,
+                etag,
+            ),
+            generation,
+        )
+        return etag
+
+    async def retrieve(self, key: str) -> CacheEntry | None:
+        if self.listening:
+            local = self.local.get(key)
+            if local is not None:
+                entry, fresh_until = local
+                return replace(entry, fresh_for=fresh_until - time.monotonic())
+        generation = self.local.generation
+        data = await self.retrieve_script(keys=[RESPONSE_PREFIX + key])
+        if data is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        body, media_type, fresh_for, delta, tags, encoding, etag = data
+        entry = CacheEntry(
+            body,
+            media_type.decode(),
+            float(fresh_for),
+            float(delta),
+            frozenset(tags.decode().split()),
+            encoding.decode(),
+            etag.decode(),
+        )
+        self.remember(key, entry, generation)
+        return entry
+
+    def content(self, entry: CacheEntry) -> bytes:
+        return self.encoder.decode(entry.encoding, entry.body)
 
-    async def invalidate(self, key: str):  # pylint: disable=W0236
-        await self.cache.delete(key)
+    def remember(self, key: str, entry: CacheEntry, generation: int) -> None:
+        """
+        Свежий ответ в локальный кэш, не дольше его мягкого срока.
+        generation - поколение локального кэша до запроса в Redis: если
+        за время запроса пришел сброс, ответ мог устареть
+        """
+        if not self.listening or self.local.generation != generation:
+            return
+        self.local.set(
+            key,
+            (entry, time.monotonic() + entry.fresh_for),
+            len(entry.body),
+            min(entry.fresh_for, config.CACHE_LOCAL_TTL),
+            entry.tags,
+        )
 
-    async def clear(self):  # pylint: disable=W0236
+    async def lock(
+        self, key: str, timeout: float = config.CACHE_LOCK_TIMEOUT
+    ) -> str | None:
+        """
+        Блокировка обновления ответа между воркерами. Возвращает токен
+        для unlock или None, если ответ уже обновляет другой запрос
+        """
+        token = secrets.token_hex(8)
+        locked = await self.cache.set(
+            LOCK_PREFIX + key, token, nx=True, px=int(timeout * 1000)
+        )
+        return token if locked else None
+
+    async def unlock(self, key: str, token: str) -> None:
+        await self.unlock_script(keys=[LOCK_PREFIX + key], args=[token])
+
+    async def wait(
+        self, key: str, timeout: float = config.CACHE_LOCK_TIMEOUT
+    ) -> CacheEntry | None:
+        """
+        Ожидание ответа, который собирает другой воркер. None - если
+        блокировку сняли без сохранения ответа или истек timeout
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(config.CACHE_LOCK_POLL)
+            entry = await self.retrieve(key)
+            if entry is not None or not await self.cache.exists(
+                LOCK_PREFIX + key
+            ):
+                return entry
+        return None
+
+    def invalidate(self, tags: Iterable[str]) -> Any:
+        tags = list(tags)
+        self.local.invalidate(tags)
+        return self.invalidate_script(
+            args=[
+                config.CACHE_INVALIDATION_WINDOW,
+                config.CACHE_VERSION_TTL,
+                *tags,
+            ]
+        )
+
+    async def listen(self) -> None:
+        """
+        Сброс локального кэша по тегам, сброшенным в любом процессе.
+        Запускается задачей в lifespan приложения. Пока подписки нет
+        (в том числе после обрыва соединения, когда сообщения могли
+        потеряться), локальный кэш очищен и не используется
+        """
+        while True:
+            try:
+                async with self.cache.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATE_CHANNEL)
+                    self.listening = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.local.invalidate(
+                                message["data"].decode().split()
+                            )
+            except redis.RedisError:
+                await asyncio.sleep(config.CACHE_LOCK_TIMEOUT)
+            finally:
+                self.listening = False
+                self.local.clear()
+
+    async def cache_stats(self) -> dict:
+        """Попадания, промахи и вытеснения по уровням кэша"""
+        info = await self.cache.info("stats")
+        return {
+            "local": asdict(self.local.stats)
+            | {"items": len(self.local), "bytes": self.local.size},
+            "redis": asdict(self.stats)
+            | {"evictions": info.get("evicted_keys", 0)},
+        }
+
+    async def publish(self, session: Any) -> None:
+        """Сброс тегов, накопленных сессией"""
+        tags = session.info.pop("cache_tags", None)
+        if tags:
+            await self.invalidate(tags)
+
+    async def clear(self):
         await self.cache.flushdb()
+
+
+class CacheMiddleware(BaseHTTPMiddleware):
+    """
+    Кэширование GET-ответов. Сохраняются только ответы обработчиков,
+    которые указали теги через CacheTagsDependency. Ключ зависит от
+    пути, параметров запроса и токена.
+
+    Отсутствующий ответ собирает один запрос на ключ: в процессе
+    остальные ждут его событие, между воркерами - блокировку в Redis.
+    Устаревший ответ отдается (X-Cache: STALE), пока один запрос
+    его обновляет
+    """
+
+    def __init__(
+        self, app, cached_endpoints: list[str], backend: RedisBackend
+    ):
+        super().__init__(app)
+        self.cached_endpoints = cached_endpoints
+        self.backend = backend
+        self.inflight: dict[str, asyncio.Event] = {}
+
+    @staticmethod
+    def key(request: Request) -> str:
+        query = "&".join(sorted(request.url.query.split("&")))
+        auth = request.headers.get("Authorization", "")
+        data = f"{request.url.path}?{query}|{auth}"
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @staticmethod
+    def not_modified(request: Request, etag: str) -> bool:
+        """Совпадает ли ETag с одним из If-None-Match клиента"""
+        header = request.headers.get("If-None-Match")
+        if header is None:
+            return False
+        return any(
+            value.strip().removeprefix("W/") in ("*", f'"{etag}"')
+            for value in header.split(",")
+        )
+
+    @staticmethod
+    def accepts(request: Request, coding: str) -> bool:
+        """
+        Принимает ли клиент кодирование по Accept-Encoding с учетом
+        q-значений: "deflate;q=0" - отказ, явное значение важнее "*"
+        """
+        weights = {}
+        for value in request.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = value.partition(";")
+            weight = 1.0
+            for param in params.split(";"):
+                key, _, number = param.strip().partition("=")
+                if key.lower() == "q":
+                    try:
+                        weight = float(number)
+                    except ValueError:
+                        weight = 0.0
+            weights[name.strip().lower()] = weight
+        return weights.get(coding, weights.get("*", 0.0)) > 0
+
+    @staticmethod
+    async def authorized(request: Request) -> bool:
+        """
+        Кэш отдается только с действующим токеном: истекший или
+        отозванный токен проходит в обработчик и получает 401
+        """
+        header = request.headers.get("Authorization")
+        if header is None:
+            return True
+        try:
+            await token_verifier.verify(header.partition(" ")[2])
+        except InvalidTokenError:
+            return False
+        return True
+
+    def cached(
+        self, request: Request, entry: CacheEntry, status: str
+    ) -> Response:
+        """
+        Если у клиента тот же ETag - 304 без тела. Тело, сжатое zlib,
+        отдается клиенту без распаковки, если он принимает deflate
+        """
+        headers = {
+            "X-Cache": status,
+            "Vary": "Accept-Encoding",
+            "ETag": f'"{entry.etag}"',
+        }
+        if self.not_modified(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        if entry.encoding == ZlibCodec.name and self.accepts(
+            request, "deflate"
+        ):
+            headers["Content-Encoding"] = "deflate"
+            body = entry.body
+        else:
+            body = self.backend.content(entry)
+        return Response(body, media_type=entry.media_type, headers=headers)
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        cache_control = request.headers.get("Cache-Control", "")
+        if (
+            request.method != "GET"
+            or "no-cache" in cache_control
+            or not request.url.path.startswith(tuple(self.cached_endpoints))
+            or not await self.authorized(request)
+        ):
+            return await call_next(request)
+        key = self.key(request)
+        entry = await self.backend.retrieve(key)
+        if entry is None:
+            return await self.coalesce(request, call_next, key)
+        if not entry.expiring():
+            return self.cached(request, entry, "HIT")
+        token = await self.backend.lock(key)
+        if token is None:
+            return self.cached(
+                request, entry, "HIT" if entry.fresh else "STALE"
+            )
+        try:
+            return await self.refresh(request, call_next, key)
+        finally:
+            await self.backend.unlock(key, token)
+
+    async def coalesce(self, request: Request, call_next, key: str):
+        """Сборка отсутствующего ответа одним запросом на ключ"""
+        done = self.inflight.get(key)
+        if done is not None:
+            await done.wait()
+            entry = await self.backend.retrieve(key)
+            if entry is not None:
+                return self.cached(request, entry, "HIT")
+            return await self.refresh(request, call_next, key)
+        done = self.inflight[key] = asyncio.Event()
+        try:
+            token = await self.backend.lock(key)
+            if token is None:
+                entry = await self.backend.wait(key)
+                if entry is not None:
+                    return self.cached(request, entry, "HIT")
+                return await self.refresh(request, call_next, key)
+            try:
+                return await self.refresh(request, call_next, key)
+            finally:
+                await self.backend.unlock(key, token)
+        finally:
+            del self.inflight[key]
+            done.set()
+
+    async def refresh(self, request: Request, call_next, key: str):
+        started = time.monotonic()
+        response = await call_next(request)
+        tags = getattr(request.state, "cache_tags", None)
+        if response.status_code != 200 or not tags:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = dict(response.headers) | {"X-Cache": "MISS"}
+        headers.pop("content-length", None)
+        if "no-store" in request.headers.get("Cache-Control", ""):
+            return Response(body, status_code=200, headers=headers)
+        etag = await self.backend.create(
+            key,
+            body,
+            response.headers.get("content-type", "application/json"),
+            tags,
+            time.monotonic() - started,
+        )
+        if etag is None:
+            return Response(body, status_code=200, headers=headers)
+        headers |= {"ETag": f'"{etag}"', "Vary": "Accept-Encoding"}
+        if self.not_modified(request, etag):
+            headers.pop("content-type", None)
+            return Response(status_code=304, headers=headers)
+        return Response(body, status_code=200, headers=headers)
+
+
+cache_backend = RedisBackend()
@@ -1,6 +1,16 @@
 import redis
+from redis import asyncio as aioredis
 
 from core.settings import config
 
 
 redis_client = redis.Redis().from_url(config.redis_url)  # type: ignore
+redis_cache_client = redis.Redis().from_url(
+    config.redis_cache_url  # type: ignore[arg-type]
+)
+
+redis_pool = aioredis.ConnectionPool.from_url(
+    config.redis_url,  # type: ignore[arg-type]
+    max_connections=config.REDIS_MAX_CONNECTIONS,
+)
+async_redis_client = aioredis.Redis(connection_pool=redis_pool)
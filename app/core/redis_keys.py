@@ -0,0 +1,321 @@
+"""
+Ключи Redis приложения (БД redis_url): пространства имен с
+обязательной политикой TTL и отчет/миграция по всей базе через SCAN.
+
+    cd app
+    python -m core.redis_keys report --every 10
+    python -m core.redis_keys migrate --count 500 --pause 0.01
+"""
+
+import argparse
+import json
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import redis
+
+from core.settings import config
+
+
+@dataclass(frozen=True)
+class KeySpace:
+    """
+    Пространство ключей: префикс, TTL и тип значения. TTL обязателен,
+    None - только для ключей, которые живут, пока их не удалит код
+    (индексы, список отозванных токенов с очисткой при записи)
+    """
+
+    name: str
+    prefix: str
+    ttl: int | None
+    type: str
+
+    def key(self, *parts: Any) -> str:
+        return self.prefix + ":".join(str(part) for part in parts)
+
+
+REFRESH_TTL = config.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+
+# корзина: hash product_id -> quantity, числа хранятся компактно
+CART = KeySpace("cart", "cart:", config.CART_TTL, "hash")
+# ссылка подтверждения почты: uuid без дефисов -> email
+VERIFY = KeySpace("verify", "verify:", config.EMAIL_VERIFY_TTL, "string")
+PRINCIPAL = KeySpace(
+    "principal", "auth:principal:", config.AUTH_PRINCIPAL_TTL, "string"
+)
+REVOKED = KeySpace("revoked", "auth:revoked", None, "zset")
+REVOKED_BEFORE = KeySpace(
+    "revoked_before",
+    "auth:revoked_before:",
+    max(config.ACCESS_TOKEN_EXPIRE_MINUTES * 60, REFRESH_TTL),
+    "string",
+)
+# префиксы refresh токенов повторяются в скриптах core.tokens
+REFRESH = KeySpace("refresh", "auth:refresh:", REFRESH_TTL, "hash")
+REFRESH_FAMILY = KeySpace(
+    "refresh_family", "auth:refresh_family:", REFRESH_TTL, "string"
+)
+DB_PIN = KeySpace(
+    "db_pin", "db_pin:", config.DB_READ_YOUR_WRITES_WINDOW, "string"
+)
+# префиксы подсказок: suggest:v:<версия>:<префикс>, старые версии
+# удаляет пересборка; имена ключей повторяются в скриптах core.suggest
+SUGGEST = KeySpace("suggest", "suggest:v:", None, "zset")
+SUGGEST_VERSION = KeySpace(
+    "suggest_version", "suggest:version", None, "string"
+)
+SUGGEST_BUILDING = KeySpace(
+    "suggest_building",
+    "suggest:building",
+    config.SUGGEST_REBUILD_INTERVAL,
+    "string",
+)
+
+KEYSPACES = (
+    CART,
+    VERIFY,
+    PRINCIPAL,
+    REVOKED,
+    REVOKED_BEFORE,
+    REFRESH,
+    REFRESH_FAMILY,
+    DB_PIN,
+    SUGGEST,
+    SUGGEST_VERSION,
+    SUGGEST_BUILDING,
+)
+
+# ключи до пространств имен: корзина JSON-списком под id пользователя
+# и ссылка подтверждения под uuid, обе без TTL
+LEGACY_CART = re.compile(rb"\d+")
+LEGACY_VERIFY = re.compile(
+    rb"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+
+# Перенос старого ключа KEYS[1] в KEYS[2], если старый не изменился
+# после чтения (ARGV[1]). ARGV[2] - TTL, ARGV[3] - тип нового ключа,
+# дальше его значение. Существующий новый ключ новее и не
+# перезаписывается, старый удаляется в любом случае
+MIGRATE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 0 and #ARGV > 3 then
+    if ARGV[3] == 'hash' then
+        redis.call('HSET', KEYS[2], unpack(ARGV, 4))
+        redis.call('EXPIRE', KEYS[2], ARGV[2])
+    else
+        redis.call('SET', KEYS[2], ARGV[4], 'EX', ARGV[2])
+    end
+end
+redis.call('UNLINK', KEYS[1])
+return 1
+"""
+
+
+def keyspace(key: str) -> KeySpace | None:
+    """Пространство ключа по самому длинному подходящему префиксу"""
+    found = None
+    for space in KEYSPACES:
+        if key.startswith(space.prefix) and (
+            found is None or len(space.prefix) > len(found.prefix)
+        ):
+            found = space
+    return found
+
+
+@dataclass
+class NamespaceReport:
+    keys: int = 0
+    sampled: int = 0
+    memory: int = 0
+    no_ttl: int = 0
+    wrong_type: int = 0
+    encodings: Counter = field(default_factory=Counter)
+
+    @property
+    def estimated_memory(self) -> int:
+        """Память всех ключей по замеренной выборке"""
+        if not self.sampled:
+            return 0
+        return self.memory * self.keys // self.sampled
+
+
+class KeyScanner:
+    """
+    Обход базы через SCAN пачками по count ключей: тип и TTL каждого
+    ключа и MEMORY USAGE с OBJECT ENCODING для каждого every-го
+    запрашиваются одним pipeline на пачку, между пачками пауза pause
+    секунд, так что Redis не блокируется даже на большой базе
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        count: int = 500,
+        every: int = 10,
+        pause: float = 0.0,
+    ):
+        self.redis = client
+        self.count = count
+        self.every = every
+        self.pause = pause
+        self.migrate_script = client.register_script(MIGRATE_SCRIPT)
+
+    def batches(self) -> Iterator[list[bytes]]:
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.scan(cursor, count=self.count)
+            if keys:
+                yield keys
+            if not cursor:
+                return
+            if self.pause:
+                time.sleep(self.pause)
+
+    @staticmethod
+    def group(key: bytes) -> str:
+        space = keyspace(key.decode(errors="replace"))
+        if space is not None:
+            return space.name
+        if LEGACY_CART.fullmatch(key):
+            return "legacy_cart"
+        if LEGACY_VERIFY.fullmatch(key):
+            return "legacy_verify"
+        return "unknown"
+
+    def report(self) -> dict[str, NamespaceReport]:
+        result: dict[str, NamespaceReport] = {}
+        seen = 0
+        for keys in self.batches():
+            pipe = self.redis.pipeline(transaction=False)
+            sampled = set()
+            for key in keys:
+                pipe.type(key)
+                pipe.ttl(key)
+                if seen % self.every == 0:
+                    pipe.memory_usage(key)
+                    pipe.object("encoding", key)
+                    sampled.add(key)
+                seen += 1
+            values = iter(pipe.execute())
+            for key in keys:
+                stats = result.setdefault(self.group(key), NamespaceReport())
+                space = keyspace(key.decode(errors="replace"))
+                key_type, ttl = next(values).decode(), next(values)
+                stats.keys += 1
+                stats.no_ttl += ttl == -1
+                stats.wrong_type += (
+                    space is not None and key_type != space.type
+                )
+                if key in sampled:
+                    memory, encoding = next(values), next(values)
+                    stats.sampled += 1
+                    stats.memory += memory or 0
+                    if encoding is not None:
+                        stats.encodings[encoding.decode()] += 1
+        return result
+
+    def legacy(self, key: bytes, value: bytes) -> tuple[str, list[Any]]:
+        """Новый ключ и аргументы MIGRATE_SCRIPT для старого ключа"""
+        if self.group(key) == "legacy_verify":
+            new_key = VERIFY.key(key.decode().replace("-", ""))
+            return new_key, [value, VERIFY.ttl, "string", value]
+        cart: Counter = Counter()
+        for item in json.loads(value):
+            cart[int(item["product_id"])] += int(item["quantity"])
+        mapping = [
+            str(part)
+            for product_id, quantity in cart.items()
+            if quantity > 0
+            for part in (product_id, quantity)
+        ]
+        return CART.key(key.decode()), [value, CART.ttl, "hash", *mapping]
+
+    def migrate(self, dry_run: bool = False) -> Counter:
+        """
+        Перенос старых корзин и ссылок подтверждения в пространства
+        имен с TTL и TTL по политике для ключей пространств без него
+        """
+        result: Counter = Counter()
+        for keys in self.batches():
+            legacy = [
+                key
+                for key in keys
+                if self.group(key) in ("legacy_cart", "legacy_verify")
+            ]
+            spaces = [
+                (key, keyspace(key.decode(errors="replace"))) for key in keys
+            ]
+            expired = [
+                (key, space)
+                for key, space in spaces
+                if space is not None and space.ttl is not None
+            ]
+            pipe = self.redis.pipeline(transaction=False)
+            for key in legacy:
+                pipe.type(key)
+                pipe.get(key)
+            for key, _ in expired:
+                pipe.ttl(key)
+            values = iter(pipe.execute())
+            pipe = self.redis.pipeline(transaction=False)
+            for key in legacy:
+                key_type, value = next(values), next(values)
+                if key_type != b"string" or value is None:
+                    result["skipped"] += 1
+                    continue
+                try:
+                    new_key, args = self.legacy(key, value)
+                except (ValueError, TypeError, KeyError):
+                    result["skipped"] += 1
+                    continue
+                result[self.group(key)] += 1
+                if not dry_run:
+                    self.migrate_script(
+                        keys=[key, new_key], args=args, client=pipe
+                    )
+            for key, space in expired:
+                if next(values) == -1:
+                    result[f"{space.name}_ttl"] += 1
+                    if not dry_run:
+                        pipe.expire(key, space.ttl)
+            pipe.execute()
+        return result
+
+
+def main(args: argparse.Namespace) -> None:
+    client = redis.Redis.from_url(config.redis_url)
+    scanner = KeyScanner(client, args.count, args.every, args.pause)
+    if args.command == "migrate":
+        for name, count in sorted(scanner.migrate(args.dry_run).items()):
+            print(f"{name:<24}{count:>10}")
+        return
+    policies = {space.name: space.ttl for space in KEYSPACES}
+    print(
+        f"{'namespace':<16}{'ttl':>10}{'keys':>10}{'memory':>14}"
+        f"{'no ttl':>10}{'bad type':>10}  encodings"
+    )
+    for name, stats in sorted(scanner.report().items()):
+        encodings = ", ".join(
+            f"{encoding} {count}"
+            for encoding, count in stats.encodings.items()
+        )
+        print(
+            f"{name:<16}{str(policies.get(name, '-')):>10}"
+            f"{stats.keys:>10}{stats.estimated_memory:>14}"
+            f"{stats.no_ttl:>10}{stats.wrong_type:>10}  {encodings}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["report", "migrate"])
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--every", type=int, default=10)
+    parser.add_argument("--pause", type=float, default=0.0)
+    parser.add_argument("--dry-run", action="store_true")
+    main(parser.parse_args())
@@ -1,4 +1,7 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
 
 import bcrypt
 import jwt
@@ -6,11 +9,14 @@ from fastapi import HTTPException, status
 
 from core.dependency import AsyncSessionDependency
 from core.settings import config
+from core.tokens import now_ms
 from crud.users import UserCrud
 
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(
+        password.encode(), bcrypt.gensalt(config.PASSWORD_BCRYPT_ROUNDS)
+    ).decode()
 
 
 def check_password(
@@ -20,6 +26,68 @@ def check_password(
     return bcrypt.checkpw(password.encode(), hashed_password.encode())
 
 
+def needs_rehash(hashed_password: str) -> bool:
+    """Хэш создан с другой стоимостью: $2b$<стоимость>$..."""
+    return int(hashed_password.split("$")[2]) != config.PASSWORD_BCRYPT_ROUNDS
+
+
+class PasswordHasher:
+    """
+    bcrypt в отдельном пуле потоков: он отпускает GIL, поэтому не
+    блокирует цикл событий и считается параллельно. Задач в пуле
+    (считаются и ждут) не больше max_pending, сверх этого - 503: всплеск
+    входов не копит очередь, в которой растет задержка у всех
+    """
+
+    def __init__(
+        self,
+        workers: int = config.PASSWORD_HASH_WORKERS,
+        max_pending: int = config.PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="bcrypt"
+        )
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Too many password checks, retry later",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args
+            )
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self.run(check_password, password, hashed_password)
+
+
+password_hasher = PasswordHasher()
+
+
+async def rehash(session: AsyncSessionDependency, user, password: str):
+    """Пароль с устаревшей стоимостью перехэшируется при входе"""
+    try:
+        hashed_password = await password_hasher.hash(password)
+    except HTTPException:
+        return  # пул занят, перехэширование при следующем входе
+    await UserCrud(session).update_item(
+        {"id": user.id, "password": hashed_password}
+    )
+    await session.commit()
+    await session.refresh(user)
+
+
 async def auth(session: AsyncSessionDependency, email: str, password: str):
     user = await UserCrud(session).get_user(email)
     if not user:
@@ -28,10 +96,12 @@ async def auth(session: AsyncSessionDependency, email: str, password: str):
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST, "User is not verify with email"
         )
-    if not user or not check_password(password, user.password):
+    if not user or not await password_hasher.verify(password, user.password):
         raise HTTPException(
             status.HTTP_401_UNAUTHORIZED, "Incorrect password or username"
         )
+    if needs_rehash(user.password):
+        await rehash(session, user, password)
     return user
 
 
@@ -41,7 +111,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat в секундах с миллисекундами, как время отзыва в core.tokens
+    to_encode.update({"exp": expire, "iat": now_ms() / 1000})
     encoded_jwt = jwt.encode(
         to_encode, config.SECRET_KEY, algorithm=config.ALGORITHM
     )
@@ -13,12 +13,59 @@ class Config(BaseSettings):
     POSTGRES_DB: str = "db"
     DB_HOST: str = "localhost"
     DB_PORT: int = 5432
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_REPLICA_DSNS: list[str] = Field(default=[])
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = 2.0
+    DB_READ_YOUR_WRITES_WINDOW: int = 10
 
     SECRET_KEY: str = Field(default="")
     ALGORITHM: str = Field(default="")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 100
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    AUTH_PRINCIPAL_TTL: int = 60 * 5
+    AUTH_PRINCIPAL_LOCAL_TTL: int = 5
+    AUTH_PRINCIPAL_LOCAL_SIZE: int = 10_000
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
 
     REDIS_HOST: str = "localhost"
+    REDIS_MAX_CONNECTIONS: int = 100
+    CART_TTL: int = 60 * 60 * 24 * 7
+    EMAIL_VERIFY_TTL: int = 60 * 60 * 24 * 3
+    RESERVATION_TTL: int = 60 * 15
+    RESERVATION_SWEEP_INTERVAL: int = 60
+    RESERVATION_SWEEP_BATCH: int = 1000
+    IMPORT_CHUNK_SIZE: int = 1000
+    IMPORT_SPOOL_DIR: str = "/tmp/import_spool"
+    IMPORT_UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    IMPORT_MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024
+    IMPORT_MAX_ERRORS: int = 100
+    IMPORT_PROGRESS_INTERVAL: float = 2.0
+    CACHE_TTL: int = 60 * 60 * 6
+    CACHE_INVALIDATION_WINDOW: int = 60
+    CACHE_VERSION_TTL: int = 60 * 60 * 24 * 30
+    CACHE_SOFT_TTL: int = 60 * 5
+    CACHE_EARLY_EXPIRY_BETA: float = 1.0
+    CACHE_LOCK_TIMEOUT: float = 10.0
+    CACHE_LOCK_POLL: float = 0.05
+    CACHE_LOCAL_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_LOCAL_MAX_ITEM: int = 1024 * 1024
+    CACHE_LOCAL_TTL: int = 30
+    CACHE_CODEC: str = "zlib"
+    CACHE_COMPRESS_MIN_SIZE: int = 1024
+    CACHE_COMPRESS_LEVEL: int = 6
+    SUGGEST_MAX_PREFIX: int = 15
+    SUGGEST_MAX_CANDIDATES: int = 200
+    SUGGEST_REBUILD_INTERVAL: int = 60 * 60
+    SEARCH_MAX_CANDIDATES: int = 1000
 
     CORP_EMAIL: str = Field(default="")
     CORP_HOST: str = Field(default="")
@@ -0,0 +1,356 @@
+import itertools
+import time
+from operator import itemgetter
+from typing import Any, Iterable
+
+import redis
+import sqlalchemy as sa
+from redis import asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+from core.redis_keys import SUGGEST, SUGGEST_BUILDING, SUGGEST_VERSION
+from core.settings import config
+from models.products import category_product
+
+
+KEY_PREFIX = SUGGEST.prefix
+VERSION_KEY = SUGGEST_VERSION.key()
+BUILDING_KEY = SUGGEST_BUILDING.key()
+# индекс до версий: префиксы без версии и ключи его пересборки
+LEGACY_PATTERNS = ("suggest:p:*", "suggest:build:*")
+
+# Ключи префиксов текущей версии индекса и, пока идет пересборка,
+# собираемой: скрипты получают их из VERSION_KEY и BUILDING_KEY,
+# поэтому запись не теряется при переключении версии
+VERSIONS_LUA = """
+local current = redis.call('GET', 'suggest:version')
+local bases = {current and ('suggest:v:' .. current .. ':') or 'suggest:p:'}
+local building = redis.call('GET', 'suggest:building')
+if building then
+    table.insert(bases, 'suggest:v:' .. building .. ':')
+end
+"""
+
+# ARGV[1] - операция, дальше (префикс, member) для add и remove и
+# (префикс, member, количество) для incr
+WRITE_SCRIPT = (
+    VERSIONS_LUA
+    + """
+local op = ARGV[1]
+local step = op == 'incr' and 3 or 2
+for i = 2, #ARGV, step do
+    for _, base in ipairs(bases) do
+        local key = base .. ARGV[i]
+        if op == 'add' then
+            redis.call('ZADD', key, 'NX', 0, ARGV[i + 1])
+        elseif op == 'remove' then
+            redis.call('ZREM', key, ARGV[i + 1])
+        else
+            redis.call('ZINCRBY', key, ARGV[i + 2], ARGV[i + 1])
+        end
+    end
+end
+return #bases
+"""
+)
+
+# Первые ARGV[2] подсказок по префиксу ARGV[1] текущей версии
+SUGGEST_SCRIPT = """
+local current = redis.call('GET', 'suggest:version')
+local base = current and ('suggest:v:' .. current .. ':') or 'suggest:p:'
+return redis.call(
+    'ZREVRANGE', base .. ARGV[1], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES'
+)
+"""
+
+# Переключение на собранную версию ARGV[1], возвращает прежнюю
+SWITCH_SCRIPT = """
+local previous = redis.call('GET', 'suggest:version')
+redis.call('SET', 'suggest:version', ARGV[1])
+if redis.call('GET', 'suggest:building') == ARGV[1] then
+    redis.call('DEL', 'suggest:building')
+end
+return previous
+"""
+BATCH = 1000
+
+
+def session_suggest(session: Session | Any) -> list[tuple[str, str, str]]:
+    """
+    Изменения подсказок (операция, тип, текст), которые нужно записать
+    после коммита сессии (core.dependency.get_session)
+    """
+    return session.info.setdefault("suggest_pending", [])
+
+
+@event.listens_for(Session, "after_commit")
+def suggest_committed(session: Session) -> None:
+    session.info.setdefault("suggest", []).extend(
+        session.info.pop("suggest_pending", [])
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def suggest_rolled_back(session: Session) -> None:
+    """Изменения откаченной транзакции в индекс не попадают"""
+    session.info.pop("suggest_pending", None)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def word_tails(text: str) -> list[str]:
+    """Текст начиная с каждого слова: "smart tv 55" -> "tv 55", "55" """
+    words = text.split(" ")
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+
+def prefixes(text: str, max_length: int) -> set[str]:
+    """Префиксы до max_length символов от начала каждого слова"""
+    return {
+        tail[:length]
+        for tail in word_tails(normalize(text))
+        for length in range(1, min(len(tail), max_length) + 1)
+    }
+
+
+class SuggestIndex:
+    """
+    Префиксный индекс подсказок в Redis: на каждый префикс названия
+    товара или категории - sorted set "тип:текст" с популярностью
+    (количеством в заказах). Подсказка - один скрипт с ZREVRANGE по
+    префиксу текущей версии индекса. Методы записи собирают pipeline
+    и возвращают его execute(), для асинхронного клиента результат
+    нужно await
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis | aioredis.Redis,
+        max_prefix: int = config.SUGGEST_MAX_PREFIX,
+    ):
+        self.redis = client
+        self.max_prefix = max_prefix
+        self.suggest_script = client.register_script(SUGGEST_SCRIPT)
+        self.switch_script = client.register_script(SWITCH_SCRIPT)
+
+    @staticmethod
+    def member(kind: str, text: str) -> str:
+        return f"{kind}:{text}"
+
+    def write(self, op: str, items: Iterable[tuple[str, str, Any]]) -> Any:
+        pipe = self.redis.pipeline(transaction=False)
+        self.queue(pipe, op, items)
+        return pipe.execute()
+
+    def queue(
+        self, pipe: Any, op: str, items: Iterable[tuple[str, str, Any]]
+    ) -> None:
+        """
+        Запись (тип, текст, количество) во все префиксы текста: по
+        скрипту на BATCH аргументов в pipeline. EVAL, а не Script:
+        вызов Script у асинхронного клиента - корутина даже в pipeline,
+        а Redis все равно кэширует скрипт
+        """
+        args: list[Any] = []
+        for kind, text, amount in items:
+            for prefix in prefixes(text, self.max_prefix):
+                args += [prefix, self.member(kind, text)]
+                if op == "incr":
+                    args.append(amount)
+            if len(args) >= BATCH:
+                pipe.eval(WRITE_SCRIPT, 0, op, *args)
+                args = []
+        if args:
+            pipe.eval(WRITE_SCRIPT, 0, op, *args)
+
+    def publish(self, session: Any) -> Any:
+        """
+        Запись изменений закоммиченных транзакций сессии в порядке
+        внесения, одним pipeline
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for op, group in itertools.groupby(
+            session.info.pop("suggest", []), key=itemgetter(0)
+        ):
+            self.queue(pipe, op, [(kind, text, 0) for _, kind, text in group])
+        return pipe.execute()
+
+    def add(
+        self, products: Iterable[str] = (), categories: Iterable[str] = ()
+    ) -> Any:
+        """
+        Новые названия с нулевой популярностью, у уже известных
+        популярность сохраняется
+        """
+        return self.write(
+            "add",
+            [
+                *(("product", text, 0) for text in products),
+                *(("category", text, 0) for text in categories),
+            ],
+        )
+
+    def remove(
+        self, products: Iterable[str] = (), categories: Iterable[str] = ()
+    ) -> Any:
+        return self.write(
+            "remove",
+            [
+                *(("product", text, 0) for text in products),
+                *(("category", text, 0) for text in categories),
+            ],
+        )
+
+    def incr(
+        self,
+        products: dict[str, int] | None = None,
+        categories: dict[str, int] | None = None,
+    ) -> Any:
+        """Рост популярности на количество заказанного товара"""
+        return self.write(
+            "incr",
+            [
+                *(("product", *item) for item in (products or {}).items()),
+                *(("category", *item) for item in (categories or {}).items()),
+            ],
+        )
+
+    async def suggest(
+        self, prefix: str, limit: int
+    ) -> list[tuple[str, str, float]]:
+        """Самые популярные (тип, текст, популярность) по префиксу"""
+        prefix = normalize(prefix)
+        if len(prefix) <= self.max_prefix:
+            rows = await self.suggest_script(  # type: ignore[misc]
+                args=[prefix, limit]
+            )
+        else:
+            # индекс хранит префиксы до max_prefix символов, длинный
+            # префикс дочитывается из кандидатов по его началу
+            rows = await self.suggest_script(  # type: ignore[misc]
+                args=[
+                    prefix[: self.max_prefix],
+                    config.SUGGEST_MAX_CANDIDATES,
+                ]
+            )
+        result = []
+        for member, score in zip(rows[::2], rows[1::2]):
+            kind, text = member.decode().split(":", 1)
+            if len(prefix) > self.max_prefix and not any(
+                tail.startswith(prefix) for tail in word_tails(normalize(text))
+            ):
+                continue
+            result.append((kind, text, float(score)))
+        return result[:limit]
+
+    def drop(self, pattern: str) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for number, key in enumerate(
+            self.redis.scan_iter(match=pattern, count=BATCH), start=1
+        ):
+            pipe.unlink(key)
+            if number % BATCH == 0:
+                pipe.execute()
+        pipe.execute()
+
+    def drop_stale(self, keep: set[str]) -> None:
+        """
+        Удаление версий индекса, кроме keep: остатки пересборок,
+        прерванных без очистки (завершение процесса по SIGKILL, OOM)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for number, key in enumerate(
+            self.redis.scan_iter(match=f"{KEY_PREFIX}*", count=BATCH),
+            start=1,
+        ):
+            version = key.decode()[len(KEY_PREFIX) :].split(":", 1)[0]
+            if version not in keep:
+                pipe.unlink(key)
+            if number % BATCH == 0:
+                pipe.execute()
+        pipe.execute()
+
+    def rebuild(self, entries: Iterable[tuple[str, str, float]]) -> int:
+        """
+        Полная пересборка синхронным клиентом в новой версии индекса.
+        Пока она идет, add, remove и incr пишут и в текущую, и в
+        собираемую версию, популярность из БД прибавляется через
+        ZINCRBY, так что изменения во время пересборки не теряются.
+        Затем VERSION_KEY атомарно переключается на новую версию и
+        прежняя удаляется. Возвращает число префиксов, 0 - если уже
+        идет другая пересборка
+        """
+        version = str(time.time_ns())
+        if not self.redis.set(
+            BUILDING_KEY, version, nx=True, ex=SUGGEST_BUILDING.ttl
+        ):
+            return 0
+        current = self.redis.get(VERSION_KEY)
+        self.drop_stale({version} | ({current.decode()} if current else set()))
+        base = f"{KEY_PREFIX}{version}:"
+        keys: set[str] = set()
+        pipe = self.redis.pipeline(transaction=False)
+        try:
+            for number, (kind, text, score) in enumerate(entries, start=1):
+                for prefix in prefixes(text, self.max_prefix):
+                    pipe.zincrby(base + prefix, score, self.member(kind, text))
+                    keys.add(prefix)
+                if number % BATCH == 0:
+                    pipe.execute()
+            pipe.execute()
+            previous = self.switch_script(args=[version])
+        except BaseException:
+            self.redis.delete(BUILDING_KEY)
+            self.drop(f"{base}*")
+            raise
+        if previous is None:
+            for pattern in LEGACY_PATTERNS:
+                self.drop(pattern)
+        else:
+            self.drop(f"{KEY_PREFIX}{previous.decode()}:*")
+        return len(keys)
+
+
+def suggest_entries(session: Session) -> Iterable[tuple[str, str, float]]:
+    """
+    Названия активных товаров и категорий с популярностью - суммой
+    количества в неотмененных заказах
+    """
+    ordered = (
+        sa.select(
+            models.OrderList.product_id,
+            sa.func.sum(models.OrderList.quantity).label("quantity"),
+        )
+        .join(models.Order)
+        .where(models.Order.status != models.OrderStatus.CANCELED)
+        .group_by(models.OrderList.product_id)
+        .subquery()
+    )
+    quantity = sa.func.coalesce(  # pylint: disable=E1111
+        sa.func.sum(ordered.c.quantity), 0
+    )
+    products = (
+        sa.select(models.Product.name, quantity)
+        .outerjoin(ordered, ordered.c.product_id == models.Product.id)
+        .where(models.Product.active)
+        .group_by(models.Product.name)
+    )
+    for name, score in session.execute(products).yield_per(BATCH):
+        yield "product", name, score
+    categories = (
+        sa.select(models.Category.title, quantity)
+        .outerjoin(
+            category_product,
+            category_product.c.category_id == models.Category.id,
+        )
+        .outerjoin(
+            ordered, ordered.c.product_id == category_product.c.product_id
+        )
+        .group_by(models.Category.title)
+    )
+    for title, score in session.execute(categories).yield_per(BATCH):
+        yield "category", title, score
@@ -0,0 +1,202 @@
+import hashlib
+import secrets
+import time
+from typing import Any
+
+import jwt
+import redis
+from fastapi import HTTPException, status
+from jwt.exceptions import InvalidTokenError
+from redis import asyncio as aioredis
+
+from core.local_cache import LocalCache
+from core.redis_cli import async_redis_client
+from core.redis_keys import REFRESH, REFRESH_FAMILY, REVOKED, REVOKED_BEFORE
+from core.settings import config
+
+
+REVOKED_KEY = REVOKED.key()
+REVOKED_BEFORE_PREFIX = REVOKED_BEFORE.prefix
+REFRESH_PREFIX = REFRESH.prefix
+FAMILY_PREFIX = REFRESH_FAMILY.prefix
+
+# Ротация refresh токена KEYS[1] на KEYS[2] (ARGV[1] и ARGV[2] - их
+# хэши, ARGV[3] - время жизни). Действителен только последний токен
+# семейства (цепочки токенов от одного входа), выданного позже
+# отзыва всех токенов пользователя (в миллисекундах). Повторное
+# предъявление старого токена - признак кражи: семейство удаляется
+# целиком. Возвращает {1, sub} при ротации, {0, sub} при отказе,
+# false для неизвестного токена
+ROTATE_SCRIPT = """
+local sub, family, issued = unpack(
+    redis.call('HMGET', KEYS[1], 'sub', 'family', 'issued')
+)
+if not sub then
+    return false
+end
+local family_key = 'auth:refresh_family:' .. family
+local current = redis.call('GET', family_key)
+local revoked_before = redis.call('GET', 'auth:revoked_before:' .. sub)
+if current ~= ARGV[1]
+    or (revoked_before and tonumber(issued) <= tonumber(revoked_before)) then
+    if current then
+        redis.call('DEL', family_key, 'auth:refresh:' .. current)
+    end
+    return {0, sub}
+end
+redis.call('HSET', KEYS[2], 'sub', sub, 'family', family, 'issued', issued)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('SET', family_key, ARGV[2], 'EX', ARGV[3])
+return {1, sub}
+"""
+
+# Отзыв семейства refresh токена KEYS[1]
+REVOKE_FAMILY_SCRIPT = """
+local family = redis.call('HGET', KEYS[1], 'family')
+if not family then
+    return 0
+end
+local family_key = 'auth:refresh_family:' .. family
+local current = redis.call('GET', family_key)
+if current then
+    redis.call('DEL', 'auth:refresh:' .. current)
+end
+return redis.call('DEL', family_key)
+"""
+
+
+class RevokedTokenError(InvalidTokenError):
+    pass
+
+
+def now_ms() -> int:
+    """
+    Время в миллисекундах для iat, выдачи refresh токенов и отзыва:
+    с точностью до секунды токен, выданный в ту же секунду до смены
+    пароля, не отзывался бы
+    """
+    return time.time_ns() // 1_000_000
+
+
+class TokenVerifier:
+    """
+    Проверка JWT с кэшем: подпись проверяется один раз, дальше claims
+    берутся из LRU по хэшу токена до его exp. Отзыв проверяется в Redis
+    на каждый запрос, поэтому выход и смена пароля действуют сразу:
+    отозванные токены - sorted set с exp в score (устаревшие удаляются
+    при отзыве), отзыв всех токенов пользователя - время в
+    миллисекундах, до которого (включительно) выданные токены (iat)
+    недействительны
+    """
+
+    def __init__(self, client: redis.Redis | aioredis.Redis):
+        self.redis = client
+        # размер записи - 1, max_bytes ограничивает число токенов
+        self.local = LocalCache(config.AUTH_TOKEN_CACHE_SIZE, 1)
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def decode(self, token: str) -> dict[str, Any]:
+        digest = self.digest(token)
+        claims = self.local.get(digest)
+        if claims is None:
+            claims = jwt.decode(
+                token, config.SECRET_KEY, algorithms=[config.ALGORITHM]
+            )
+            self.local.set(digest, claims, 1, claims["exp"] - time.time())
+        return claims
+
+    async def verify(self, token: str) -> dict[str, Any]:
+        """Claims проверенного и не отозванного токена"""
+        claims = self.decode(token)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zscore(REVOKED_KEY, self.digest(token))
+        pipe.get(REVOKED_BEFORE_PREFIX + str(claims.get("sub")))
+        revoked, revoked_before = await pipe.execute()  # type: ignore[misc]
+        if revoked is not None or (
+            revoked_before is not None
+            and round(claims.get("iat", 0) * 1000) <= int(revoked_before)
+        ):
+            raise RevokedTokenError("Token is revoked")
+        return claims
+
+    def revoke(self, token: str) -> Any:
+        """Отзыв одного токена до его exp"""
+        claims = jwt.decode(token, options={"verify_signature": False})
+        digest = self.digest(token)
+        self.local.pop(digest)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(REVOKED_KEY, {digest: claims["exp"]})
+        pipe.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        return pipe.execute()
+
+    def revoke_subject(self, subject: str) -> Any:
+        """Отзыв всех токенов, выданных пользователю до этого момента"""
+        return self.redis.set(
+            REVOKED_BEFORE_PREFIX + subject,
+            now_ms(),
+            ex=REVOKED_BEFORE.ttl,
+        )
+
+
+class RefreshTokens:
+    """
+    Refresh токены: случайные строки, в Redis хранится только их хэш с
+    email пользователя. Обновление - один вызов скрипта без БД и bcrypt,
+    каждый токен одноразовый и заменяется новым на
+    REFRESH_TOKEN_EXPIRE_DAYS дней
+    """
+
+    def __init__(self, client: redis.Redis | aioredis.Redis):
+        self.redis = client
+        self.ttl = REFRESH.ttl
+        self.rotate_script = client.register_script(ROTATE_SCRIPT)
+        self.revoke_script = client.register_script(REVOKE_FAMILY_SCRIPT)
+
+    @staticmethod
+    def key(token: str) -> str:
+        return REFRESH_PREFIX + TokenVerifier.digest(token)
+
+    async def create(self, subject: str) -> str:
+        """Первый токен нового семейства, после входа по паролю"""
+        token = secrets.token_urlsafe(32)
+        digest = TokenVerifier.digest(token)
+        family = secrets.token_hex(16)
+        pipe = self.redis.pipeline()
+        pipe.hset(
+            REFRESH_PREFIX + digest,
+            mapping={
+                "sub": subject,
+                "family": family,
+                "issued": now_ms(),
+            },
+        )
+        pipe.expire(REFRESH_PREFIX + digest, self.ttl)
+        pipe.set(FAMILY_PREFIX + family, digest, ex=self.ttl)
+        await pipe.execute()  # type: ignore[misc]
+        return token
+
+    async def rotate(self, token: str) -> tuple[str, str]:
+        """Новый refresh токен и email пользователя вместо старого токена"""
+        new_token = secrets.token_urlsafe(32)
+        new_digest = TokenVerifier.digest(new_token)
+        result = await self.rotate_script(  # type: ignore[misc]
+            keys=[self.key(token), REFRESH_PREFIX + new_digest],
+            args=[TokenVerifier.digest(token), new_digest, self.ttl],
+        )
+        if not result or not result[0]:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token",
+            )
+        return new_token, result[1].decode()
+
+    def revoke(self, token: str) -> Any:
+        """Отзыв всего семейства токена"""
+        return self.revoke_script(keys=[self.key(token)])
+
+
+token_verifier = TokenVerifier(async_redis_client)
+refresh_tokens = RefreshTokens(async_redis_client)
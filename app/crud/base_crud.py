@@ -5,6 +5,8 @@ from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.redis_cache import entity_tags, session_tags
+from crud.loaders import profile_options
 from models import TypeModel
 
 
@@ -13,13 +15,26 @@ class BaseCrud:
         self.session = session
         self.model: TypeModel
 
+    def invalidate(self, *ids: Any) -> None:
+        """
+        Сброс кэша ответов с записями модели, теги сбрасываются после
+        коммита (core.dependency.get_session)
+        """
+        table = self.model.__tablename__
+        session_tags(self.session).update({table, *entity_tags(table, ids)})
+
     async def create_item(self, data: dict[str, Any]):
         stmt = sa.insert(self.model).returning(self.model).values(**data)
         response = await self.session.scalar(stmt)
+        self.invalidate(response.id)
         return response
 
-    async def get_items(self):
-        stmt = sa.select(self.model)
+    def select(self, profile: str | None = None) -> sa.Select:
+        """select модели с опциями загрузки связей из профиля"""
+        return sa.select(self.model).options(*profile_options(profile))
+
+    async def get_items(self, profile: str | None = None):
+        stmt = self.select(profile)
         response = await self.session.scalars(stmt)
         return response.unique().all()
 
@@ -32,14 +47,16 @@ class BaseCrud:
             .returning(self.model)
         )
         response = await self.session.scalar(stmt)
+        self.invalidate(item_id)
         return response
 
     async def delete_item(self, item_id: int):
         stmt = sa.delete(self.model).where(self.model.id == item_id)
         await self.session.execute(stmt)
+        self.invalidate(item_id)
 
-    async def get_item_id(self, item_id: int):
-        stmt = sa.select(self.model).where(self.model.id == item_id)
+    async def get_item_id(self, item_id: int, profile: str | None = None):
+        stmt = self.select(profile).where(self.model.id == item_id)
         response = await self.session.scalar(stmt)
         if response is None:
             raise HTTPException(
@@ -47,13 +64,17 @@ class BaseCrud:
             )
         return response
 
-    async def get_user_items(self, user_id: int) -> Sequence[TypeModel]:
-        stmt = sa.select(self.model).where(self.model.user_id == user_id)
+    async def get_user_items(
+        self, user_id: int, profile: str | None = None
+    ) -> Sequence[TypeModel]:
+        stmt = self.select(profile).where(self.model.user_id == user_id)
         result = await self.session.scalars(stmt)
         return result.unique().all()
 
-    async def check_owner(self, item_id: int, user_id: int):
-        result = await self.get_item_id(item_id)
+    async def check_owner(
+        self, item_id: int, user_id: int, profile: str | None = None
+    ):
+        result = await self.get_item_id(item_id, profile)
         if result.user_id != user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,83 @@
+from typing import Any
+
+from redis import asyncio as aioredis
+
+from core.redis_keys import CART
+
+
+# Изменение количества товара в корзине за один запрос к Redis:
+# quantity=0 удаляет товар, иначе количество прибавляется.
+# Возвращает корзину целиком после изменения
+ADD_ITEM_SCRIPT = """
+local quantity = tonumber(ARGV[2])
+if quantity == 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HINCRBY', KEYS[1], ARGV[1], quantity)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+
+class CartCrud:
+    """Корзина пользователя в Redis: hash product_id -> quantity"""
+
+    def __init__(self, redis: aioredis.Redis):
+        self.redis = redis
+        self.add_item_script = redis.register_script(ADD_ITEM_SCRIPT)
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return CART.key(user_id)
+
+    @staticmethod
+    def to_orderlist(cart: dict | list) -> list[dict[str, Any]]:
+        if isinstance(cart, list):
+            cart = dict(zip(cart[::2], cart[1::2]))
+        return [
+            {"product_id": int(product_id), "quantity": int(quantity)}
+            for product_id, quantity in cart.items()
+        ]
+
+    async def get_items(self, user_id: int) -> list[dict[str, Any]]:
+        cart = await self.redis.hgetall(self.key(user_id))
+        return self.to_orderlist(cart)
+
+    async def add_item(
+        self, user_id: int, order_product: dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        """
+        Добавление товара в корзину, количество суммируется на стороне
+        Redis, при quantity=0 товар удаляется
+        """
+        cart = await self.add_item_script(
+            keys=[self.key(user_id)],
+            args=[
+                order_product["product_id"],
+                order_product["quantity"],
+                CART.ttl,
+            ],
+        )
+        return self.to_orderlist(cart)
+
+    async def set_items(
+        self, user_id: int, orderlist: list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """Замена всей корзины, товары с quantity=0 не сохраняются"""
+        cart = {
+            order["product_id"]: order["quantity"]
+            for order in orderlist
+            if order["quantity"] != 0
+        }
+        key = self.key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if cart:
+                pipe.hset(key, mapping=cart)
+                pipe.expire(key, CART.ttl)
+            await pipe.execute()
+        return self.to_orderlist(cart)
+
+    async def clear(self, user_id: int) -> None:
+        await self.redis.delete(self.key(user_id))
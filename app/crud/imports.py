@@ -0,0 +1,36 @@
+import sqlalchemy as sa
+from fastapi import HTTPException, status
+
+import models
+from crud.base_crud import BaseCrud
+
+
+class ImportJobCrud(BaseCrud):
+    def __init__(self, session):
+        super().__init__(session)
+        self.model = models.ImportJob
+
+    async def cancel(self, job_id: int, user_id: int) -> models.ImportJob:
+        """
+        Запрос отмены загрузки. Воркер проверяет флаг между пачками,
+        уже загруженные пачки остаются в каталоге
+        """
+        await self.check_owner(job_id, user_id)
+        stmt = (
+            sa.update(self.model)
+            .where(
+                (self.model.id == job_id)
+                & self.model.status.in_(
+                    [models.ImportStatus.PENDING, models.ImportStatus.RUNNING]
+                )
+            )
+            .values(cancel_requested=True)
+            .returning(self.model)
+        )
+        job = await self.session.scalar(stmt)
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Import is already finished",
+            )
+        return job
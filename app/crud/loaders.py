@@ -0,0 +1,47 @@
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
+
+import models
+
+
+def product_card() -> tuple[ORMOption, ...]:
+    """Товар со связями из ProductsResponse"""
+    return (
+        joinedload(models.Product.shop),
+        selectinload(models.Product.categories),
+        selectinload(models.Product.parametrs),
+    )
+
+
+# Все связи моделей объявлены с lazy="raise": запрос загружает только
+# то, что перечислено в профиле, обращение к другим связям - ошибка
+PROFILES: dict[str, tuple[ORMOption, ...]] = {
+    "product_shop": (joinedload(models.Product.shop),),
+    "product_card": product_card(),
+    "shop_card": (joinedload(models.Shop.user).load_only(models.User.id),),
+    "shop_detail": (
+        joinedload(models.Shop.user).load_only(models.User.id),
+        selectinload(models.Shop.products).options(
+            selectinload(models.Product.categories),
+            selectinload(models.Product.parametrs),
+        ),
+    ),
+    "order_summary": (
+        joinedload(models.Order.address),
+        joinedload(models.Order.user).load_only(models.User.email),
+        selectinload(models.Order.orderlist)
+        .selectinload(models.OrderList.product)
+        .options(*product_card()),
+    ),
+    "auth_principal": (joinedload(models.User.shop),),
+    "user_detail": (
+        joinedload(models.User.shop),
+        selectinload(models.User.addresses),
+    ),
+}
+
+
+def profile_options(profile: str | None) -> tuple[ORMOption, ...]:
+    if profile is None:
+        return ()
+    return PROFILES[profile]
@@ -1,8 +1,14 @@
+import datetime
 from typing import Any, Sequence
 
 import sqlalchemy as sa
+from fastapi import HTTPException, status
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 
 import models
+from core.redis_cache import entity_tags, session_tags
+from core.settings import config
 from crud.base_crud import BaseCrud
 
 
@@ -12,12 +18,99 @@ class OrderCrud(BaseCrud):
         self.model = models.Order
 
     async def get_order_status(
-        self, order_status: models.OrderStatus
+        self, order_status: models.OrderStatus, profile: str | None = None
     ) -> Sequence[models.Order]:
-        stmt = sa.select(self.model).where(self.model.status == order_status)
+        stmt = self.select(profile).where(self.model.status == order_status)
         order = await self.session.scalars(stmt)
         return order.unique().all()
 
+    async def create_order(
+        self, data: dict[str, Any], orderlist: list[dict[str, Any]]
+    ) -> int:
+        """
+        Оформление заказа в одной транзакции: строки товаров блокируются
+        в порядке id, резервы пользователя на эти товары переводятся в
+        списание, остатки проверяются и списываются одним UPDATE,
+        заказ и его состав вставляются по одному запросу. Товары, снятые
+        с продажи после добавления в корзину, не найдутся. При нехватке
+        товара транзакция откатывается
+        """
+        quantities = {
+            order["product_id"]: order["quantity"] for order in orderlist
+        }
+        product = models.Product
+        stmt_lock = (
+            sa.select(product.id, product.remainder - product.reserved)
+            .where(product.id.in_(quantities), product.active)
+            .order_by(product.id)
+            .with_for_update()
+        )
+        available = dict((await self.session.execute(stmt_lock)).all())
+        if len(available) != len(quantities):
+            await self.session.rollback()
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Product not found")
+        held = await ReservationCrud(self.session).pop_holds(
+            data["user_id"], list(quantities)
+        )
+        if any(
+            available[product_id] + held.get(product_id, 0) < quantity
+            for product_id, quantity in quantities.items()
+        ):
+            await self.session.rollback()
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, "Product quantity exceeded"
+            )
+        values = sa.values(
+            sa.column("id", sa.Integer),
+            sa.column("quantity", sa.Integer),
+            sa.column("held", sa.Integer),
+            name="quantities",
+        ).data(
+            [
+                (product_id, quantity, held.get(product_id, 0))
+                for product_id, quantity in sorted(quantities.items())
+            ]
+        )
+        stmt_remainder = (
+            sa.update(product)
+            .where(product.id == values.c.id)
+            .values(
+                remainder=product.remainder - values.c.quantity,
+                reserved=product.reserved - values.c.held,
+            )
+        )
+        stmt_order = (
+            sa.insert(self.model).values(**data).returning(self.model.id)
+        )
+        try:
+            await self.session.execute(stmt_remainder)
+            order_id = await self.session.scalar(stmt_order)
+            await self.session.execute(
+                sa.insert(models.OrderList).values(
+                    [
+                        {
+                            "order_id": order_id,
+                            "product_id": product_id,
+                            "quantity": quantity,
+                        }
+                        for product_id, quantity in quantities.items()
+                    ]
+                )
+            )
+            self.invalidate(order_id)
+            session_tags(self.session).update(
+                entity_tags("product", quantities)
+            )
+            await self.session.commit()
+        except IntegrityError as error:
+            await self.session.rollback()
+            if error.orig is not None and "remainder" in error.orig.args[0]:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST, "Product quantity exceeded"
+                ) from error
+            raise error
+        return order_id  # type: ignore[return-value]
+
     # async def get_yours_order(self, user_id: int) -> Sequence[models.Order]:
     #     stmt = sa.select(self.model).where(self.model.user_id == user_id)
     #     orders = await self.session.scalars(stmt)
@@ -32,3 +125,104 @@ class OrderlistCrud(BaseCrud):
     async def create_orderlist(self, orderlist: list[dict[str, Any]]) -> None:
         stmt = sa.insert(self.model).values(orderlist)
         await self.session.execute(stmt)
+
+
+class ReservationCrud(BaseCrud):
+    """
+    Временные резервы товаров в корзине. Сумма активных резервов
+    хранится в Product.reserved, доступный остаток - remainder - reserved
+    """
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.model = models.Reservation
+
+    async def hold(self, user_id: int, product_id: int, quantity: int) -> None:
+        """Резерв товара или увеличение существующего резерва"""
+        product = models.Product
+        stmt_product = (
+            sa.update(product)
+            .where(
+                (product.id == product_id)
+                & (product.remainder - product.reserved >= quantity)
+            )
+            .values(reserved=product.reserved + quantity)
+            .returning(product.id)
+        )
+        if await self.session.scalar(stmt_product) is None:
+            await self.session.rollback()
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, "Product quantity exceeded"
+            )
+        expires_at = sa.func.now() + datetime.timedelta(
+            seconds=config.RESERVATION_TTL
+        )
+        stmt = insert(self.model).values(
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=expires_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.user_id, self.model.product_id],
+            set_={
+                "quantity": self.model.quantity + stmt.excluded.quantity,
+                "expires_at": stmt.excluded.expires_at,
+            },
+        )
+        await self.session.execute(stmt)
+        session_tags(self.session).add(f"product:{product_id}")
+
+    async def pop_holds(
+        self, user_id: int, products_id: list[int] | None = None
+    ) -> dict[int, int]:
+        """
+        Удаление резервов пользователя, возвращает product_id -> quantity.
+        Product.reserved не меняется, это делает вызывающий код
+        """
+        stmt = sa.delete(self.model).where(self.model.user_id == user_id)
+        if products_id is not None:
+            stmt = stmt.where(self.model.product_id.in_(products_id))
+        result = await self.session.execute(
+            stmt.returning(self.model.product_id, self.model.quantity)
+        )
+        return dict(result.all())  # type: ignore[arg-type]
+
+    async def release(
+        self, user_id: int, products_id: list[int] | None = None
+    ) -> None:
+        """
+        Снятие резервов пользователя с возвратом товара в доступные.
+        Как и при оформлении заказа, сначала в порядке id блокируются
+        строки товаров, потом удаляются резервы, иначе встречные
+        транзакции ждут друг друга по кругу
+        """
+        product = models.Product
+        stmt_held = sa.select(self.model.product_id).where(
+            self.model.user_id == user_id
+        )
+        if products_id is not None:
+            stmt_held = stmt_held.where(self.model.product_id.in_(products_id))
+        stmt_lock = (
+            sa.select(product.id)
+            .where(product.id.in_(stmt_held))
+            .order_by(product.id)
+            .with_for_update(of=product)
+        )
+        locked = (await self.session.scalars(stmt_lock)).all()
+        if not locked:
+            return
+        held = await self.pop_holds(user_id, list(locked))
+        if not held:
+            return
+        values = sa.values(
+            sa.column("id", sa.Integer),
+            sa.column("held", sa.Integer),
+            name="holds",
+        ).data(sorted(held.items()))
+        await self.session.execute(
+            sa.update(product)
+            .where(product.id == values.c.id)
+            .values(reserved=product.reserved - values.c.held)
+        )
+        session_tags(self.session).update(entity_tags("product", held))
@@ -1,9 +1,17 @@
-from typing import Any, Sequence
+from decimal import Decimal, InvalidOperation
+from typing import Any, Iterable, Sequence
 
 import sqlalchemy as sa
+from fastapi import HTTPException, status
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import aliased
 
 import models
+from core.redis_cache import entity_tags, session_tags
+from core.settings import config
+from core.suggest import session_suggest
 from crud.base_crud import BaseCrud, BaseCrudRestrict
+from models.products import category_product
 
 
 class ProductCrud(BaseCrud):
@@ -11,12 +19,297 @@ class ProductCrud(BaseCrud):
         super().__init__(session)
         self.model = models.Product
 
+    async def create_item(self, data: dict[str, Any]):
+        product = await super().create_item(data)
+        session_tags(self.session).add(f"shop:{data['shop_id']}")
+        session_suggest(self.session).append(("add", "product", data["name"]))
+        return product
+
+    async def update_item(self, data: dict[str, Any]):
+        if "name" not in data:
+            return await super().update_item(data)
+        old_name = await self.session.scalar(
+            sa.select(self.model.name).where(self.model.id == data["id"])
+        )
+        product = await super().update_item(data)
+        session_suggest(self.session).append(("add", "product", data["name"]))
+        await self.remove_suggest(old_name)
+        return product
+
+    async def delete_item(self, item_id: int):
+        name = await self.session.scalar(
+            sa.select(self.model.name).where(self.model.id == item_id)
+        )
+        await super().delete_item(item_id)
+        await self.remove_suggest(name)
+
+    async def remove_suggest(self, name: str | None) -> None:
+        """Убирает название из подсказок, если других товаров с ним нет"""
+        if name is None:
+            return
+        stmt = sa.select(
+            sa.exists().where((self.model.name == name) & self.model.active)
+        )
+        if not await self.session.scalar(stmt):
+            session_suggest(self.session).append(("remove", "product", name))
+
+    async def get_items(self, profile: str | None = None):
+        stmt = self.select(profile).where(self.model.active)
+        response = await self.session.scalars(stmt)
+        return response.unique().all()
+
+    def filter_products(  # pylint: disable=R0913
+        self,
+        stmt: sa.Select,
+        *,
+        shop_id: int | None = None,
+        category_id: int | None = None,
+        price_min: Decimal | None = None,
+        price_max: Decimal | None = None,
+        in_stock: bool = False,
+        parametrs: dict[int, list[str]] | None = None,
+        ranges: dict[int, tuple[Decimal | None, Decimal | None]] | None = None,
+    ) -> sa.Select:
+        """
+        Фильтры каталога. parametrs - допустимые значения параметров
+        (любое из значений, все параметры сразу), ranges - границы
+        числовых значений параметров
+        """
+        if shop_id is not None:
+            stmt = stmt.where(self.model.shop_id == shop_id)
+        if category_id is not None:
+            stmt = stmt.join(
+                category_product,
+                (category_product.c.product_id == self.model.id)
+                & (category_product.c.category_id == category_id),
+            )
+        if price_min is not None:
+            stmt = stmt.where(self.model.price >= price_min)
+        if price_max is not None:
+            stmt = stmt.where(self.model.price <= price_max)
+        if in_stock:
+            stmt = stmt.where(self.model.remainder > self.model.reserved)
+        # у каждого условия свой alias: фильтры работают и в подзапросе
+        # фасетов, где внешний запрос тоже идет по parametrproduct
+        for parametr_id, values in (parametrs or {}).items():
+            parametr = aliased(models.ParametrProduct)
+            stmt = stmt.where(
+                sa.exists().where(
+                    (parametr.product_id == self.model.id)
+                    & (parametr.parametr_id == parametr_id)
+                    & parametr.value.in_(values)
+                )
+            )
+        for parametr_id, (low, high) in (ranges or {}).items():
+            parametr = aliased(models.ParametrProduct)
+            condition = (parametr.product_id == self.model.id) & (
+                parametr.parametr_id == parametr_id
+            )
+            if low is not None:
+                condition &= parametr.value_number >= low
+            if high is not None:
+                condition &= parametr.value_number <= high
+            stmt = stmt.where(sa.exists().where(condition))
+        return stmt
+
+    async def get_page(
+        self,
+        limit: int,
+        sort: str = "id",
+        cursor: list[Any] | None = None,
+        **filters: Any,
+    ) -> tuple[Sequence[models.Product], list[Any] | None]:
+        """
+        Страница активных товаров с пагинацией по ключу (поле сортировки,
+        id): следующая страница начинается после последнего товара
+        предыдущей, поэтому скорость не зависит от глубины. Возвращает
+        товары и ключ для следующей страницы
+        """
+        descending = sort.startswith("-")
+        sort_column = getattr(self.model, sort.removeprefix("-"))
+        keys = [sort_column, self.model.id]
+        if sort_column is self.model.id:
+            keys = [self.model.id]
+        stmt = self.filter_products(
+            self.select("product_card").where(self.model.active), **filters
+        )
+        if cursor is not None:
+            try:
+                values = [
+                    key.type.python_type(value)
+                    for key, value in zip(keys, cursor, strict=True)
+                ]
+            except (ValueError, TypeError, InvalidOperation) as error:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor",
+                ) from error
+            row_key, cursor_key = sa.tuple_(*keys), sa.tuple_(*values)
+            stmt = stmt.where(
+                row_key < cursor_key if descending else row_key > cursor_key
+            )
+        stmt = stmt.order_by(
+            *(key.desc() if descending else key.asc() for key in keys)
+        ).limit(limit + 1)
+        products = (await self.session.scalars(stmt)).unique().all()
+        if len(products) <= limit:
+            return products, None
+        last = products[limit - 1]
+        return products[:limit], [getattr(last, key.key) for key in keys]
+
+    async def search(
+        self, query: str, limit: int, cursor: list[Any] | None = None
+    ) -> tuple[list[models.Product], list[Any] | None]:
+        """
+        Поиск активных товаров: полнотекстовый по search_vector и
+        триграммный по названию для запросов с опечатками. Оба условия
+        идут по GIN-индексам, страницы - по ключу (релевантность, id).
+        Ранжируются только первые SEARCH_MAX_CANDIDATES найденных
+        товаров, иначе частое слово считает ранг десяткам тысяч строк
+        """
+        ts_query = sa.func.websearch_to_tsquery(
+            sa.cast(models.SEARCH_CONFIG, REGCONFIG), query
+        )
+        candidates = (
+            sa.select(self.model.id, self.model.name, self.model.search_vector)
+            .where(
+                self.model.active
+                & (
+                    self.model.search_vector.bool_op("@@")(ts_query)
+                    | sa.literal(query).bool_op("<%")(self.model.name)
+                )
+            )
+            .limit(config.SEARCH_MAX_CANDIDATES)
+            .subquery()
+        )
+        score = sa.cast(
+            sa.func.ts_rank_cd(candidates.c.search_vector, ts_query)
+            + sa.func.word_similarity(query, candidates.c.name),
+            sa.Float,
+        )
+        matches = sa.select(candidates.c.id, score.label("score")).subquery()
+        stmt = sa.select(matches.c.id, matches.c.score)
+        if cursor is not None:
+            try:
+                cursor_key = sa.tuple_(float(cursor[0]), int(cursor[1]))
+            except (ValueError, TypeError, IndexError) as error:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor",
+                ) from error
+            stmt = stmt.where(
+                sa.tuple_(matches.c.score, matches.c.id) < cursor_key
+            )
+        stmt = stmt.order_by(matches.c.score.desc(), matches.c.id.desc())
+        rows = (await self.session.execute(stmt.limit(limit + 1))).all()
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = list(rows[-1])
+        products = {
+            product.id: product
+            for product in await self.get_products_id(
+                [row.id for row in rows], "product_card"
+            )
+        }
+        return [products[row.id] for row in rows], next_key
+
+    async def get_facets(
+        self, values_limit: int, **filters: Any
+    ) -> list[dict[str, Any]]:
+        """
+        Фасеты для товаров по фильтрам: по каждому параметру самые частые
+        значения с числом товаров и границы числовых значений. Без
+        фильтров счетчики берутся из индекса фасетов parametr_facet,
+        с фильтрами - считаются только по найденным товарам
+        """
+        if any(filters.values()):
+            products = self.filter_products(
+                sa.select(self.model.id).where(self.model.active), **filters
+            )
+            parametr = models.ParametrProduct
+            counts = (
+                sa.select(
+                    parametr.parametr_id,
+                    parametr.value,
+                    parametr.value_number,
+                    sa.func.count().label("product_count"),
+                )
+                .where(parametr.product_id.in_(products))
+                .group_by(
+                    parametr.parametr_id, parametr.value, parametr.value_number
+                )
+            )
+        else:
+            facet = models.ParametrFacet
+            counts = sa.select(
+                facet.parametr_id,
+                facet.value,
+                facet.value_number,
+                facet.product_count,
+            ).where(facet.product_count > 0)
+        counts_subquery = counts.subquery()
+        ranked = sa.select(
+            counts_subquery,
+            sa.func.row_number()
+            .over(
+                partition_by=counts_subquery.c.parametr_id,
+                order_by=(
+                    counts_subquery.c.product_count.desc(),
+                    counts_subquery.c.value,
+                ),
+            )
+            .label("rank"),
+            sa.func.min(counts_subquery.c.value_number)
+            .over(partition_by=counts_subquery.c.parametr_id)
+            .label("min"),
+            sa.func.max(counts_subquery.c.value_number)
+            .over(partition_by=counts_subquery.c.parametr_id)
+            .label("max"),
+        ).subquery()
+        stmt = (
+            sa.select(ranked, models.Parametr.name)
+            .join(models.Parametr, models.Parametr.id == ranked.c.parametr_id)
+            .where(ranked.c.rank <= values_limit)
+            .order_by(models.Parametr.name, ranked.c.rank)
+        )
+        facets: dict[int, dict[str, Any]] = {}
+        for row in await self.session.execute(stmt):
+            facet_data = facets.setdefault(
+                row.parametr_id,
+                {
+                    "parametr_id": row.parametr_id,
+                    "name": row.name,
+                    "values": [],
+                    "min": row.min,
+                    "max": row.max,
+                },
+            )
+            facet_data["values"].append(
+                {"value": row.value, "count": row.product_count}
+            )
+        return list(facets.values())
+
+    async def get_products_id(
+        self, products_id: list[int], profile: str | None = None
+    ) -> Sequence[models.Product]:
+        stmt = self.select(profile).where(self.model.id.in_(products_id))
+        products = await self.session.scalars(stmt)
+        return products.unique().all()
+
 
 class CategoryCrud(BaseCrudRestrict):
     def __init__(self, session):
         super().__init__(session)
         self.model = models.Category
 
+    async def create_item(self, data: dict[str, Any]):
+        category = await super().create_item(data)
+        session_suggest(self.session).append(
+            ("add", "category", data["title"])
+        )
+        return category
+
     async def get_category(
         self, categories_id: list[int]
     ) -> Sequence[models.Category]:
@@ -38,6 +331,9 @@ class ParametrProductCrud(BaseCrud):
 
         stmt_paramert_product = sa.insert(self.model).values(parametrs)
         await self.session.execute(stmt_paramert_product)
+        self.invalidate_products(
+            parametr["product_id"] for parametr in parametrs
+        )
 
     async def update_parametr_product(
         self, parametr: dict[str, Any], product_id: int
@@ -51,6 +347,21 @@ class ParametrProductCrud(BaseCrud):
             )
         )
         await self.session.execute(stmt)
+        self.invalidate_products([product_id])
+
+    async def delete_item(self, item_id: int):
+        stmt = (
+            sa.delete(self.model)
+            .where(self.model.id == item_id)
+            .returning(self.model.product_id)
+        )
+        self.invalidate_products(await self.session.scalars(stmt))
+
+    def invalidate_products(self, products_id: Iterable[int]) -> None:
+        """Параметры входят в карточки товаров и фильтры каталога"""
+        session_tags(self.session).update(
+            {"product"} | entity_tags("product", products_id)
+        )
 
 
 class ParametrCrud(BaseCrudRestrict):
@@ -1,7 +1,5 @@
 from typing import Sequence
 
-import sqlalchemy as sa
-
 import models
 from crud.base_crud import BaseCrudRestrict
 
@@ -12,9 +10,9 @@ class ShopCrud(BaseCrudRestrict):
         self.model = models.Shop
 
     async def get_shop_active(
-        self, shop_active: bool
+        self, shop_active: bool, profile: str | None = None
     ) -> Sequence[models.Shop]:
-        stmt = sa.select(self.model).where(
+        stmt = self.select(profile).where(
             self.model.active == shop_active  # pylint: disable=C0121
         )
         shop = await self.session.scalars(stmt)
@@ -12,8 +12,10 @@ class UserCrud(BaseCrudRestrict):
         super().__init__(session)
         self.model = models.User
 
-    async def get_user(self, email: str) -> models.User:
-        stmt = sa.select(self.model).where(self.model.email == email)
+    async def get_user(
+        self, email: str, profile: str | None = None
+    ) -> models.User:
+        stmt = self.select(profile).where(self.model.email == email)
         user = await self.session.scalar(stmt)
         if user is None:
             raise HTTPException(
@@ -22,9 +24,9 @@ class UserCrud(BaseCrudRestrict):
         return user
 
     async def get_user_buyer(
-        self, user_status: models.UserStatus
+        self, user_status: models.UserStatus, profile: str | None = None
     ) -> Sequence[models.User]:
-        stmt = sa.select(self.model).where(self.model.status == user_status)
+        stmt = self.select(profile).where(self.model.status == user_status)
         user = await self.session.scalars(stmt)
         return user.unique().all()
 
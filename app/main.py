@@ -1,10 +1,8 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 import redis.asyncio as redis
-from cache_fastapi.cacheMiddleware import (  # type: ignore[import-untyped]
-    CacheMiddleware,
-)
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 from sqladmin import Admin
@@ -13,10 +11,13 @@ from api.import_product import import_routers
 from api.orders import order_routers, orderlist_routers
 from api.products import category_routers, parametr_routers, product_routers
 from api.shop import shop_routers
+from api.stats import stats_routers
 from api.users import user_routers
 from core import admin as sqladmin
 from core.celery_app import engine
-from core.redis_cache import RedisBackend
+from core.database import database, replicas
+from core.redis_cache import CacheMiddleware, cache_backend
+from core.redis_cli import redis_pool
 from core.settings import config
 
 
@@ -26,7 +27,14 @@ async def lifespan(_: FastAPI):
         config.redis_url, encoding="utf8"  # type: ignore
     )
     await FastAPILimiter.init(redis_connection)
+    database.connect()
+    replicas.connect()
+    cache_listener = asyncio.create_task(cache_backend.listen())
     yield
+    cache_listener.cancel()
+    await replicas.disconnect()
+    await database.disconnect()
+    await redis_pool.disconnect()
     await FastAPILimiter.close()
 
 
@@ -37,6 +45,18 @@ if config.DEBUG is False:
 
 app = FastAPI(lifespan=lifespan, dependencies=dependencies)
 
+
+@app.middleware("http")
+async def pin_primary_after_write(request: Request, call_next):
+    """После успешной записи чтение пользователя идет в основную БД"""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and (
+        response.status_code < 400
+    ):
+        await replicas.pin_primary(request.headers.get("Authorization"))
+    return response
+
+
 # main routers for app
 app.include_router(user_routers)
 app.include_router(product_routers)
@@ -46,19 +66,20 @@ app.include_router(parametr_routers)
 app.include_router(order_routers)
 app.include_router(orderlist_routers)
 app.include_router(import_routers)
+app.include_router(stats_routers)
 
 
-# cache
+# cache: сохраняются GET-ответы, для которых обработчик указал теги
 cached_endpoints = [
     "/user/",
     "/product/",
+    "/shop/",
     "/order/",
-    "/category",
+    "/category/",
     "/parametr/",
 ]
-backend = RedisBackend()
 app.add_middleware(
-    CacheMiddleware, cached_endpoints=cached_endpoints, backend=backend
+    CacheMiddleware, cached_endpoints=cached_endpoints, backend=cache_backend
 )
 
 
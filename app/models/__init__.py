@@ -1,8 +1,11 @@
 from typing import Type, TypeVar
 
 from models.base import Base
-from models.orders import Order, OrderList, OrderStatus
+from models.facets import ParametrFacet
+from models.imports import ImportJob, ImportStatus
+from models.orders import Order, OrderList, OrderStatus, Reservation
 from models.products import Category, Parametr, ParametrProduct, Product
+from models.search import SEARCH_CONFIG
 from models.users import Shop, User, UserAddress, UserStatus
 
 
@@ -0,0 +1,147 @@
+from decimal import Decimal
+
+from sqlalchemy import DDL, Computed, ForeignKey, String, event
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+# Числовое значение параметра ("55", "15,6") для фильтров по диапазону.
+# Разбирается базой при записи, для остальных значений - NULL
+VALUE_NUMBER = (
+    "CASE WHEN value ~ '^\\s*-?\\d+([.,]\\d+)?\\s*$' "
+    "THEN replace(trim(value), ',', '.')::numeric END"
+)
+
+
+class ParametrFacet(Base):
+    """
+    Индекс фасетов: число активных товаров на каждое значение
+    параметра. Поддерживается триггерами из FACET_DDL
+    """
+
+    __tablename__ = "parametr_facet"
+
+    parametr_id: Mapped[int] = mapped_column(
+        ForeignKey("parametr.id", ondelete="CASCADE"), primary_key=True
+    )
+    value: Mapped[str] = mapped_column(String, primary_key=True)
+    value_number: Mapped[Decimal | None] = mapped_column(
+        Computed(VALUE_NUMBER)
+    )
+    product_count: Mapped[int] = mapped_column(server_default="0")
+
+
+def facet_upsert(changes: str) -> str:
+    """Прибавляет к счетчикам изменения (parametr_id, value, delta)"""
+    return f"""\
+    INSERT INTO parametr_facet AS facet (parametr_id, value, product_count)
+    SELECT parametr_id, value, sum(delta) FROM ({changes}) AS changes
+    GROUP BY parametr_id, value
+    ON CONFLICT (parametr_id, value) DO UPDATE
+    SET product_count = facet.product_count + excluded.product_count;"""
+
+
+# Счетчики меняются на разницу, без пересчета по всей таблице.
+# Учитываются только активные товары: при смене product.active
+# счетчики его параметров прибавляются или вычитаются. Триггер на
+# product построчный и срабатывает только на смену active, остальные
+# обновления товара (списание остатков, резервы) его не вызывают.
+# Удаляемый товар вычитается до каскадного удаления параметров, после
+# него параметры уже не находят товар и повторно не вычитаются
+FACET_DDL = [
+    f"""
+CREATE OR REPLACE FUNCTION parametr_facet_inserted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+{facet_upsert(
+    "SELECT new_rows.parametr_id, new_rows.value, 1 AS delta "
+    "FROM new_rows JOIN product ON product.id = new_rows.product_id "
+    "WHERE product.active"
+)}
+    RETURN NULL;
+END $$
+""",
+    f"""
+CREATE OR REPLACE FUNCTION parametr_facet_updated() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+{facet_upsert(
+    "SELECT new_rows.parametr_id, new_rows.value, 1 AS delta "
+    "FROM new_rows JOIN product ON product.id = new_rows.product_id "
+    "WHERE product.active "
+    "UNION ALL SELECT old_rows.parametr_id, old_rows.value, -1 "
+    "FROM old_rows JOIN product ON product.id = old_rows.product_id "
+    "WHERE product.active"
+)}
+    RETURN NULL;
+END $$
+""",
+    f"""
+CREATE OR REPLACE FUNCTION parametr_facet_deleted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+{facet_upsert(
+    "SELECT old_rows.parametr_id, old_rows.value, -1 AS delta "
+    "FROM old_rows JOIN product ON product.id = old_rows.product_id "
+    "WHERE product.active"
+)}
+    RETURN NULL;
+END $$
+""",
+    f"""
+CREATE OR REPLACE FUNCTION parametr_facet_product_updated()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+{facet_upsert(
+    "SELECT parametr_id, value, "
+    "CASE WHEN NEW.active THEN 1 ELSE -1 END AS delta "
+    "FROM parametrproduct WHERE product_id = NEW.id"
+)}
+    RETURN NULL;
+END $$
+""",
+    f"""
+CREATE OR REPLACE FUNCTION parametr_facet_product_deleted()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+{facet_upsert(
+    "SELECT parametr_id, value, -1 AS delta FROM parametrproduct "
+    "WHERE product_id = OLD.id"
+)}
+    RETURN OLD;
+END $$
+""",
+    """
+CREATE TRIGGER parametr_facet_insert AFTER INSERT ON parametrproduct
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION parametr_facet_inserted()
+""",
+    """
+CREATE TRIGGER parametr_facet_update AFTER UPDATE ON parametrproduct
+REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION parametr_facet_updated()
+""",
+    """
+CREATE TRIGGER parametr_facet_delete AFTER DELETE ON parametrproduct
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION parametr_facet_deleted()
+""",
+    """
+CREATE TRIGGER parametr_facet_update AFTER UPDATE OF active ON product
+FOR EACH ROW WHEN (OLD.active IS DISTINCT FROM NEW.active)
+EXECUTE FUNCTION parametr_facet_product_updated()
+""",
+    """
+CREATE TRIGGER parametr_facet_delete BEFORE DELETE ON product
+FOR EACH ROW WHEN (OLD.active)
+EXECUTE FUNCTION parametr_facet_product_deleted()
+""",
+]
+
+for statement in FACET_DDL:
+    event.listen(
+        Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
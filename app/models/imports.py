@@ -0,0 +1,63 @@
+import datetime
+import enum
+from typing import Any
+
+from sqlalchemy import Float, ForeignKey, cast, false, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, column_property, mapped_column
+
+from models.base import Base
+from models.utils import intpk
+
+
+class ImportStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELED = "canceled"
+
+
+class ImportJob(Base):
+    __tablename__ = "import_job"
+
+    id: Mapped[intpk]
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    status: Mapped[ImportStatus]
+    file_size: Mapped[int]
+    rows: Mapped[int] = mapped_column(server_default="0")
+    inserted: Mapped[int] = mapped_column(server_default="0")
+    updated: Mapped[int] = mapped_column(server_default="0")
+    unchanged: Mapped[int] = mapped_column(server_default="0")
+    deactivated: Mapped[int] = mapped_column(server_default="0")
+    failed: Mapped[int] = mapped_column(server_default="0")
+    errors: Mapped[list[dict[str, Any]]] = mapped_column(
+        JSONB, server_default="[]"
+    )
+    error: Mapped[str | None]
+    cancel_requested: Mapped[bool] = mapped_column(server_default=false())
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        server_default=func.now()  # pylint: disable=E1102
+    )
+    started_at: Mapped[datetime.datetime | None] = mapped_column()
+    finished_at: Mapped[datetime.datetime | None] = mapped_column()
+    # время загрузки в секундах по часам БД: started_at и finished_at
+    # пишет now() базы, часы и пояс API могут отличаться
+    elapsed: Mapped[float | None] = column_property(
+        cast(
+            func.extract(
+                "epoch",
+                func.coalesce(finished_at, func.now())  # pylint: disable=E1102
+                - started_at,
+            ),
+            Float,
+        )
+    )
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if not self.elapsed:
+            return None
+        return self.rows / self.elapsed
@@ -1,7 +1,7 @@
 import datetime
 import enum
 
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import ForeignKey, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models.base import Base
@@ -26,19 +26,19 @@ class Order(Base):
         ForeignKey("users.id", ondelete="CASCADE")
     )
     # pylint: disable=C0301
-    user: Mapped["User"] = relationship(back_populates="orders", lazy="joined")  # type: ignore[name-defined]
+    user: Mapped["User"] = relationship(back_populates="orders", lazy="raise")  # type: ignore[name-defined]
     status: Mapped[OrderStatus]
     created_at: Mapped[datetime.datetime] = mapped_column(
         server_default=func.now()  # pylint: disable=E1102
     )
     orderlist: Mapped[list["OrderList"]] = relationship(
-        back_populates="order", lazy="selectin"
+        back_populates="order", lazy="raise"
     )
     address_id: Mapped[int] = mapped_column(
         ForeignKey("useraddress.id", ondelete="CASCADE")
     )
     address: Mapped["UserAddress"] = relationship(  # type: ignore[name-defined]
-        back_populates="order", lazy="joined"
+        back_populates="order", lazy="raise"
     )
 
 
@@ -50,12 +50,27 @@ class OrderList(Base):
         ForeignKey("product.id", ondelete="CASCADE")
     )
     product: Mapped["Product"] = relationship(  # type: ignore[name-defined]
-        back_populates="orderlist", lazy="selectin"
+        back_populates="orderlist", lazy="raise"
     )
     order_id: Mapped[int] = mapped_column(
         ForeignKey("orders.id", ondelete="CASCADE")
     )
     order: Mapped[Order] = relationship(
-        back_populates="orderlist", lazy="joined"
+        back_populates="orderlist", lazy="raise"
     )
     quantity: Mapped[int]
+
+
+class Reservation(Base):
+    __tablename__ = "reservation"
+
+    id: Mapped[intpk]
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE")
+    )
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE")
+    )
+    quantity: Mapped[int]
+    expires_at: Mapped[datetime.datetime] = mapped_column(index=True)
+    __table_args__ = (UniqueConstraint("user_id", "product_id"),)
@@ -1,9 +1,21 @@
 from decimal import Decimal
 
-from sqlalchemy import CheckConstraint, Column, ForeignKey, String, Table
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    Computed,
+    ForeignKey,
+    Index,
+    String,
+    Table,
+    UniqueConstraint,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models.base import Base
+from models.facets import VALUE_NUMBER
 from models.utils import intpk
 
 
@@ -30,7 +42,7 @@ class Category(Base):
     title: Mapped[str] = mapped_column(String(100), unique=True)
     products: Mapped[list["Product"]] = relationship(
         back_populates="categories",
-        lazy="selectin",
+        lazy="raise",
         secondary=category_product,
     )
 
@@ -42,23 +54,76 @@ class Product(Base):
     name: Mapped[str] = mapped_column(String(100))
     price: Mapped[Decimal]
     remainder: Mapped[int]
+    reserved: Mapped[int] = mapped_column(server_default="0")
+    external_id: Mapped[str | None] = mapped_column(String(100))
+    content_hash: Mapped[str | None] = mapped_column(String(32))
+    relations_hash: Mapped[str | None] = mapped_column(String(32))
+    active: Mapped[bool] = mapped_column(server_default="true")
+    # заполняется триггерами из models.search
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR, deferred=True, deferred_raiseload=True
+    )
     shop_id: Mapped[int] = mapped_column(
         ForeignKey("shop.id", ondelete="CASCADE")
     )
     shop: Mapped["Shop"] = relationship(  # type: ignore[name-defined]
-        back_populates="products", lazy="joined"
+        back_populates="products", lazy="raise"
     )
     categories: Mapped[list[Category]] = relationship(
-        back_populates="products", lazy="selectin", secondary=category_product
+        back_populates="products", lazy="raise", secondary=category_product
     )
     parametrs: Mapped[list["ParametrProduct"]] = relationship(
-        back_populates="product", lazy="selectin"
+        back_populates="product", lazy="raise"
     )
     # pylint: disable=C0301
     orderlist: Mapped[list["OrderList"]] = relationship(  # type: ignore[name-defined]
-        back_populates="product", lazy="selectin"
+        back_populates="product", lazy="raise"
+    )
+    __table_args__ = (
+        CheckConstraint("remainder > 0", name="remainder_gt_0"),
+        CheckConstraint("reserved >= 0", name="reserved_ge_0"),
+        UniqueConstraint("shop_id", "external_id"),
+        # индексы для пагинации каталога по ключу (поле сортировки, id)
+        Index(
+            "ix_product_price_id",
+            "price",
+            "id",
+            postgresql_where=text("active"),
+        ),
+        Index(
+            "ix_product_name_id", "name", "id", postgresql_where=text("active")
+        ),
+        Index(
+            "ix_product_shop_id_price_id",
+            "shop_id",
+            "price",
+            "id",
+            postgresql_where=text("active"),
+        ),
+        Index(
+            "ix_product_shop_id_id",
+            "shop_id",
+            "id",
+            postgresql_where=text("active"),
+        ),
+        # полнотекстовый и триграммный поиск
+        Index(
+            "ix_product_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+        Index(
+            "ix_product_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
     )
-    __table_args__ = (CheckConstraint("remainder > 0", name="remainder_gt_0"),)
+
+    @property
+    def available(self) -> int:
+        """Остаток за вычетом товаров, зарезервированных в корзинах"""
+        return self.remainder - self.reserved
 
     def __repr__(self) -> str:
         return (
@@ -81,12 +146,31 @@ class ParametrProduct(Base):
 
     id: Mapped[intpk]
     product_id: Mapped[int] = mapped_column(
-        ForeignKey("product.id", ondelete="CASCADE")
+        ForeignKey("product.id", ondelete="CASCADE"), index=True
     )
     product: Mapped[Product] = relationship(
-        back_populates="parametrs", lazy="joined"
+        back_populates="parametrs", lazy="raise"
     )
     parametr_id: Mapped[int] = mapped_column(
         ForeignKey("parametr.id", ondelete="CASCADE")
     )
     value: Mapped[str]
+    value_number: Mapped[Decimal | None] = mapped_column(
+        Computed(VALUE_NUMBER)
+    )
+    __table_args__ = (
+        # фильтры по значению и по числовому диапазону параметра
+        Index(
+            "ix_parametrproduct_parametr_id_value",
+            "parametr_id",
+            "value",
+            "product_id",
+        ),
+        Index(
+            "ix_parametrproduct_parametr_id_value_number",
+            "parametr_id",
+            "value_number",
+            "product_id",
+            postgresql_where=text("value_number IS NOT NULL"),
+        ),
+    )
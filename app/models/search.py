@@ -0,0 +1,160 @@
+from sqlalchemy import DDL, event
+
+from models.base import Base
+
+
+SEARCH_CONFIG = "russian"
+# SET LOCAL этого параметра отключает триггеры товара, его категорий и
+# параметров до конца транзакции: загрузка прайса пересчитывает вектор
+# сама, одним вызовом product_search_update на пачку
+SEARCH_DEFERRED = "app.search_deferred"
+NOT_DEFERRED = (
+    f"current_setting('{SEARCH_DEFERRED}', true) IS DISTINCT FROM 'on'"
+)
+
+# search_vector товара собирается из названия (вес A), названий
+# категорий (B) и значений параметров (C). Вектор пересчитывается
+# триггерами при изменении товара, его категорий и параметров.
+# Триггеры на вставку - на уровне запроса, по одному UPDATE на запрос
+SEARCH_DDL = [
+    f"""
+CREATE OR REPLACE FUNCTION product_search_update(product_ids integer[])
+RETURNS void LANGUAGE sql AS $$
+UPDATE product SET search_vector =
+    setweight(to_tsvector('{SEARCH_CONFIG}', product.name), 'A')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+        SELECT string_agg(category.title, ' ')
+        FROM category_product
+        JOIN category ON category.id = category_product.category_id
+        WHERE category_product.product_id = product.id
+    ), '')), 'B')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+        SELECT string_agg(parametrproduct.value, ' ')
+        FROM parametrproduct
+        WHERE parametrproduct.product_id = product.id
+    ), '')), 'C')
+WHERE product.id = ANY(product_ids)
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_inserted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(ARRAY(SELECT id FROM new_rows));
+    RETURN NULL;
+END $$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_renamed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(ARRAY[NEW.id]);
+    RETURN NULL;
+END $$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_related_inserted()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(
+        ARRAY(SELECT DISTINCT product_id FROM new_rows)
+    );
+    RETURN NULL;
+END $$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_related_updated()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(ARRAY(
+        SELECT product_id FROM new_rows
+        UNION SELECT product_id FROM old_rows
+    ));
+    RETURN NULL;
+END $$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_related_deleted()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(
+        ARRAY(SELECT DISTINCT product_id FROM old_rows)
+    );
+    RETURN NULL;
+END $$
+""",
+    """
+CREATE OR REPLACE FUNCTION product_search_category_renamed()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM product_search_update(ARRAY(
+        SELECT product_id FROM category_product
+        WHERE category_id = NEW.id
+    ));
+    RETURN NULL;
+END $$
+""",
+    f"""
+CREATE TRIGGER product_search_insert AFTER INSERT ON product
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_inserted()
+""",
+    f"""
+CREATE TRIGGER product_search_rename AFTER UPDATE OF name ON product
+FOR EACH ROW WHEN (
+    OLD.name IS DISTINCT FROM NEW.name AND {NOT_DEFERRED}
+)
+EXECUTE FUNCTION product_search_renamed()
+""",
+    f"""
+CREATE TRIGGER product_search_insert AFTER INSERT ON category_product
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_related_inserted()
+""",
+    f"""
+CREATE TRIGGER product_search_delete AFTER DELETE ON category_product
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_related_deleted()
+""",
+    f"""
+CREATE TRIGGER product_search_insert AFTER INSERT ON parametrproduct
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_related_inserted()
+""",
+    f"""
+CREATE TRIGGER product_search_update AFTER UPDATE ON parametrproduct
+REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_related_updated()
+""",
+    f"""
+CREATE TRIGGER product_search_delete AFTER DELETE ON parametrproduct
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT WHEN ({NOT_DEFERRED})
+EXECUTE FUNCTION product_search_related_deleted()
+""",
+    """
+CREATE TRIGGER product_search_rename AFTER UPDATE OF title ON category
+FOR EACH ROW WHEN (OLD.title IS DISTINCT FROM NEW.title)
+EXECUTE FUNCTION product_search_category_renamed()
+""",
+]
+
+# metadata.create_all (тестовые БД) создает то же, что и миграция
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+        dialect="postgresql"
+    ),
+)
+for statement in SEARCH_DDL:
+    event.listen(
+        Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
@@ -24,11 +24,11 @@ class User(Base):
     status: Mapped[UserStatus]
     phone: Mapped[str | None]
     addresses: Mapped[list["UserAddress"]] = relationship(
-        back_populates="user", lazy="joined"
+        back_populates="user", lazy="raise"
     )
-    shop: Mapped["Shop"] = relationship(back_populates="user", lazy="joined")
+    shop: Mapped["Shop"] = relationship(back_populates="user", lazy="raise")
     orders: Mapped[list["Order"]] = relationship(  # type: ignore[name-defined]
-        back_populates="user", lazy="selectin"
+        back_populates="user", lazy="raise"
     )
     active: Mapped[bool] = mapped_column(server_default=false())
 
@@ -48,10 +48,10 @@ class Shop(Base):
     )
     # pylint: disable=C0301
     products: Mapped[list["Product"]] = relationship(  # type: ignore[name-defined]
-        back_populates="shop", lazy="selectin"
+        back_populates="shop", lazy="raise"
     )
     user: Mapped[User] = relationship(  # type: ignore[name-defined]
-        back_populates="shop", lazy="joined"
+        back_populates="shop", lazy="raise"
     )
 
 
@@ -64,9 +64,7 @@ class UserAddress(Base):
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE")
     )
-    user: Mapped[User] = relationship(
-        back_populates="addresses", lazy="selectin"
-    )
+    user: Mapped[User] = relationship(back_populates="addresses", lazy="raise")
     order: Mapped[list["Order"]] = relationship(  # type: ignore[name-defined]
-        back_populates="address", lazy="joined"
+        back_populates="address", lazy="raise"
     )
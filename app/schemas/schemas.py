@@ -1,5 +1,5 @@
 import datetime
-from typing import Annotated, Optional
+from typing import Annotated, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from pydantic.functional_validators import AfterValidator
@@ -56,6 +56,23 @@ class UserCreate(User):
     password: Password
 
 
+class ShopPrincipal(BaseModel):
+    id: int
+    active: bool
+    model_config = ConfigDict(from_attributes=True)
+
+
+class Principal(BaseModel):
+    """Пользователь из токена: только то, что нужно для проверки прав"""
+
+    id: int
+    email: str
+    status: models.UserStatus
+    active: bool
+    shop: ShopPrincipal | None
+    model_config = ConfigDict(from_attributes=True)
+
+
 class UserIdResponse(BaseModel):
     status: models.UserStatus
     name: str
@@ -71,6 +88,11 @@ class UserUpdate(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
+
+
+class RefreshToken(BaseModel):
+    refresh_token: str
 
 
 class UserLogin(BaseModel):
@@ -185,12 +207,41 @@ class ProductCreate(Product):
 
 class ProductsResponse(Product):
     id: int
+    available: int
     categories: list[CategoryProduct]
     shop: "ShopForProduct"
     parametrs: list[ParametrProductCreateResponse]
     model_config = ConfigDict(from_attributes=True)
 
 
+class ProductPage(BaseModel):
+    items: list[ProductsResponse]
+    next_cursor: str | None
+
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+
+class Facet(BaseModel):
+    parametr_id: int
+    name: str
+    values: list[FacetValue]
+    min: float | None
+    max: float | None
+
+
+class FacetedProductPage(ProductPage):
+    facets: list[Facet] | None
+
+
+class Suggestion(BaseModel):
+    kind: Literal["product", "category"]
+    text: str
+    popularity: float
+
+
 class ProductUpdate(BaseModel):
     name: str | None = None
     price: float | None = None
@@ -283,3 +334,30 @@ class OrderProduct(BaseModel):
 
 class OrderProductResponse(OrderProduct):
     model_config = ConfigDict(from_attributes=True)
+
+
+# import
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportJobResponse(BaseModel):
+    id: int
+    status: models.ImportStatus
+    file_size: int
+    rows: int
+    inserted: int
+    updated: int
+    unchanged: int
+    deactivated: int
+    failed: int
+    errors: list[ImportRowError]
+    error: str | None
+    cancel_requested: bool
+    created_at: datetime.datetime
+    started_at: datetime.datetime | None
+    finished_at: datetime.datetime | None
+    elapsed: float | None
+    rows_per_second: float | None
+    model_config = ConfigDict(from_attributes=True)
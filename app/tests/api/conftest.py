@@ -6,10 +6,12 @@ from fastapi import FastAPI
 from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
-from core.dependency import get_session
-from core.redis_cli import redis_client
+from core.dependency import get_read_session, get_session
+from core.redis_cache import cache_backend
+from core.redis_cli import async_redis_client, redis_client
 from core.security import create_access_token
 from core.settings import config
+from core.suggest import SuggestIndex
 from main import app
 from models import Base
 from tests import factory as fc
@@ -89,9 +91,19 @@ async def test_app_fixture(
     """
     Подмена зависимостей основого приложение на тестовые
     """
-    app.dependency_overrides[get_session] = lambda: async_session
+
+    async def session_override():
+        try:
+            yield async_session
+        finally:
+            await cache_backend.publish(async_session)
+            await SuggestIndex(async_redis_client).publish(async_session)
+
+    app.dependency_overrides[get_session] = session_override
+    app.dependency_overrides[get_read_session] = lambda: async_session
     yield app
     app.dependency_overrides = {}
+    await cache_backend.clear()
 
 
 @pytest.fixture(name="client")
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+import bcrypt
+import jwt
+import pytest
+import sqlalchemy as sa
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from core.database import _token_subject
+from core.security import create_access_token, password_hasher
+from core.settings import config
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_principal_invalidated_by_shop(user_client: AsyncClient):
+    """Cached principal sees the shop created after it was cached"""
+    response = await user_client.get("/shop/me/")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await user_client.post("/shop/", json={"title": "Shop"})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await user_client.get("/shop/me/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Shop"
+
+
+async def test_login_rehash_password(
+    client: AsyncClient, factory, async_session: AsyncSession
+):
+    """Login upgrades a password hashed with an outdated cost"""
+    user = await factory(fc.UserFactory, password="string123")
+    email = user.email
+    user.password = bcrypt.hashpw(b"string123", bcrypt.gensalt(4)).decode()
+    await async_session.commit()
+
+    response = await client.post(
+        "/user/auth/", json={"email": email, "password": "string123"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    password = await async_session.scalar(
+        sa.select(models.User.password).where(models.User.email == email)
+    )
+    assert password.startswith(f"$2b${config.PASSWORD_BCRYPT_ROUNDS:02}$")
+
+
+async def test_login_busy(client: AsyncClient, factory, monkeypatch):
+    """Saturated password pool answers 503 instead of queueing"""
+    user = await factory(fc.UserFactory, password="string123")
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    response = await client.post(
+        "/user/auth/", json={"email": user.email, "password": "string123"}
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_logout_revokes_token(user_client: AsyncClient):
+    """Token stops working right after logout, cached responses too"""
+    response = await user_client.get("/user/me/")
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await user_client.post("/user/logout/")
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await user_client.get("/user/me/")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_refresh_rotation(client: AsyncClient, factory):
+    """Refresh token is single use, reuse revokes the whole family"""
+    user = await factory(fc.UserFactory, password="string123")
+    response = await client.post(
+        "/user/auth/", json={"email": user.email, "password": "string123"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    first = response.json()["refresh_token"]
+
+    response = await client.post(
+        "/user/refresh/", json={"refresh_token": first}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    second = response.json()["refresh_token"]
+    response = await client.get(
+        "/user/me/",
+        headers={"Authorization": f"Bearer {response.json()['access_token']}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.post(
+        "/user/refresh/", json={"refresh_token": first}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = await client.post(
+        "/user/refresh/", json={"refresh_token": second}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_pin_subject_needs_signature():
+    """Replica pin trusts only tokens signed with SECRET_KEY"""
+    token = create_access_token({"sub": "a@b.c"}, timedelta(minutes=5))
+    assert _token_subject(f"Bearer {token}") == "a@b.c"
+    forged = jwt.encode(
+        {"sub": "a@b.c", "exp": 2**31}, "other", algorithm=config.ALGORITHM
+    )
+    assert _token_subject(f"Bearer {forged}") is None
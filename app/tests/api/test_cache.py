@@ -0,0 +1,116 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from core.admin import OrderAdmin
+from core.redis_cache import RESPONSE_PREFIX, cache_backend
+from crud.products import CategoryCrud, ProductCrud
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cache_invalidated_by_product_update(
+    client: AsyncClient, factory, async_session: AsyncSession
+):
+    """Cached product card is dropped after the product is changed"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    product = await factory(fc.ProductFactory, shop_id=shop.id, price=100)
+    product_id = product.id
+
+    response = await client.get(f"/product/{product_id}")
+    assert response.headers["X-Cache"] == "MISS"
+    response = await client.get(f"/product/{product_id}")
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.json()["price"] == 100
+
+    await ProductCrud(async_session).update_item(
+        {"id": product_id, "price": 200}
+    )
+    await async_session.commit()
+    await cache_backend.publish(async_session)
+
+    response = await client.get(f"/product/{product_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["price"] == 200
+
+
+async def test_cache_key_query(client: AsyncClient, factory):
+    """Query parameters are part of the key regardless of their order"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    await factory(fc.ProductFactory, 3, shop_id=shop.id)
+
+    response = await client.get("/product/?limit=1&sort=id")
+    assert response.headers["X-Cache"] == "MISS"
+    response = await client.get("/product/?sort=id&limit=1")
+    assert response.headers["X-Cache"] == "HIT"
+    response = await client.get("/product/?sort=id&limit=2")
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json()["items"]) == 2
+
+
+async def test_cache_stale_while_revalidate(client: AsyncClient, factory):
+    """Stale response is served while another request refreshes it"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    product = await factory(fc.ProductFactory, shop_id=shop.id)
+
+    response = await client.get(f"/product/{product.id}")
+    assert response.headers["X-Cache"] == "MISS"
+    [stored] = await cache_backend.cache.keys(f"{RESPONSE_PREFIX}*")
+    await cache_backend.cache.hset(stored, "fresh_until", 0)
+    key = stored.decode().removeprefix(RESPONSE_PREFIX)
+
+    token = await cache_backend.lock(key)
+    response = await client.get(f"/product/{product.id}")
+    assert response.headers["X-Cache"] == "STALE"
+    await cache_backend.unlock(key, token)
+
+    response = await client.get(f"/product/{product.id}")
+    assert response.headers["X-Cache"] == "MISS"
+    response = await client.get(f"/product/{product.id}")
+    assert response.headers["X-Cache"] == "HIT"
+
+
+async def test_etag_not_modified(
+    client: AsyncClient, factory, async_session: AsyncSession
+):
+    """If-None-Match with the current ETag gets 304 until a write"""
+    category = await factory(fc.CategoryFactory)
+    category_id = category.id
+
+    response = await client.get("/category/")
+    etag = response.headers["ETag"]
+    response = await client.get("/category/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    await CategoryCrud(async_session).update_item(
+        {"id": category_id, "title": "renamed"}
+    )
+    await async_session.commit()
+    await cache_backend.publish(async_session)
+
+    response = await client.get("/category/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers.get("ETag") != etag
+
+
+@pytest.mark.usefixtures("test_app")
+async def test_admin_order_edit_invalidates():
+    """Order status changed in the admin drops cached responses"""
+    await cache_backend.create(
+        "order", b"{}", "application/json", ["orders:5"], 0
+    )
+    assert await cache_backend.retrieve("order") is not None
+
+    await OrderAdmin().after_model_change(
+        {}, models.Order(id=5), False, None  # type: ignore[arg-type]
+    )
+    assert await cache_backend.retrieve("order") is None
@@ -0,0 +1,75 @@
+import json
+import os
+import zlib
+
+import pytest
+from httpx import AsyncClient
+
+from core.cache_codecs import CacheEncoder, Codec, ZlibCodec
+from core.redis_cache import cache_backend
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+BODY = json.dumps([{"name": "Товар", "price": 100}] * 50).encode()
+
+
+def test_encoder_round_trip():
+    """Bodies from min_size are compressed and decode back"""
+    encoder = CacheEncoder(ZlibCodec(), min_size=len(BODY))
+    encoding, data = encoder.encode(BODY)
+    assert encoding == "zlib"
+    assert len(data) < len(BODY)
+    assert encoder.decode(encoding, data) == BODY
+
+    assert encoder.encode(BODY[:-1]) == ("identity", BODY[:-1])
+
+
+def test_encoder_keeps_incompressible():
+    """Body that does not shrink is stored as is"""
+    body = os.urandom(4096)
+    assert CacheEncoder(ZlibCodec(), min_size=0).encode(body) == (
+        "identity",
+        body,
+    )
+
+
+def test_encoder_decodes_other_codec():
+    """Entries written with a previous codec stay readable"""
+    encoder = CacheEncoder(Codec(), min_size=0)
+    assert encoder.encode(BODY) == ("identity", BODY)
+    assert encoder.decode("zlib", zlib.compress(BODY)) == BODY
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, deflate",
+    [
+        ("gzip, deflate", True),
+        ("deflate;q=0.5", True),
+        ("*", True),
+        ("deflate;q=0, *", False),
+        ("deflate; q=0.0", False),
+        ("gzip", False),
+        ("identity", False),
+    ],
+)
+async def test_deflate_passthrough(
+    client: AsyncClient, factory, monkeypatch, accept_encoding, deflate
+):
+    """Compressed entry is sent as deflate only when the client takes it"""
+    monkeypatch.setattr(
+        cache_backend, "encoder", CacheEncoder(ZlibCodec(), min_size=0)
+    )
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    product = await factory(fc.ProductFactory, shop_id=shop.id)
+    url = f"/product/{product.id}"
+
+    expected = (await client.get(url)).json()
+    response = await client.get(
+        url, headers={"Accept-Encoding": accept_encoding}
+    )
+    assert response.headers["X-Cache"] == "HIT"
+    assert ("Content-Encoding" in response.headers) is deflate
+    assert response.json() == expected
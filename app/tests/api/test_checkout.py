@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+import models
+from crud.orders import OrderCrud
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_parallel_checkout_no_oversell(
+    factory, postgres_engine: AsyncEngine
+):
+    """Parallel checkouts never sell more than product remainder"""
+    stock, checkouts = 50, 300
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    # remainder не может быть 0 из-за remainder_gt_0
+    product = await factory(
+        fc.ProductFactory, shop_id=shop.id, remainder=stock + 1
+    )
+    address = await factory(fc.UserAddressFactory, user_id=user.id)
+
+    async def checkout() -> int:
+        async with AsyncSession(postgres_engine) as session:
+            try:
+                await OrderCrud(session).create_order(
+                    {
+                        "user_id": user.id,
+                        "status": models.OrderStatus.INPROGRES,
+                        "address_id": address.id,
+                    },
+                    [{"product_id": product.id, "quantity": 1}],
+                )
+            except HTTPException as error:
+                return error.status_code
+        return status.HTTP_200_OK
+
+    results = await asyncio.gather(*(checkout() for _ in range(checkouts)))
+    assert results.count(status.HTTP_200_OK) == stock
+    assert results.count(status.HTTP_400_BAD_REQUEST) == checkouts - stock
+
+    async with AsyncSession(postgres_engine) as session:
+        remainder = await session.scalar(
+            sa.select(models.Product.remainder).where(
+                models.Product.id == product.id
+            )
+        )
+        sold = await session.scalar(
+            sa.select(sa.func.sum(models.OrderList.quantity)).where(
+                models.OrderList.product_id == product.id
+            )
+        )
+    assert remainder == 1
+    assert sold == stock
+
+
+async def test_checkout_inactive_product(factory, async_session: AsyncSession):
+    """Product removed from the price list can't be checked out"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    product = await factory(fc.ProductFactory, shop_id=shop.id, remainder=5)
+    address = await factory(fc.UserAddressFactory, user_id=user.id)
+    user_id, product_id, address_id = user.id, product.id, address.id
+    await async_session.execute(
+        sa.update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(active=False)
+    )
+    await async_session.commit()
+
+    with pytest.raises(HTTPException) as error:
+        await OrderCrud(async_session).create_order(
+            {
+                "user_id": user_id,
+                "status": models.OrderStatus.INPROGRES,
+                "address_id": address_id,
+            },
+            [{"product_id": product_id, "quantity": 1}],
+        )
+    assert error.value.status_code == status.HTTP_404_NOT_FOUND
+    remainder = await async_session.scalar(
+        sa.select(models.Product.remainder).where(
+            models.Product.id == product_id
+        )
+    )
+    assert remainder == 5
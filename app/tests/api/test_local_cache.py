@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+import models
+from core.local_cache import LocalCache
+from core.redis_cache import RESPONSE_PREFIX, cache_backend
+from core.security import create_access_token
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+def test_local_cache_evicts_by_size():
+    """Least recently used entries are evicted once the bytes overflow"""
+    cache = LocalCache(max_bytes=10, max_item=10)
+    cache.set("a", "a", 4, 60)
+    cache.set("b", "b", 4, 60)
+    assert cache.get("a") == "a"
+    cache.set("c", "c", 4, 60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.size == 8
+    assert cache.stats.evictions == 1
+
+
+def test_local_cache_skips_large_items():
+    """Items over max_item are not stored and drop the previous value"""
+    cache = LocalCache(max_bytes=100, max_item=10)
+    cache.set("a", "small", 5, 60)
+    cache.set("a", "large", 11, 60)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_local_cache_invalidate_tags():
+    """Invalidating a tag drops only the entries that carry it"""
+    cache = LocalCache(max_bytes=100, max_item=10)
+    cache.set("a", "a", 1, 60, ["product:1", "product"])
+    cache.set("b", "b", 1, 60, ["product:2", "product"])
+    cache.set("c", "c", 1, 60, ["category"])
+
+    cache.invalidate(["product:1"])
+    assert cache.get("a") is None
+    assert cache.get("b") == "b"
+    cache.invalidate(["product"])
+    assert cache.get("b") is None
+    assert cache.get("c") == "c"
+    assert cache.tags == {"category": {"c"}}
+
+
+@pytest.mark.usefixtures("test_app")
+async def test_local_tier_needs_listener(monkeypatch):
+    """Local tier is read only while invalidations are received"""
+    await cache_backend.create("local", b"{}", "application/json", ["x"], 0)
+    await cache_backend.cache.delete(RESPONSE_PREFIX + "local")
+
+    monkeypatch.setattr(cache_backend, "listening", False)
+    assert await cache_backend.retrieve("local") is None
+    monkeypatch.setattr(cache_backend, "listening", True)
+    entry = await cache_backend.retrieve("local")
+    assert entry is not None
+    assert entry.body == b"{}"
+
+
+@pytest.mark.usefixtures("test_app")
+async def test_local_tier_skips_invalidated_reads(monkeypatch):
+    """An entry invalidated while it is read from Redis is not kept"""
+    await cache_backend.create("local", b"{}", "application/json", ["x"], 0)
+    monkeypatch.setattr(cache_backend, "listening", True)
+    cache_backend.local.clear()
+    retrieve_script = cache_backend.retrieve_script
+
+    async def invalidated_retrieve(**kwargs):
+        data = await retrieve_script(**kwargs)
+        cache_backend.local.invalidate(["x"])
+        return data
+
+    monkeypatch.setattr(cache_backend, "retrieve_script", invalidated_retrieve)
+    assert await cache_backend.retrieve("local") is not None
+    assert cache_backend.local.get("local") is None
+
+
+async def test_cache_stats(client: AsyncClient, factory):
+    """Cache counters are available to managers only"""
+    manager = await factory(fc.UserFactory, status=models.UserStatus.MANAGER)
+    token = create_access_token({"sub": manager.email}, timedelta(minutes=5))
+    response = await client.get(
+        "/stats/cache/", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()) == {"local", "redis"}
+    assert {"hits", "misses", "evictions"} <= set(response.json()["local"])
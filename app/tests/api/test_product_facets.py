@@ -0,0 +1,82 @@
+import pytest
+import sqlalchemy as sa
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_filter_products_facets(
+    client: AsyncClient, factory, async_session: AsyncSession
+):
+    """Filters by parametr values and ranges, facets follow the filters"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    await factory(fc.ParametrFactory, name="Цвет")
+    await factory(fc.ParametrFactory, name="Диагональ")
+    parametrs = dict(
+        (
+            await async_session.execute(
+                sa.select(models.Parametr.name, models.Parametr.id)
+            )
+        ).all()
+    )
+    products = [
+        ("TV 43", "черный", "43"),
+        ("TV 50", "белый", "50"),
+        ("TV 55", "черный", "55,5"),
+        ("TV 65", "черный", "65"),
+    ]
+    for name, color_value, diagonal_value in products:
+        await factory(fc.ProductFactory, shop_id=shop.id, name=name)
+        product_id = await async_session.scalar(
+            sa.select(models.Product.id).where(models.Product.name == name)
+        )
+        await factory(
+            fc.ParametrProductFactory,
+            product_id=product_id,
+            parametr_id=parametrs["Цвет"],
+            value=color_value,
+        )
+        await factory(
+            fc.ParametrProductFactory,
+            product_id=product_id,
+            parametr_id=parametrs["Диагональ"],
+            value=diagonal_value,
+        )
+
+    response = await client.get("/product/filter")
+    assert response.status_code == status.HTTP_200_OK
+    facets = {facet["name"]: facet for facet in response.json()["facets"]}
+    assert facets["Цвет"]["values"] == [
+        {"value": "черный", "count": 3},
+        {"value": "белый", "count": 1},
+    ]
+    assert (facets["Диагональ"]["min"], facets["Диагональ"]["max"]) == (
+        43,
+        65,
+    )
+
+    response = await client.get(
+        "/product/filter",
+        params={
+            "param": f"{parametrs['Цвет']}:черный",
+            "range": f"{parametrs['Диагональ']}:50:",
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+    page = response.json()
+    assert [product["name"] for product in page["items"]] == ["TV 55", "TV 65"]
+    facets = {facet["name"]: facet for facet in page["facets"]}
+    assert facets["Цвет"]["values"] == [{"value": "черный", "count": 2}]
+    assert facets["Диагональ"]["min"] == 55.5
+
+
+async def test_filter_products_invalid(client: AsyncClient):
+    response = await client.get("/product/filter", params={"range": "1:a:"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,33 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("sort", ["id", "-price", "name"])
+async def test_get_products_pages(client: AsyncClient, factory, sort: str):
+    """Pages by cursor return every product once in sort order"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    for price in (300, 100, 200, 100, 500, 400, 100):
+        await factory(fc.ProductFactory, shop_id=shop.id, price=price)
+    products, cursor = [], None
+    while True:
+        params = {"limit": 3, "sort": sort}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/product/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        products.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    field = sort.removeprefix("-")
+    keys = [(product[field], product["id"]) for product in products]
+    assert len(keys) == 7
+    assert keys == sorted(keys, reverse=sort.startswith("-"))
@@ -0,0 +1,51 @@
+import pytest
+import sqlalchemy as sa
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from models.products import category_product
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_search_products(
+    client: AsyncClient, factory, async_session: AsyncSession
+):
+    """Search by category title and by name with a typo"""
+    user = await factory(fc.UserFactory)
+    shop = await factory(fc.ShopFactory, user_id=user.id)
+    for name in ("Apple iPhone 15", "Samsung Galaxy S24", "Dyson V15"):
+        await factory(fc.ProductFactory, shop_id=shop.id, name=name)
+    category = await factory(fc.CategoryFactory, title="Смартфоны")
+    products = dict(
+        (
+            await async_session.execute(
+                sa.select(models.Product.name, models.Product.id)
+            )
+        ).all()
+    )
+    await async_session.execute(
+        sa.insert(category_product),
+        [
+            {"category_id": category.id, "product_id": products[name]}
+            for name in ("Apple iPhone 15", "Samsung Galaxy S24")
+        ],
+    )
+    await async_session.commit()
+
+    response = await client.get("/product/search", params={"q": "смартфон"})
+    assert response.status_code == status.HTTP_200_OK
+    assert {product["name"] for product in response.json()["items"]} == {
+        "Apple iPhone 15",
+        "Samsung Galaxy S24",
+    }
+
+    response = await client.get("/product/search", params={"q": "samsng"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [product["name"] for product in response.json()["items"]] == [
+        "Samsung Galaxy S24"
+    ]
@@ -0,0 +1,90 @@
+import pytest
+import sqlalchemy as sa
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.redis_cli import async_redis_client, redis_client
+from core.suggest import SuggestIndex, session_suggest
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_suggest_by_popularity(client: AsyncClient):
+    """Suggestions match any word of the name, most ordered first"""
+    index = SuggestIndex(async_redis_client)
+    await index.add(
+        products=["Samsung Galaxy S24", "Apple iPhone 15", "Galaxy Buds"],
+        categories=["Смартфоны"],
+    )
+    await index.incr({"Galaxy Buds": 3, "Samsung Galaxy S24": 1})
+
+    response = await client.get("/product/suggest", params={"prefix": "gal"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["text"] for item in response.json()] == [
+        "Galaxy Buds",
+        "Samsung Galaxy S24",
+    ]
+
+    response = await client.get("/product/suggest", params={"prefix": "СМАРТ"})
+    assert response.json() == [
+        {"kind": "category", "text": "Смартфоны", "popularity": 0}
+    ]
+
+    await index.remove(products=["Galaxy Buds"])
+    response = await client.get(
+        "/product/suggest", params={"prefix": "galaxy b"}
+    )
+    assert response.json() == []
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_suggest_rebuild_keeps_concurrent_writes(client: AsyncClient):
+    """Writes made while the index is rebuilt survive the switch"""
+    index = SuggestIndex(redis_client)
+
+    def entries():
+        yield "product", "Galaxy S24", 1
+        index.add(products=["Galaxy Tab"])
+        index.incr({"Galaxy S24": 2})
+        yield "category", "Смартфоны", 0
+
+    assert index.rebuild(entries()) > 0
+    response = await client.get("/product/suggest", params={"prefix": "gal"})
+    assert [
+        (item["text"], item["popularity"]) for item in response.json()
+    ] == [("Galaxy S24", 3), ("Galaxy Tab", 0)]
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_suggest_written_after_commit(
+    client: AsyncClient, async_session: AsyncSession
+):
+    """Names from a rolled back transaction never become suggestions"""
+    index = SuggestIndex(async_redis_client)
+    await async_session.execute(sa.text("SELECT 1"))
+    session_suggest(async_session).append(("add", "product", "Galaxy S24"))
+    await async_session.rollback()
+    await async_session.execute(sa.text("SELECT 1"))
+    session_suggest(async_session).append(("add", "product", "Galaxy Tab"))
+    await async_session.commit()
+    await index.publish(async_session)
+
+    response = await client.get("/product/suggest", params={"prefix": "gal"})
+    assert [item["text"] for item in response.json()] == ["Galaxy Tab"]
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_suggest_rebuild_drops_abandoned_versions():
+    """A rebuild removes keys left by a build that never switched"""
+    index = SuggestIndex(redis_client)
+    redis_client.zadd("suggest:v:1:gal", {"product:Galaxy Old": 0})
+
+    assert index.rebuild(iter([("product", "Galaxy S24", 1)])) > 0
+    assert not redis_client.exists("suggest:v:1:gal")
+    assert index.rebuild(iter([("product", "Galaxy S24", 1)])) > 0
+    assert await SuggestIndex(async_redis_client).suggest("gal", 10) == [
+        ("product", "Galaxy S24", 1)
+    ]
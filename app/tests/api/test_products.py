@@ -25,7 +25,7 @@
 #         await factory(fc.ProductFactory, shop_id=shop.id)
 #     response = await client.get("/product/")
 #     assert response.status_code == status.HTTP_200_OK
-#     assert len(response.json()) == count
+#     assert len(response.json()["items"]) == count
 
 
 # async def test_get_product_id(factory, user_client: AsyncClient):
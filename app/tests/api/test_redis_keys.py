@@ -0,0 +1,45 @@
+import json
+import uuid
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from core.redis_cli import async_redis_client, redis_client
+from core.redis_keys import CART, KeyScanner
+from crud.cart import CartCrud
+from tests import factory as fc
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.usefixtures("clear_redis")
+async def test_migrate_legacy_keys(client: AsyncClient, factory):
+    """Legacy carts and verify links move to namespaces with TTL"""
+    user = await factory(fc.UserFactory)
+    verify_path = str(uuid.uuid4())
+    redis_client.set(verify_path, user.email)
+    redis_client.set(
+        "7",
+        json.dumps(
+            [
+                {"product_id": 1, "quantity": 2},
+                {"product_id": 2, "quantity": 0},
+            ]
+        ),
+    )
+
+    scanner = KeyScanner(redis_client, count=10)
+    assert scanner.migrate()["legacy_cart"] == 1
+    assert redis_client.get("7") is None
+    assert 0 < redis_client.ttl(CART.key(7)) <= CART.ttl
+    assert await CartCrud(async_redis_client).get_items(7) == [
+        {"product_id": 1, "quantity": 2}
+    ]
+    report = scanner.report()
+    assert report["cart"].keys == 1
+    assert report["verify"].no_ttl == 0
+
+    response = await client.get(f"/user/{verify_path}/")
+    assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,103 @@
+"""
+Микробенчмарк зависимостей авторизации.
+
+Измеряет время одного вызова по шагам цепочки get_current_user:
+jwt.decode (проверка подписи на каждый запрос, как раньше), проверку
+токена из LRU, проверку с отзывом в Redis и весь get_current_user с
+принципалом из кэша. С --email существующего пользователя еще и
+get_current_user с промахом кэша принципала (запрос в БД).
+Нужны Redis и, для --email, БД из настроек.
+
+    cd app
+    python -m tests.benchmarks.bench_auth
+    python -m tests.benchmarks.bench_auth --email user@example.com
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import timedelta
+
+import jwt
+from fastapi.security import HTTPAuthorizationCredentials
+
+from core.database import database
+from core.dependency import get_current_user
+from core.principals import principal_cache
+from core.security import create_access_token
+from core.settings import config
+from core.tokens import token_verifier
+from models import UserStatus
+from schemas.schemas import Principal
+
+
+async def timing(name: str, func, repeat: int) -> None:
+    """Медиана и p99 времени вызова в микросекундах"""
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - began) * 1_000_000)
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"{name:<36}{quantiles[49]:>10.1f} us{quantiles[98]:>10.1f} us")
+
+
+async def main(args: argparse.Namespace) -> None:
+    email = args.email or "bench@example.com"
+    token = create_access_token(
+        {"sub": email},
+        timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=token
+    )
+
+    async def decode():
+        jwt.decode(token, config.SECRET_KEY, algorithms=[config.ALGORITHM])
+
+    async def decode_cached():
+        token_verifier.decode(token)
+
+    async def verify():
+        await token_verifier.verify(token)
+
+    async def current_user(session=None):
+        await get_current_user(credentials, session)  # type: ignore[arg-type]
+
+    print(f"{'step':<36}{'p50':>13}{'p99':>13}")
+    await timing("jwt.decode", decode, args.repeat)
+    await timing("token LRU", decode_cached, args.repeat)
+    await timing("token LRU + revocation check", verify, args.repeat)
+    if args.email is None:
+        await principal_cache.set(
+            Principal(
+                id=0,
+                email=email,
+                status=UserStatus.BUYER,
+                active=True,
+                shop=None,
+            )
+        )
+    else:
+        database.connect()
+    await timing("get_current_user, cached", current_user, args.repeat)
+    if args.email is not None:
+
+        async def current_user_miss():
+            await principal_cache.invalidate(email)
+            async with database.session_maker() as session:
+                await current_user(session)
+
+        await timing(
+            "get_current_user, principal miss", current_user_miss, args.repeat
+        )
+        await database.disconnect()
+    await principal_cache.invalidate(email)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5000)
+    parser.add_argument("--email")
+    asyncio.run(main(parser.parse_args()))
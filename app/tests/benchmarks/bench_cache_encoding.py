@@ -0,0 +1,169 @@
+"""
+Бенчмарк кодирования ответов в кэше.
+
+Собирает ответы, похожие на ответы каталога (страницы товаров с
+магазином, категориями и параметрами, список категорий), и для каждого
+кодека сравнивает размер тела и время сжатия и распаковки. С --redis
+ответы сохраняются в кэш из настроек (REDIS_HOST, БД кэша) и
+измеряются MEMORY USAGE ключа и задержка чтения, ключи удаляются после
+замера.
+
+    cd app
+    python -m tests.benchmarks.bench_cache_encoding
+    python -m tests.benchmarks.bench_cache_encoding --redis --reads 2000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from faker import Faker
+
+from core.cache_codecs import (
+    CacheEncoder,
+    Codec,
+    ZlibCodec,
+    ZstdCodec,
+    zstandard,
+)
+from core.redis_cache import RESPONSE_PREFIX, RedisBackend
+from tests.benchmarks import catalog
+
+
+faker = Faker("ru_RU")
+
+CATEGORIES = [
+    {"id": number, "title": title}
+    for number, title in enumerate(catalog.CATEGORIES, start=1)
+]
+PARAMETRS = {
+    1: ["черный", "белый", "серебристый", "синий"],
+    2: ["64 ГБ", "128 ГБ", "256 ГБ", "512 ГБ"],
+    3: ["6,1", "6,7", "13,3", "15,6", "55"],
+    4: ["Китай", "Вьетнам", "Корея"],
+}
+
+
+def product(product_id: int, shops: list[dict]) -> dict:
+    return {
+        "name": f"{faker.word().capitalize()} {faker.bothify('??-###')}",
+        "price": round(random.uniform(500, 150000), 2),
+        "remainder": random.randint(1, 500),
+        "id": product_id,
+        "available": random.randint(0, 500),
+        "categories": random.sample(CATEGORIES, random.randint(1, 3)),
+        "shop": random.choice(shops),
+        "parametrs": [
+            {
+                "parametr_id": parametr_id,
+                "value": random.choice(values),
+                "id": product_id * 10 + parametr_id,
+            }
+            for parametr_id, values in PARAMETRS.items()
+        ],
+    }
+
+
+def payloads() -> dict[str, bytes]:
+    """Тела ответов так же, как их сериализует FastAPI"""
+    shops = [
+        {"title": faker.company(), "url": faker.url(), "id": number}
+        for number in range(1, 11)
+    ]
+    page = [product(number, shops) for number in range(1, 101)]
+    result = {
+        "categories": CATEGORIES,
+        "product page 20": {"items": page[:20], "next_cursor": "eyJ2IjoxfQ"},
+        "product page 100": {"items": page, "next_cursor": "eyJ2IjoxfQ"},
+        "product card": page[0],
+    }
+    return {
+        name: json.dumps(
+            data, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        for name, data in result.items()
+    }
+
+
+def codecs() -> list[tuple[str, Codec]]:
+    result: list[tuple[str, Codec]] = [("identity", Codec())]
+    result += [(f"zlib-{level}", ZlibCodec(level)) for level in (1, 6, 9)]
+    if zstandard is not None:
+        result += [(f"zstd-{level}", ZstdCodec(level)) for level in (3, 9)]
+    return result
+
+
+def timing(func, repeat: int) -> float:
+    """Медиана времени вызова в микросекундах"""
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - began) * 1_000_000)
+    return statistics.median(timings)
+
+
+def measure_codecs(repeat: int) -> None:
+    print(
+        f"{'payload':<18}{'codec':<10}{'bytes':>9}{'ratio':>8}"
+        f"{'encode us':>12}{'decode us':>12}"
+    )
+    for name, body in payloads().items():
+        for codec_name, codec in codecs():
+            encoded = codec.encode(body)
+            encode = timing(lambda c=codec, b=body: c.encode(b), repeat)
+            decode = timing(lambda c=codec, e=encoded: c.decode(e), repeat)
+            print(
+                f"{name:<18}{codec_name:<10}{len(encoded):>9}"
+                f"{len(body) / len(encoded):>8.1f}"
+                f"{encode:>12.1f}{decode:>12.1f}"
+            )
+
+
+async def measure_redis(reads: int) -> None:
+    backend = RedisBackend()
+    print(
+        f"{'payload':<18}{'codec':<10}{'memory':>9}"
+        f"{'read p50 ms':>13}{'read p99 ms':>13}"
+    )
+    try:
+        for name, body in payloads().items():
+            for codec_name, codec in codecs():
+                backend.encoder = CacheEncoder(codec, min_size=0)
+                key = f"bench:{codec_name}:{name.replace(' ', '-')}"
+                await backend.create(
+                    key, body, "application/json", ["bench"], 0.01
+                )
+                memory = await backend.cache.memory_usage(
+                    RESPONSE_PREFIX + key
+                )
+                timings = []
+                for _ in range(reads):
+                    began = time.perf_counter()
+                    entry = await backend.retrieve(key)
+                    backend.content(entry)  # type: ignore[arg-type]
+                    timings.append((time.perf_counter() - began) * 1000)
+                quantiles = statistics.quantiles(timings, n=100)
+                print(
+                    f"{name:<18}{codec_name:<10}{memory:>9}"
+                    f"{quantiles[49]:>13.3f}{quantiles[98]:>13.3f}"
+                )
+    finally:
+        await backend.invalidate(["bench"])
+        await backend.cache.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--redis", action="store_true")
+    parser.add_argument("--reads", type=int, default=1000)
+    args = parser.parse_args()
+    random.seed(0)
+    Faker.seed(0)
+    measure_codecs(args.repeat)
+    if args.redis:
+        asyncio.run(measure_redis(args.reads))
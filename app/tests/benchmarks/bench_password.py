@@ -0,0 +1,88 @@
+"""
+Бенчмарк проверки паролей на одном воркере.
+
+Запускает --logins проверок пароля по --concurrency одновременно в
+одном цикле событий: как раньше, bcrypt прямо в обработчике, и через
+пул core.security.PasswordHasher. Для каждого варианта - пропускная
+способность (входов в секунду) и задержка цикла событий: насколько
+опаздывает задача, которая просыпается каждые 10 мс, - столько же
+ждали бы все остальные запросы воркера.
+
+    cd app
+    python -m tests.benchmarks.bench_password
+    python -m tests.benchmarks.bench_password --rounds 10 --workers 8
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+from fastapi import HTTPException
+
+from core.security import PasswordHasher, check_password
+
+
+TICK = 0.01
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        began = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - began - TICK) * 1000)
+
+
+async def inline(password: str, hashed: str) -> bool:
+    return check_password(password, hashed)
+
+
+async def measure(name: str, verify, args: argparse.Namespace) -> None:
+    password = "string123"
+    hashed = bcrypt.hashpw(
+        password.encode(), bcrypt.gensalt(args.rounds)
+    ).decode()
+    logins, concurrency = args.logins, args.concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    rejected = 0
+
+    async def login() -> None:
+        nonlocal rejected
+        async with semaphore:
+            try:
+                assert await verify(password, hashed)
+            except HTTPException:
+                rejected += 1
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(heartbeat(lags, stop))
+    began = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - began
+    stop.set()
+    await ticker
+    print(
+        f"{name:<8}{(logins - rejected) / elapsed:>10.1f} logins/s"
+        f"{rejected:>8} rejected"
+        f"{statistics.median(lags or [0]):>10.1f} ms lag p50"
+        f"{max(lags or [0]):>10.1f} ms lag max"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    await measure("inline", inline, args)
+    hasher = PasswordHasher(args.workers, args.max_pending)
+    await measure("pool", hasher.verify, args)
+    hasher.executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
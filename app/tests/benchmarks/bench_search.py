@@ -0,0 +1,195 @@
+"""
+Бенчмарк поиска товаров на большом каталоге.
+
+Заполняет БД из настроек (DB_HOST и т.д.) каталогом из --rows товаров
+и измеряет задержку ProductCrud.search для точных запросов и запросов
+с опечатками. Цель - p99 < 50 мс на 1 000 000 товаров. Каталог
+заполняется в чистую БД один раз, повторные замеры - с --skip-seed.
+
+    cd app
+    python -m tests.benchmarks.bench_search --rows 1000000
+    python -m tests.benchmarks.bench_search --skip-seed --queries 2000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import sqlalchemy as sa
+
+from core.database import database
+from core.settings import config
+from crud.products import ProductCrud
+from tests.benchmarks.catalog import CATEGORIES
+
+
+BRANDS = [
+    "Apple",
+    "Samsung",
+    "Xiaomi",
+    "Huawei",
+    "Sony",
+    "Lenovo",
+    "Asus",
+    "Philips",
+    "Bosch",
+    "Honor",
+    "Realme",
+    "Dyson",
+]
+COLORS = ["черный", "белый", "серебристый", "золотистый", "красный", "синий"]
+QUERIES = [
+    "смартфон samsung",
+    "ноутбук lenovo",
+    "телевизор sony",
+    "наушники apple",
+    "пылесос dyson",
+    "монитор asus черный",
+    "колонка xiaomi",
+    "холодильник bosch белый",
+    # опечатки
+    "смартфн самсунг",
+    "samsnug",
+    "xiaomy",
+    "нотубук",
+    "телевизр",
+    "пылесос дайсон",
+]
+BATCH = 100_000
+
+
+def seed(rows: int) -> None:
+    engine = sa.create_engine(config.dsn)  # type: ignore[call-overload]
+    names = ", ".join(f"'{category[:-1]}'" for category in CATEGORIES)
+    brands = ", ".join(f"'{brand}'" for brand in BRANDS)
+    colors = ", ".join(f"'{color}'" for color in COLORS)
+    with engine.begin() as conn:
+        user_id = conn.scalar(
+            sa.text(
+                "INSERT INTO users (email, password, name, status, active) "
+                "VALUES ('bench@example.com', '', 'bench', 'SHOP', true) "
+                "ON CONFLICT (email) DO UPDATE SET name = 'bench' "
+                "RETURNING id"
+            )
+        )
+        shop_id = conn.scalar(
+            sa.text(
+                "INSERT INTO shop (title, user_id) VALUES ('bench', :user) "
+                "ON CONFLICT (user_id) DO UPDATE SET title = 'bench' "
+                "RETURNING id"
+            ),
+            {"user": user_id},
+        )
+        conn.execute(
+            sa.text(
+                "INSERT INTO category (title) SELECT unnest(:titles) "
+                "ON CONFLICT DO NOTHING"
+            ),
+            {"titles": CATEGORIES},
+        )
+        conn.execute(
+            sa.text(
+                "INSERT INTO parametr (name) VALUES ('Цвет') "
+                "ON CONFLICT DO NOTHING"
+            )
+        )
+    for start in range(0, rows, BATCH):
+        stop = min(start + BATCH, rows)
+        began = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(
+                sa.text(
+                    "INSERT INTO product "
+                    "(name, price, remainder, shop_id, external_id) "
+                    f"SELECT (ARRAY[{names}])[1 + i % 10] || ' ' "
+                    f"|| (ARRAY[{brands}])[1 + (i / 10) % 12] || ' ' "
+                    "|| upper(substr(md5(i::text), 1, 4)) || ' ' "
+                    "|| (i % 1000)::text, "
+                    "100 + i % 100000, 1 + i % 50, :shop, "
+                    "'bench-' || i FROM generate_series(:start, :stop) i"
+                ),
+                {"shop": shop_id, "start": start + 1, "stop": stop},
+            )
+            conn.execute(
+                sa.text(
+                    "INSERT INTO category_product (category_id, product_id) "
+                    "SELECT category.id, product.id FROM product "
+                    "JOIN category ON category.title = (:titles)"
+                    "[1 + substr(product.external_id, 7)::int % 10] "
+                    "WHERE product.shop_id = :shop "
+                    "AND product.external_id = ANY(ARRAY(SELECT 'bench-' || i "
+                    "FROM generate_series(:start, :stop) i))"
+                ),
+                {
+                    "titles": CATEGORIES,
+                    "shop": shop_id,
+                    "start": start + 1,
+                    "stop": stop,
+                },
+            )
+            conn.execute(
+                sa.text(
+                    "INSERT INTO parametrproduct "
+                    "(product_id, parametr_id, value) "
+                    "SELECT product.id, parametr.id, "
+                    f"(ARRAY[{colors}])[1 + product.id % 6] "
+                    "FROM product JOIN parametr ON parametr.name = 'Цвет' "
+                    "WHERE product.shop_id = :shop "
+                    "AND product.external_id = ANY(ARRAY(SELECT 'bench-' || i "
+                    "FROM generate_series(:start, :stop) i))"
+                ),
+                {"shop": shop_id, "start": start + 1, "stop": stop},
+            )
+        print(
+            f"seeded {stop}/{rows} products "
+            f"({(stop - start) / (time.perf_counter() - began):.0f} rows/s)"
+        )
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+            sa.text("VACUUM ANALYZE product")
+        )
+    engine.dispose()
+
+
+def percentile(values: list[float], share: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[
+        int(share * 100) - 1
+    ]
+
+
+async def measure(queries: int, limit: int) -> None:
+    database.connect()
+    timings: list[float] = []
+    try:
+        async with database.session_maker() as session:
+            crud = ProductCrud(session)
+            for query in QUERIES:  # прогрев
+                await crud.search(query, limit)
+            for _ in range(queries):
+                query = random.choice(QUERIES)
+                began = time.perf_counter()
+                await crud.search(query, limit)
+                timings.append((time.perf_counter() - began) * 1000)
+    finally:
+        await database.disconnect()
+    print(
+        f"{queries} queries, limit {limit}: "
+        f"p50 {percentile(timings, 0.5):.1f} ms, "
+        f"p95 {percentile(timings, 0.95):.1f} ms, "
+        f"p99 {percentile(timings, 0.99):.1f} ms, "
+        f"max {max(timings):.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+    if not args.skip_seed:
+        seed(args.rows)
+    asyncio.run(measure(args.queries, args.limit))
@@ -0,0 +1,14 @@
+"""Общие данные каталога для бенчмарков"""
+
+CATEGORIES = [
+    "Смартфоны",
+    "Ноутбуки",
+    "Планшеты",
+    "Телевизоры",
+    "Наушники",
+    "Мониторы",
+    "Холодильники",
+    "Пылесосы",
+    "Фотоаппараты",
+    "Колонки",
+]
@@ -186,6 +186,7 @@ class ParametrProductFactory(MainFactory):
             {
                 "product_id": kwargs.get("product_id", 1),
                 "parametr_id": kwargs.get("parametr_id", 1),
+                "value": kwargs.get("value", faker.word()),
             }
             for _ in range(count)
         )